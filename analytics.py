@@ -1,11 +1,17 @@
-from habit import Habit
-from habitevent import HabitEvent
-from habit_tracker import HabitTracker
+from habitevent import HabitEvent, PERIOD_DAYS, period_index, day_period_index, streak_stats, day_streak_stats
+from habit_tracker import HabitTracker, FETCH_BATCH_SIZE
+from bitmap import bitmap_streak_stats
 from datetime import datetime
 
 # Define date format as a constant
 DATE_FORMAT = "%Y-%m-%d"
 
+# Define the default number of habits per page of query_habits
+DEFAULT_PAGE_SIZE = 100
+
+# Define the default number of periods covered by the rollup reports
+DEFAULT_WINDOW_PERIODS = 30
+
 class Analytics:
     """
     Analytics class to perform various operations on habits.
@@ -24,17 +30,31 @@ class Analytics:
             list: A list of Habit objects.
         """
         try:
-            self.habit_tracker.cursor.execute("SELECT * FROM habits")
-            habit_rows = self.habit_tracker.cursor.fetchall()
-            return [self._create_habit_from_row(row) for row in habit_rows]
+            return list(self.iter_habits())
         except Exception as e:
             # Handle exception (e.g., log the error, re-raise, etc.)
             print(f"Error fetching habits: {e}")
             return []
 
+    def iter_habits(self, batch_size=FETCH_BATCH_SIZE, as_tuples=False):
+        """
+        Iterate over all habits without loading them all into memory.
+
+        Rows are read with fetchmany on a dedicated cursor, so other queries
+        may run while the generator is consumed.
+
+        Args:
+            batch_size (int): The number of rows fetched per round trip.
+            as_tuples (bool): Yield lightweight HabitRow tuples instead of Habit objects.
+
+        Yields:
+            Habit: The habits ordered by ID, or HabitRow tuples with the same fields.
+        """
+        return self.habit_tracker.repository.iter_habits(batch_size, as_tuples)
+
     def get_habit_by_name(self, habit_name):
         """
-        Fetch a habit by its name from the database.
+        Fetch a habit by its name, reading through the tracker's habit cache.
 
         Args:
             habit_name (str): The name of the habit to retrieve.
@@ -43,9 +63,7 @@ class Analytics:
             Habit: The Habit object if found, otherwise None.
         """
         try:
-            self.habit_tracker.cursor.execute("SELECT * FROM habits WHERE name = ?", (habit_name,))
-            habit_row = self.habit_tracker.cursor.fetchone()
-            return self._create_habit_from_row(habit_row) if habit_row else None
+            return self.habit_tracker.get_habit(habit_name)
         except Exception as e:
             # Handle exception (e.g., log the error, re-raise, etc.)
             print(f"Error fetching habit by name: {e}")
@@ -61,64 +79,280 @@ class Analytics:
         Returns:
             list: A list of Habit objects with the specified periodicity.
         """
-        habits = self.get_all_habits()
-        return [habit for habit in habits if habit.periodicity == periodicity]
+        try:
+            return [habit for page in self.iter_habit_pages(periodicity=periodicity) for habit in page]
+        except Exception as e:
+            # Handle exception (e.g., log the error, re-raise, etc.)
+            print(f"Error fetching habits by periodicity: {e}")
+            return []
+
+    def query_habits(self, periodicity=None, created_by=None, demo=None, active=None, name_prefix=None,
+                     after_id=None, limit=DEFAULT_PAGE_SIZE, as_tuples=False):
+        """
+        Fetch one page of habits matching the given filters, filtered in SQL.
+
+        Pages are ordered by habit ID and use keyset pagination: pass the ID
+        of the last habit of a page as after_id to get the next page.
+
+        Args:
+            periodicity (str): Only habits with this periodicity.
+            created_by (str): Only habits created by this user.
+            demo (bool): Only demo habits (True) or only user habits (False).
+            active (bool): Only habits without a past completion date (True) or only completed ones (False).
+            name_prefix (str): Only habits whose name starts with this prefix.
+            after_id (int): Only habits with a greater ID.
+            limit (int): The maximum number of habits returned.
+            as_tuples (bool): Return lightweight HabitRow tuples instead of Habit objects.
+
+        Returns:
+            list: A list of Habit objects, or HabitRow tuples with the same fields.
+        """
+        return self.habit_tracker.repository.query_habits(
+            periodicity=periodicity, created_by=created_by, demo=demo, active=active,
+            as_of_day=datetime.now().toordinal() if active is not None else None, name_prefix=name_prefix,
+            after_id=after_id, limit=limit, as_tuples=as_tuples)
+
+    def iter_habit_pages(self, page_size=DEFAULT_PAGE_SIZE, **filters):
+        """
+        Iterate over pages of habits matching the given filters.
+
+        Args:
+            page_size (int): The maximum number of habits per page.
+            filters: The filters of query_habits.
+
+        Yields:
+            list: A non-empty list of Habit objects per page.
+        """
+        after_id = None
+        while True:
+            page = self.query_habits(after_id=after_id, limit=page_size, **filters)
+            if not page:
+                return
+            yield page
+            if len(page) < page_size:
+                return
+            after_id = page[-1].id
 
     def get_longest_streak_all(self):
         """
         Get the habit with the longest streak and the length of the streak.
 
+        The answer is read from the maintained longest_streak column of the
+        habits table; see HabitTracker.rebuild_streaks.
+
         Returns:
             tuple: A tuple containing the Habit object with the longest streak and the length of the streak.
         """
-        habits = self.get_all_habits()
-        if not habits:
+        try:
+            habit = self.habit_tracker.repository.get_longest_streak_habit()
+        except Exception as e:
+            # Handle exception (e.g., log the error, re-raise, etc.)
+            print(f"Error fetching longest streak: {e}")
+            return None, 0
+        if habit is None:
             return None, 0
+        return habit, habit.longest_streak
 
-        longest_streak_habit = None
-        longest_streak = 0
-        for habit in habits:
-            habit_events = self.habit_tracker.get_habit_events(habit.id)
-            if habit_events:
-                streak = self.get_longest_streak_habit(habit, habit_events)
-                if streak > longest_streak:
-                    longest_streak_habit = habit
-                    longest_streak = streak
+    def get_longest_streaks(self):
+        """
+        Get the longest streak of every habit from the event history in a fixed number of queries.
 
-        return longest_streak_habit, longest_streak
+        Habits and their events are read in one ordered pass (habit id, then
+        event date), plus one query for the archive, so the number of round
+        trips does not depend on the number of habits. Streaks are computed
+        on the columnar EventStore buffers without creating per-event objects.
 
-    def get_longest_streak_habit(self, habit, habit_events=None):
+        Returns:
+            list: A list of (Habit, int) tuples ordered by habit id.
+        """
+        try:
+            habits, event_store = self.habit_tracker.load_event_store()
+            return [(habit, day_streak_stats(habit, event_store.days_for(habit.id))[0]) for habit in habits]
+        except Exception as e:
+            # Handle exception (e.g., log the error, re-raise, etc.)
+            print(f"Error fetching habit events: {e}")
+            return []
+
+    def get_longest_streak_habit(self, habit, habit_events=None, since=None, until=None):
         """
         Get the longest streak for a given habit.
 
+        Without habit_events and date bounds the answer is read from the
+        habit's maintained longest_streak column in O(1). With bounds only
+        the events between them are read, with a range scan on the
+        (habitId, day) index.
+
         Args:
             habit (Habit): The Habit object to calculate the streak for.
             habit_events (list): A list of HabitEvent objects for the habit.
+            since (datetime): Only count events on or after this date.
+            until (datetime): Only count events on or before this date.
 
         Returns:
             int: The length of the longest streak.
         """
         if habit_events is None:
-            habit_events = self.habit_tracker.get_habit_events(habit.id)
+            if since is None and until is None:
+                return habit.longest_streak
+            return self._longest_streak(habit, self.habit_tracker.iter_habit_events(habit.id, since=since, until=until,
+                                                                                    as_tuples=True))
+
+        first_day = since.toordinal() if since is not None else None
+        last_day = until.toordinal() if until is not None else None
+        habit_events = [event for event in habit_events
+                        if (first_day is None or event.eventDay >= first_day)
+                        and (last_day is None or event.eventDay <= last_day)]
+        return self._longest_streak(habit, sorted(habit_events, key=lambda event: event.eventDay))
+
+    def get_current_streak(self, habit, as_of=None):
+        """
+        Get the current streak for a given habit.
 
-        if not habit_events:
+        Without as_of the streak is read from the maintained streak columns.
+        With as_of the events up to that date, archived ones included, are
+        walked backwards on the (habitId, day) index, stopping at the first
+        missed period.
+
+        The streak counts as current while the last completed period is the
+        current or the previous one.
+
+        Args:
+            habit (Habit): The Habit object to get the streak for.
+            as_of (datetime): The date to get the streak at; now by default.
+
+        Returns:
+            int: The length of the current streak.
+        """
+        if as_of is not None:
+            return self._current_streak_as_of(habit, as_of)
+        if habit.last_period is None:
             return 0
+        if habit.last_period < period_index(habit, datetime.now()) - 1:
+            return 0
+        return habit.streak
 
-        sorted_events = sorted(habit_events, key=lambda event: event.eventDate)
-        current_streak = 1
-        max_streak = 1
+    def _current_streak_as_of(self, habit, as_of):
+        """
+        Count the consecutive completed periods ending at, or just before, the period of as_of.
+        """
+        streak = 0
+        prev_period = period_index(habit, as_of) + 1
+        for day in self.habit_tracker.iter_days_backwards(habit.id, as_of.toordinal()):
+            curr_period = day_period_index(habit, day)
+            if curr_period == prev_period:
+                continue
+            if curr_period != prev_period - 1 and (streak or curr_period != prev_period - 2):
+                break
+            streak += 1
+            prev_period = curr_period
+        return streak
 
-        for i in range(1, len(sorted_events)):
-            prev_event, curr_event = sorted_events[i - 1], sorted_events[i]
+    def get_history_summary(self, habit, as_of=None):
+        """
+        Summarize a habit's whole history, archived years included, with bit operations.
 
-            if curr_event.is_in_period(habit, curr_event.eventDate):
-                current_streak += 1
-            else:
-                current_streak = 1
+        The completed periods are loaded as one bitmap (see
+        HabitTracker.load_period_bitmap); counts use popcount and streaks
+        the longest and trailing runs of set bits.
 
-            max_streak = max(max_streak, current_streak)
+        Args:
+            habit (Habit): The Habit object to report on.
+            as_of (datetime): The date the current streak and the rate are computed for; now by default.
+
+        Returns:
+            dict: completed_periods, longest_streak, current_streak and completion_rate since creation.
+        """
+        bits, base_period = self.habit_tracker.load_period_bitmap(habit)
+        longest_streak, streak, last_period = bitmap_streak_stats(bits, base_period)
+        current_period = period_index(habit, as_of or datetime.now())
+        if last_period is None or last_period < current_period - 1:
+            streak = 0
+        since_creation = bits >> -base_period if base_period < 0 else bits << base_period
+        completed_periods = (since_creation & ((1 << current_period + 1) - 1)).bit_count() if current_period >= 0 else 0
+        return {
+            "completed_periods": completed_periods,
+            "longest_streak": longest_streak,
+            "current_streak": streak,
+            "completion_rate": completed_periods / (current_period + 1) if current_period >= 0 else 0.0,
+        }
+
+    def get_period_completions(self, habit, periods=DEFAULT_WINDOW_PERIODS, as_of=None):
+        """
+        Get the number of completions in each of the habit's last periods.
+
+        The counts are read from the habit_period_rollups table with one
+        range scan over the window, independent of the length of the history.
+
+        Args:
+            habit (Habit): The Habit object to report on.
+            periods (int): The number of periods, ending with the period containing as_of.
+            as_of (datetime): The end of the window; now by default.
+
+        Returns:
+            list: (period start date, completions) tuples, oldest first; periods before the creation date are left out.
+        """
+        first_period, last_period, completions = self._rollup_window(habit, periods, as_of)
+        period_days = PERIOD_DAYS[habit.periodicity]
+        return [(datetime.fromordinal(habit.creation_day + period * period_days), completions.get(period, 0))
+                for period in range(first_period, last_period + 1)]
+
+    def get_completion_rate(self, habit, periods=DEFAULT_WINDOW_PERIODS, as_of=None):
+        """
+        Get the share of the habit's last periods with at least one completion.
+
+        Args:
+            habit (Habit): The Habit object to report on.
+            periods (int): The number of periods, ending with the period containing as_of.
+            as_of (datetime): The end of the window; now by default.
+
+        Returns:
+            float: The completion rate between 0 and 1; 0 if the habit did not exist yet.
+        """
+        first_period, last_period, completions = self._rollup_window(habit, periods, as_of)
+        if last_period < first_period:
+            return 0.0
+        return len(completions) / (last_period - first_period + 1)
+
+    def get_missed_periods(self, habit, periods=DEFAULT_WINDOW_PERIODS, as_of=None):
+        """
+        Get the start dates of the habit's last periods without any completion.
 
-        return max_streak
+        The period containing as_of is still open and never counts as missed.
+
+        Args:
+            habit (Habit): The Habit object to report on.
+            periods (int): The number of periods, ending with the period containing as_of.
+            as_of (datetime): The end of the window; now by default.
+
+        Returns:
+            list: The start date of each missed period, oldest first.
+        """
+        return [period_start for period_start, count in self.get_period_completions(habit, periods, as_of)[:-1]
+                if count == 0]
+
+    def _rollup_window(self, habit, periods, as_of):
+        """
+        Read the rollups of the last periods of a habit.
+
+        Returns:
+            tuple: The first and last period of the window and the completions keyed by period.
+        """
+        last_period = period_index(habit, as_of or datetime.now())
+        first_period = max(0, last_period - periods + 1)
+        return first_period, last_period, self.habit_tracker.repository.get_rollups(habit.id, first_period, last_period)
+
+    def _longest_streak(self, habit, sorted_events):
+        """
+        Calculate the longest streak from events sorted by date.
+
+        Args:
+            habit (Habit): The Habit object the events belong to.
+            sorted_events (list): HabitEvent objects or EventRow tuples sorted by event date.
+
+        Returns:
+            int: The length of the longest streak.
+        """
+        return streak_stats(habit, sorted_events)[0]
 
     def get_demo_tracking(self):
         """
@@ -128,11 +362,8 @@ class Analytics:
             list: A list of tuples containing Habit objects and their corresponding HabitEvent objects.
         """
         try:
-            self.habit_tracker.cursor.execute("SELECT * FROM habits WHERE demoData = 1")
-            demo_habit_rows = self.habit_tracker.cursor.fetchall()
             demo_habits_with_events = []
-            for row in demo_habit_rows:
-                habit = self._create_habit_from_row(row)
+            for habit in self.habit_tracker.repository.get_demo_habits():
                 habit_events = self.habit_tracker.get_habit_events(habit.id)
                 demo_habits_with_events.append((habit, habit_events))
             return demo_habits_with_events
@@ -140,25 +371,3 @@ class Analytics:
             # Handle exception (e.g., log the error, re-raise, etc.)
             print(f"Error fetching demo habits: {e}")
             return []
-
-    def _create_habit_from_row(self, row):
-        """
-        Create a Habit object from a database row.
-
-        Args:
-            row (tuple): A tuple containing the habit data from the database.
-
-        Returns:
-            Habit: The created Habit object.
-        """
-        return Habit(
-            id=row[0],
-            name=row[1],
-            task=row[2],
-            periodicity=row[3],
-            creation_date=datetime.strptime(row[4], DATE_FORMAT),
-            completion_date=datetime.strptime(row[5], DATE_FORMAT) if row[5] else None,
-            streak=row[6],
-            created_by=row[7],
-            demoData=row[8]
-        )
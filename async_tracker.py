@@ -0,0 +1,191 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from analytics import Analytics, DEFAULT_WINDOW_PERIODS
+from connection import ConnectionPool, DB_NAME, DEFAULT_POOL_SIZE
+from habit_tracker import HabitTracker
+
+
+class AsyncHabitTracker:
+    """
+    AsyncHabitTracker class to use HabitTracker from asyncio code without blocking the event loop.
+
+    Database work runs on a dedicated thread pool executor whose threads use
+    their own pooled connections, so many requests may be awaited concurrently.
+    """
+    def __init__(self, db_name=DB_NAME, max_workers=DEFAULT_POOL_SIZE, **pool_options):
+        """
+        Initialize the executor and its connection pool.
+
+        Args:
+            db_name (str): The name of the database file.
+            max_workers (int): The number of executor threads and pooled connections.
+            pool_options: Further ConnectionPool options (busy_timeout, synchronous, wal).
+        """
+        self.pool = ConnectionPool(db_name, size=max_workers, **pool_options)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="habit-db")
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Await func(habit_tracker, *args, **kwargs) on an executor thread.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(self.pool.run, func, *args, **kwargs))
+
+    async def add_habit(self, habit):
+        """
+        Add a new habit to the database.
+        """
+        return await self.run(HabitTracker.add_habit, habit)
+
+    async def add_habit_event(self, habit_event):
+        """
+        Add a new habit event to the database.
+        """
+        return await self.run(HabitTracker.add_habit_event, habit_event)
+
+    async def add_habit_events(self, habit_events):
+        """
+        Add many habit events to the database.
+        """
+        return await self.run(HabitTracker.add_habit_events, list(habit_events))
+
+    async def save_habit(self, habit):
+        """
+        Add a new habit or update an existing one.
+        """
+        return await self.run(HabitTracker.save_habit, habit)
+
+    async def update_habit(self, habit):
+        """
+        Update an existing habit in the database.
+        """
+        return await self.run(HabitTracker.update_habit, habit)
+
+    async def remove_habit(self, habit_name):
+        """
+        Remove a habit and its associated events from the database.
+        """
+        return await self.run(HabitTracker.remove_habit, habit_name)
+
+    async def mark_habit_completed(self, habit_name):
+        """
+        Mark a habit as completed and add a habit event.
+        """
+        return await self.run(HabitTracker.mark_habit_completed, habit_name)
+
+    async def get_habit_events(self, habit_id, since=None, until=None):
+        """
+        Fetch the habit events for a given habit ID, optionally between two dates.
+        """
+        return await self.run(HabitTracker.get_habit_events, habit_id, since, until)
+
+    async def rebuild_streaks(self):
+        """
+        Recompute the streak columns of all habits from their event history.
+        """
+        return await self.run(HabitTracker.rebuild_streaks)
+
+    async def is_schema_current(self):
+        """
+        Check if the database schema is at the latest migration version.
+        """
+        return await self.run(HabitTracker.is_schema_current)
+
+    def close(self):
+        """
+        Wait for pending work, then stop the executor and close its connections.
+        """
+        self.executor.shutdown(wait=True)
+        self.pool.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+
+class AsyncAnalytics:
+    """
+    AsyncAnalytics class to run Analytics reports from asyncio code on the executor of an AsyncHabitTracker.
+    """
+    def __init__(self, async_habit_tracker):
+        """
+        Initialize AsyncAnalytics with an AsyncHabitTracker instance.
+        """
+        self.async_habit_tracker = async_habit_tracker
+
+    async def _run(self, method_name, *args):
+        """
+        Await an Analytics method on an executor thread.
+        """
+        def call(habit_tracker):
+            return getattr(Analytics(habit_tracker), method_name)(*args)
+        return await self.async_habit_tracker.run(call)
+
+    async def get_all_habits(self):
+        """
+        Fetch all habits from the database.
+        """
+        return await self._run("get_all_habits")
+
+    async def get_habit_by_name(self, habit_name):
+        """
+        Fetch a habit by its name from the database.
+        """
+        return await self._run("get_habit_by_name", habit_name)
+
+    async def get_habits_by_periodicity(self, periodicity):
+        """
+        Fetch habits by their periodicity from the database.
+        """
+        return await self._run("get_habits_by_periodicity", periodicity)
+
+    async def get_longest_streak_all(self):
+        """
+        Get the habit with the longest streak and the length of the streak.
+        """
+        return await self._run("get_longest_streak_all")
+
+    async def get_longest_streaks(self):
+        """
+        Get the longest streak of every habit from the event history.
+        """
+        return await self._run("get_longest_streaks")
+
+    async def get_longest_streak_habit(self, habit, habit_events=None, since=None, until=None):
+        """
+        Get the longest streak for a given habit, optionally between two dates.
+        """
+        return await self._run("get_longest_streak_habit", habit, habit_events, since, until)
+
+    async def get_current_streak(self, habit, as_of=None):
+        """
+        Get the current streak for a given habit, optionally as of a past date.
+        """
+        return await self._run("get_current_streak", habit, as_of)
+
+    async def get_completion_rate(self, habit, periods=DEFAULT_WINDOW_PERIODS, as_of=None):
+        """
+        Get the share of the habit's last periods with at least one completion.
+        """
+        return await self._run("get_completion_rate", habit, periods, as_of)
+
+    async def get_missed_periods(self, habit, periods=DEFAULT_WINDOW_PERIODS, as_of=None):
+        """
+        Get the start dates of the habit's last periods without any completion.
+        """
+        return await self._run("get_missed_periods", habit, periods, as_of)
+
+    async def get_history_summary(self, habit, as_of=None):
+        """
+        Summarize a habit's whole history, archived years included.
+        """
+        return await self._run("get_history_summary", habit, as_of)
+
+    async def get_demo_tracking(self):
+        """
+        Fetch all demo habits and their events from the database.
+        """
+        return await self._run("get_demo_tracking")
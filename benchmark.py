@@ -0,0 +1,208 @@
+"""
+Benchmark suite for HabitTracker and Analytics.
+
+Builds synthetic databases of several sizes and times the main queries and
+writes; write benchmarks also report their throughput in events per second.
+Results are written as JSON lines, one per benchmark and size, so runs of
+different versions can be compared:
+
+    python benchmark.py --size small --size medium --label my-change > results.jsonl
+"""
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from itertools import count
+import click
+from analytics import Analytics
+from habit import Habit
+from habit_tracker import HabitTracker
+from parallel_analytics import ParallelAnalytics, DEFAULT_WORKERS
+from schema import SCHEMA_VERSION
+from write_behind import WriteBehindBuffer
+from setup_db import DEFAULT_DENSITY, Database, generate_habits, generate_habit_events
+
+# Dataset sizes: number of habits, number of users and years of history
+SIZES = {
+    "tiny": (20, 2, 1),
+    "small": (100, 5, 1),
+    "medium": (1000, 20, 2),
+    "large": (5000, 50, 3),
+}
+
+DEFAULT_REPEAT = 5
+
+
+def build_database(db_name, habits, users, years, density=DEFAULT_DENSITY, seed=0):
+    """
+    Create a database filled with synthetic habits and events.
+
+    Returns:
+        tuple: The Database, the number of events and the seconds spent on the bulk event insert.
+    """
+    db = Database(db_name=db_name)
+    days = 365 * years
+    generated_habits = generate_habits(habits, users, creation_date=datetime.now() - timedelta(days=days), seed=seed)
+    db.load_fixtures(generated_habits)
+    habit_tracker = HabitTracker(db.conn, db.conn.cursor())
+    start = time.perf_counter()
+    events = habit_tracker.add_habit_events(generate_habit_events(generated_habits, days, density, seed))
+    insert_seconds = time.perf_counter() - start
+    habit_tracker.rebuild_streaks()
+    return db, events, insert_seconds
+
+
+# Numbers the batches of fresh habits added by the write benchmarks, keeping their names unique
+_fresh_batches = count(1)
+
+
+def time_call(func, repeat=DEFAULT_REPEAT, setup=None):
+    """
+    Call a function repeat times and measure each call.
+
+    Args:
+        func (callable): The function to time.
+        repeat (int): The number of calls.
+        setup (callable): Called untimed before each call; its result is passed to func.
+
+    Returns:
+        list: The wall time of each call in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        args = (setup(),) if setup is not None else ()
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def add_fresh_habits(habit_tracker, number):
+    """
+    Add habits without any completion for one call of a write benchmark.
+
+    Completing a habit twice on the same day writes nothing the second
+    time, so every repetition completes habits of its own.
+
+    Returns:
+        list: The names of the new habits.
+    """
+    batch = next(_fresh_batches)
+    habits = [Habit(id=None, name=f"Fresh {batch}-{i}", task="Benchmark", periodicity="daily") for i in range(number)]
+    with habit_tracker.conn:
+        habit_tracker.repository.insert_habits(habits)
+    return [habit.name for habit in habits]
+
+
+def complete_directly(habit_tracker, habit_names):
+    """
+    Mark each habit as completed with one transaction per completion.
+    """
+    for habit_name in habit_names:
+        habit_tracker.mark_habit_completed(habit_name)
+
+
+def complete_write_behind(habit_tracker, habit_names):
+    """
+    Mark each habit as completed through a write-behind buffer with default thresholds.
+    """
+    with WriteBehindBuffer(habit_tracker) as buffer:
+        for habit_name in habit_names:
+            buffer.mark_habit_completed(habit_name)
+
+
+def run_benchmarks(sizes, density=DEFAULT_DENSITY, repeat=DEFAULT_REPEAT, label="", directory=None,
+                   workers=DEFAULT_WORKERS):
+    """
+    Run all benchmarks for the given dataset sizes.
+
+    Args:
+        sizes (list): Names of entries in SIZES.
+        density (float): The completion density of the synthetic history.
+        repeat (int): The number of timed calls per benchmark.
+        label (str): A free-form label stored with each result, e.g. a version.
+        directory (str): Where to create the database files; a temporary directory by default.
+        workers (int): The number of worker processes of the parallel benchmarks.
+
+    Returns:
+        list: One result dictionary per benchmark and size.
+    """
+    results = []
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        for size in sizes:
+            habits, users, years = SIZES[size]
+            db, events, insert_seconds = build_database(os.path.join(tmp, f"{size}.db"), habits, users, years, density)
+            habit_tracker = HabitTracker(db.conn, db.conn.cursor())
+            analytics = Analytics(habit_tracker)
+            parallel_analytics = ParallelAnalytics(habit_tracker, workers=workers, serial_threshold=0)
+            habit = analytics.get_habit_by_name("Habit 1")
+            habit_events = habit_tracker.get_habit_events(habit.id)
+
+            benchmarks = {
+                "get_all_habits": analytics.get_all_habits,
+                "get_habits_by_periodicity": lambda: analytics.get_habits_by_periodicity("daily"),
+                "get_longest_streak_all": analytics.get_longest_streak_all,
+                "get_longest_streaks": analytics.get_longest_streaks,
+                "get_longest_streaks_parallel": parallel_analytics.get_longest_streaks,
+                "get_longest_streak_habit": lambda: analytics.get_longest_streak_habit(habit, habit_events),
+                "mark_habit_completed": lambda habit_names: habit_tracker.mark_habit_completed(habit_names[0]),
+            }
+            completions = {
+                "completions_direct": lambda habit_names: complete_directly(habit_tracker, habit_names),
+                "completions_write_behind": lambda habit_names: complete_write_behind(habit_tracker, habit_names),
+            }
+            benchmarks.update(completions)
+            # Write benchmarks complete fresh habits, added before each call
+            setups = {name: lambda: add_fresh_habits(habit_tracker, habits) for name in completions}
+            setups["mark_habit_completed"] = lambda: add_fresh_habits(habit_tracker, 1)
+            timings = {name: time_call(func, repeat, setups.get(name)) for name, func in benchmarks.items()}
+            timings["add_habit_events"] = [insert_seconds]
+            event_counts = {name: habits for name in completions}
+            event_counts["add_habit_events"] = events
+
+            for name, values in timings.items():
+                results.append({
+                    "benchmark": name,
+                    "size": size,
+                    "habits": habits,
+                    "users": users,
+                    "years": years,
+                    "events": events,
+                    "repeat": len(values),
+                    "median_s": statistics.median(values),
+                    "min_s": min(values),
+                    "events_per_s": event_counts[name] / statistics.median(values) if name in event_counts else None,
+                    "label": label,
+                    "workers": workers,
+                    "schema_version": SCHEMA_VERSION,
+                    "python": platform.python_version(),
+                })
+            db.close_connection()
+    return results
+
+
+@click.command()
+@click.option("--size", "sizes", multiple=True, type=click.Choice(list(SIZES)), default=["small", "medium"],
+              show_default=True, help="Dataset sizes to benchmark.")
+@click.option("--density", default=DEFAULT_DENSITY, show_default=True, help="Completion density of the history.")
+@click.option("--repeat", default=DEFAULT_REPEAT, show_default=True, help="Timed calls per benchmark.")
+@click.option("--label", default="", help="Label stored with each result, e.g. a version.")
+@click.option("--workers", default=DEFAULT_WORKERS, show_default=True, help="Worker processes of the parallel benchmarks.")
+@click.option("--output", type=click.File("w"), default="-", help="JSON lines output file.")
+def main(sizes, density, repeat, label, workers, output):
+    """
+    Benchmark HabitTracker and Analytics on synthetic databases.
+    """
+    for result in run_benchmarks(sizes, density, repeat, label, workers=workers):
+        output.write(json.dumps(result) + "\n")
+        output.flush()
+        rate = f" {result['events_per_s']:12.0f} events/s" if result["events_per_s"] else ""
+        print(f"{result['size']:>6} {result['benchmark']:<28} {result['median_s'] * 1000:10.3f} ms{rate}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
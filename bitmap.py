@@ -0,0 +1,93 @@
+"""
+Bitmap helpers for archived habit history.
+
+An archived year of a habit is one integer whose bit i is set when the
+habit was completed on day first_day + i. Streak and count questions are
+answered with integer bit operations instead of per-event loops.
+"""
+
+
+def days_to_bitmap(days, first_day):
+    """
+    Build a bitmap with one bit set per day ordinal, counted from first_day.
+    """
+    bits = 0
+    for day in days:
+        bits |= 1 << (day - first_day)
+    return bits
+
+
+def bitmap_to_blob(bits):
+    """
+    Encode a bitmap as little-endian bytes for a BLOB column.
+    """
+    return bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+
+
+def blob_to_bitmap(blob):
+    """
+    Decode a bitmap stored with bitmap_to_blob.
+    """
+    return int.from_bytes(blob, "little")
+
+
+def bitmap_days(bits, first_day, reverse=False):
+    """
+    Expand a bitmap into the day ordinals of its set bits.
+
+    Args:
+        bits (int): The bitmap.
+        first_day (int): The day ordinal of bit 0.
+        reverse (bool): Yield the latest day first.
+
+    Yields:
+        int: The day ordinals in ascending order, or descending if reverse.
+    """
+    while bits:
+        if reverse:
+            bit = bits.bit_length() - 1
+        else:
+            bit = (bits & -bits).bit_length() - 1
+        yield first_day + bit
+        bits ^= 1 << bit
+
+
+def longest_run(bits):
+    """
+    Get the length of the longest run of consecutive set bits.
+
+    Each step bits &= bits << 1 shortens every run by one bit, so the
+    number of steps until no bit is left is the length of the longest run.
+    """
+    length = 0
+    while bits:
+        bits &= bits << 1
+        length += 1
+    return length
+
+
+def trailing_run(bits):
+    """
+    Get the length of the run of set bits ending at the highest set bit.
+    """
+    if not bits:
+        return 0
+    top = bits.bit_length()
+    gaps = ~bits & ((1 << top) - 1)
+    return top - gaps.bit_length()
+
+
+def bitmap_streak_stats(bits, base_period):
+    """
+    Calculate streak figures from a bitmap of completed periods, as day_streak_stats does for days.
+
+    Args:
+        bits (int): Bit i is set when period base_period + i has a completion.
+        base_period (int): The period of bit 0.
+
+    Returns:
+        tuple: (longest streak, streak ending in the last period, last period or None).
+    """
+    if not bits:
+        return 0, 0, None
+    return longest_run(bits), trailing_run(bits), base_period + bits.bit_length() - 1
@@ -0,0 +1,201 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from habit_tracker import HabitTracker
+from repository import STATEMENT_CACHE_SIZE
+
+# Define defaults for the connection pool
+DB_NAME = 'habits.db'
+DEFAULT_POOL_SIZE = 5
+DEFAULT_BUSY_TIMEOUT = 5000  # milliseconds
+DEFAULT_SYNCHRONOUS = "NORMAL"
+SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+# Environment variable enabling the profiler in the CLI
+PROFILE_ENV = "HABIT_TRACKER_PROFILE"
+
+# SQLite result codes reported when another connection holds a lock
+SQLITE_BUSY = 5
+SQLITE_LOCKED = 6
+
+
+def is_busy_error(error):
+    """
+    Check if an SQLite error was caused by another connection holding a lock.
+    """
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    if getattr(error, "sqlite_errorcode", None) in (SQLITE_BUSY, SQLITE_LOCKED):
+        return True
+    message = str(error)
+    return "database is locked" in message or "database is busy" in message
+
+
+def retry_on_busy(func, *args, attempts=5, delay=0.05, **kwargs):
+    """
+    Call a function and retry it with exponential backoff on SQLITE_BUSY.
+
+    Args:
+        func (callable): The function to call.
+        attempts (int): The maximum number of calls.
+        delay (float): The delay in seconds before the first retry.
+
+    Returns:
+        The return value of the function.
+    """
+    for attempt in range(attempts):
+        try:
+            return func(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if not is_busy_error(e) or attempt == attempts - 1:
+                raise
+            time.sleep(delay * 2 ** attempt)
+
+
+class ConnectionPool:
+    """
+    ConnectionPool class to share a bounded set of SQLite connections between threads.
+
+    A thread holds at most one connection at a time; nested requests from the
+    same thread reuse it. Connections use WAL so readers do not block the
+    writer, and wait up to busy_timeout milliseconds for locks.
+    """
+    def __init__(self, db_name=DB_NAME, size=DEFAULT_POOL_SIZE, busy_timeout=DEFAULT_BUSY_TIMEOUT,
+                 synchronous=DEFAULT_SYNCHRONOUS, wal=True, tracer=None):
+        """
+        Initialize the pool; connections are opened lazily.
+
+        Args:
+            db_name (str): The name of the database file.
+            size (int): The maximum number of open connections.
+            busy_timeout (int): Milliseconds to wait for a locked database.
+            synchronous (str): The PRAGMA synchronous level of each connection.
+            wal (bool): Whether to switch the database to write-ahead logging.
+            tracer (QueryTracer): Records the statements of all connections when given.
+        """
+        synchronous = synchronous.upper()
+        if synchronous not in SYNCHRONOUS_LEVELS:
+            raise ValueError(f"Invalid synchronous level: {synchronous}")
+        self.db_name = db_name
+        self.size = size
+        self.busy_timeout = busy_timeout
+        self.synchronous = synchronous
+        self.wal = wal
+        self.tracer = tracer
+        self._idle = queue.LifoQueue()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self):
+        """
+        Open and configure a new connection.
+        """
+        options = dict(timeout=self.busy_timeout / 1000, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        if self.tracer is not None:
+            from profiling import connect
+            conn = connect(self.db_name, self.tracer, **options)
+        else:
+            conn = sqlite3.connect(self.db_name, **options)
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        if self.wal:
+            conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        return conn
+
+    def open_connection(self):
+        """
+        Open a connection configured like the pooled ones but owned by the caller, who closes it.
+        """
+        return self._connect()
+
+    def acquire(self, timeout=None):
+        """
+        Take a connection for the current thread, opening one if the pool is not full.
+
+        Args:
+            timeout (float): Seconds to wait for a free connection, None to wait forever.
+
+        Returns:
+            sqlite3.Connection: The connection; hand it back with release.
+        """
+        local = self._local
+        if getattr(local, "conn", None) is not None:
+            local.depth += 1
+            return local.conn
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if len(self._connections) < self.size:
+                    conn = self._connect()
+                    self._connections.append(conn)
+            if conn is None:
+                try:
+                    conn = self._idle.get(timeout=timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError("Connection pool exhausted")
+        local.conn, local.depth = conn, 1
+        return conn
+
+    def release(self, conn):
+        """
+        Hand a connection taken with acquire back to the pool.
+        """
+        local = self._local
+        local.depth -= 1
+        if local.depth:
+            return
+        local.conn = None
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager yielding the current thread's connection.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def tracker(self, user=None, habit_cache=None):
+        """
+        Context manager yielding a HabitTracker bound to the current thread's connection.
+
+        Args:
+            user (str): Scope the tracker to this user's habits; None for all users.
+            habit_cache (HabitCache): A cache shared between trackers; a private one is created if omitted.
+        """
+        with self.connection() as conn:
+            yield HabitTracker(conn, conn.cursor(), habit_cache=habit_cache, user=user)
+
+    def run(self, func, *args, **kwargs):
+        """
+        Call func(habit_tracker, *args, **kwargs) on a pooled connection, retrying on SQLITE_BUSY.
+
+        Returns:
+            The return value of func.
+        """
+        def call():
+            with self.tracker() as habit_tracker:
+                return func(habit_tracker, *args, **kwargs)
+        return retry_on_busy(call)
+
+    def close(self):
+        """
+        Close all connections of the pool.
+        """
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._idle = queue.LifoQueue()
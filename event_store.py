@@ -0,0 +1,62 @@
+from array import array
+
+
+class EventStore:
+    """
+    EventStore class to hold habit events as compact columnar buffers.
+
+    Events are kept as day ordinals (datetime.toordinal) in one array, grouped
+    per habit: the days of habit_ids[i] are days[offsets[i]:offsets[i + 1]].
+    No per-event Python objects are created.
+    """
+    __slots__ = ("habit_ids", "offsets", "days", "_positions")
+
+    def __init__(self):
+        self.habit_ids = array('q')
+        self.offsets = array('q', [0])
+        self.days = array('i')
+        self._positions = {}
+
+    def add(self, habit_id, day=None):
+        """
+        Append an event, or only register the habit if day is None.
+
+        Events must be added ordered by habit, then by day.
+        """
+        if not self.habit_ids or self.habit_ids[-1] != habit_id:
+            self._positions[habit_id] = len(self.habit_ids)
+            self.habit_ids.append(habit_id)
+            self.offsets.append(self.offsets[-1])
+        if day is not None:
+            self.days.append(day)
+            self.offsets[-1] += 1
+
+    def days_for(self, habit_id):
+        """
+        Get the sorted day ordinals of a habit's events.
+
+        Args:
+            habit_id (int): The ID of the habit.
+
+        Returns:
+            memoryview: A read-only view on the habit's slice of the days buffer.
+        """
+        position = self._positions.get(habit_id)
+        if position is None:
+            return memoryview(array('i'))
+        return memoryview(self.days)[self.offsets[position]:self.offsets[position + 1]].toreadonly()
+
+    def event_count(self, habit_id):
+        """
+        Get the number of events of a habit.
+        """
+        position = self._positions.get(habit_id)
+        if position is None:
+            return 0
+        return self.offsets[position + 1] - self.offsets[position]
+
+    def __len__(self):
+        """
+        Get the total number of events in the store.
+        """
+        return len(self.days)
@@ -6,21 +6,75 @@ class Habit:
     """
     Habit class to represent a habit with various attributes and methods.
     """
+    __slots__ = ("id", "name", "task", "periodicity", "_creation_date", "_creation_day", "_completion_date",
+                 "_completion_day", "streak", "created_by", "demoData", "dbID", "longest_streak", "last_period")
 
-    def __init__(self, id, name, task, periodicity, creation_date=None, completion_date=None, streak=0, created_by=DEFAULT_USER, demoData=False, dbID=None):
+    def __init__(self, id, name, task, periodicity, creation_date=None, completion_date=None, streak=0, created_by=DEFAULT_USER, demoData=False, dbID=None, longest_streak=0, last_period=None,
+                 creation_day=None, completion_day=None):
         """
         Initialize a Habit instance
+
+        Dates may be given as datetime objects or as day ordinals
+        (creation_day, completion_day); the other form is derived lazily.
         """
         self.id = id
         self.name = name
         self.task = task
         self.periodicity = periodicity
-        self.creation_date = creation_date or datetime.now()
-        self.completion_date = completion_date
+        if creation_date is None and creation_day is None:
+            creation_date = datetime.now()
+        self._creation_date = creation_date
+        self._creation_day = creation_day if creation_day is not None else creation_date.toordinal()
+        self._completion_date = completion_date
+        self._completion_day = completion_day if completion_day is not None or completion_date is None else completion_date.toordinal()
         self.streak = streak
         self.created_by = created_by
         self.demoData = demoData
         self.dbID = dbID
+        self.longest_streak = longest_streak
+        self.last_period = last_period
+
+    @property
+    def creation_date(self):
+        """
+        The creation date as a datetime, converted from the day ordinal on first access.
+        """
+        if self._creation_date is None:
+            self._creation_date = datetime.fromordinal(self._creation_day)
+        return self._creation_date
+
+    @creation_date.setter
+    def creation_date(self, value):
+        self._creation_date = value
+        self._creation_day = value.toordinal()
+
+    @property
+    def creation_day(self):
+        """
+        The creation date as a day ordinal.
+        """
+        return self._creation_day
+
+    @property
+    def completion_date(self):
+        """
+        The completion date as a datetime or None, converted from the day ordinal on first access.
+        """
+        if self._completion_date is None and self._completion_day is not None:
+            self._completion_date = datetime.fromordinal(self._completion_day)
+        return self._completion_date
+
+    @completion_date.setter
+    def completion_date(self, value):
+        self._completion_date = value
+        self._completion_day = value.toordinal() if value is not None else None
+
+    @property
+    def completion_day(self):
+        """
+        The completion date as a day ordinal or None.
+        """
+        return self._completion_day
 
     def get_current_datetime(self):
         """
@@ -43,5 +97,6 @@ class Habit:
             f"Habit(id={self.id}, name={self.name}, task={self.task}, "
             f"periodicity={self.periodicity}, creation_date={self.creation_date}, "
             f"completion_date={self.completion_date}, streak={self.streak}, "
-            f"created_by={self.created_by}, demoData={self.demoData}, dbID={self.dbID})"
+            f"created_by={self.created_by}, demoData={self.demoData}, dbID={self.dbID}, "
+            f"longest_streak={self.longest_streak}, last_period={self.last_period})"
         )
@@ -0,0 +1,166 @@
+import threading
+from collections import OrderedDict
+
+# Define the default maximum number of cached habits
+DEFAULT_CACHE_SIZE = 1024
+
+
+class HabitCache:
+    """
+    HabitCache class to keep an identity map of Habit objects keyed by user and name and by ID.
+
+    Habits are cached under (created_by, name), so trackers of different
+    users can share a cache. A habit looked up by a tracker for all users
+    is also cached under (None, name) while no other user has the name.
+    The least recently used habit is evicted once max_size habits are cached.
+    Hit and miss counters show how many database round trips were saved.
+    """
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        """
+        Initialize an empty cache.
+
+        Args:
+            max_size (int): The maximum number of cached habits.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._by_name = OrderedDict()
+        self._by_id = {}
+        self._keys_by_name = {}
+        # Last PRAGMA data_version seen through each validated connection
+        self._data_versions = {}
+        self._lock = threading.Lock()
+
+    def get_by_name(self, habit_name, user=None):
+        """
+        Get a cached habit by its name.
+
+        Args:
+            habit_name (str): The name of the habit.
+            user (str): The user who created the habit; None for a name unique across all users.
+
+        Returns:
+            Habit: The cached Habit object, or None on a miss.
+        """
+        with self._lock:
+            habit = self._by_name.get((user, habit_name))
+            if habit is None:
+                self.misses += 1
+                return None
+            self._touch(habit)
+            self.hits += 1
+            return habit
+
+    def get_by_id(self, habit_id):
+        """
+        Get a cached habit by its database ID.
+
+        Returns:
+            Habit: The cached Habit object, or None on a miss.
+        """
+        with self._lock:
+            habit = self._by_id.get(habit_id)
+            if habit is None:
+                self.misses += 1
+                return None
+            self._touch(habit)
+            self.hits += 1
+            return habit
+
+    def put(self, habit, unique_name=False):
+        """
+        Cache a habit loaded from the database, evicting the least recently used one if full.
+
+        Args:
+            habit (Habit): The habit.
+            unique_name (bool): The habit was found by a name no habit of another user has.
+        """
+        keys = [(habit.created_by, habit.name)]
+        if unique_name:
+            keys.append((None, habit.name))
+        with self._lock:
+            for key in ((habit.created_by, habit.name), (None, habit.name)):
+                self._discard(key)
+            for key in keys:
+                self._by_name[key] = habit
+                self._keys_by_name.setdefault(habit.name, set()).add(key)
+            self._by_id[habit.id] = habit
+            while len(self._by_id) > self.max_size:
+                self._evict(self._by_name[next(iter(self._by_name))])
+
+    def invalidate(self, habit_name):
+        """
+        Drop the habits with a name from the cache, whichever user they belong to.
+        """
+        with self._lock:
+            self._remove(habit_name)
+
+    def clear(self):
+        """
+        Drop all habits from the cache.
+        """
+        with self._lock:
+            self._by_name.clear()
+            self._by_id.clear()
+            self._keys_by_name.clear()
+
+    def validate(self, conn):
+        """
+        Drop all habits if the database changed through another connection since conn last validated.
+
+        Uses PRAGMA data_version, which changes when other connections or
+        processes commit, but not on commits of conn itself. Validating
+        against the one connection all writes of the cache's users go
+        through therefore only drops the habits on outside writes. The first
+        validation through a connection cannot tell and drops the habits.
+
+        Args:
+            conn (sqlite3.Connection): The connection the cache's users write with.
+        """
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        with self._lock:
+            if self._data_versions.get(conn) != data_version:
+                self._data_versions[conn] = data_version
+                self._by_name.clear()
+                self._by_id.clear()
+                self._keys_by_name.clear()
+
+    def stats(self):
+        """
+        Get the cache counters.
+
+        Returns:
+            dict: The number of hits, misses and cached habits.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._by_id)}
+
+    def _keys(self, habit):
+        return [key for key in ((habit.created_by, habit.name), (None, habit.name)) if self._by_name.get(key) is habit]
+
+    def _touch(self, habit):
+        for key in self._keys(habit):
+            self._by_name.move_to_end(key)
+
+    def _evict(self, habit):
+        for key in self._keys(habit):
+            self._discard(key)
+
+    def _discard(self, key):
+        habit = self._by_name.pop(key, None)
+        if habit is None:
+            return
+        keys = self._keys_by_name[key[1]]
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_name[key[1]]
+        if not self._keys(habit):
+            self._by_id.pop(habit.id, None)
+
+    def _remove(self, habit_name):
+        for key in list(self._keys_by_name.get(habit_name, ())):
+            self._discard(key)
+
+    def __len__(self):
+        return len(self._by_id)
@@ -1,47 +1,142 @@
+import heapq
 import sqlite3
-from datetime import datetime
-from habit import Habit
-from habitevent import HabitEvent
+from datetime import date, datetime
+from itertools import islice
+from habitevent import HabitEvent, PERIOD_DAYS, day_period_index, day_streak_stats
+from bitmap import bitmap_days, bitmap_to_blob, blob_to_bitmap
+from event_store import EventStore
+from habit_cache import HabitCache
+from repository import EventRow, HabitRepository, habit_from_row
+from schema import SCHEMA_VERSION, get_schema_version
+
+# Number of events written per transaction by add_habit_events
+EVENT_CHUNK_SIZE = 5000
+
+# Number of rows fetched per round trip by the iter_* generators
+FETCH_BATCH_SIZE = 1000
 
 class HabitTracker:
     """
     HabitTracker class to manage habits and habit events in a database.
     """
-    def __init__(self, conn, cursor):
+    def __init__(self, conn, cursor, habit_cache=None, user=None):
+        """
+        Initialize the HabitTracker with a database connection and cursor.
+
+        Args:
+          habit_cache (HabitCache): Read-through cache of habits; a private one is created if omitted.
+          user (str): Limit all queries to the habits created by this user; None for all users.
+        """
         self.conn = conn
         self.cursor = cursor
+        self.habit_cache = habit_cache if habit_cache is not None else HabitCache()
+        self.user = user
+        self.repository = HabitRepository(conn, cursor, user=user)
+
+    def user_scope(self, column="created_by"):
+        """
+        Get the SQL condition limiting a query to the tracker's user.
+
+        Args:
+          column (str): The created_by column, qualified if the query joins tables.
+
+        Returns:
+          tuple: The condition ("1" for trackers of all users) and its parameters.
+        """
+        return self.repository.user_scope(column)
 
     def is_connected(self):
         """
         Check if the database connection is established.
         """
         try:
-            self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='habits'")
+            self.repository.has_habits_table()
             return True
         except sqlite3.Error:
             return False
 
+    def is_schema_current(self):
+        """
+        Check if the database schema is at the latest migration version.
+
+        Only the version in the database header is read; no table is scanned.
+        """
+        try:
+            return get_schema_version(self.conn) == SCHEMA_VERSION
+        except sqlite3.Error:
+            return False
+
     def add_habit(self, habit):
         """
         Add a new habit to the database.
+
+        Habits added through a user-scoped tracker belong to its user.
         """
+        if self.user is not None:
+            habit.created_by = self.user
         with self.conn:
-            self.cursor.execute('''INSERT INTO habits (id, name, task, periodicity, creation_date, completion_date, streak, created_by, demoData)
-                                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                                (habit.id, habit.name, habit.task, habit.periodicity, habit.creation_date.strftime("%Y-%m-%d"),
-                                 habit.completion_date.strftime("%Y-%m-%d") if habit.completion_date else None, habit.streak, habit.created_by, habit.demoData))
-            habit.update_dbID(self.cursor.lastrowid)
+            habit.update_dbID(self.repository.insert_habit(habit))
             self.conn.commit()
+        self.habit_cache.invalidate(habit.name)
 
     def add_habit_event(self, habit_event):
         """
         Add a new habit event to the database.
+
+        Adding a second event in the same period of the habit has no effect,
+        so retried completions are safe.
+
+        Returns:
+          bool: True if the event was added, False if its period was already completed.
         """
         with self.conn:
-            self.cursor.execute('''INSERT INTO habit_events (habitID, date, isInPeriod)
-                                   VALUES (?, ?, ?)''',
-                                (habit_event.habitID, habit_event.eventDate.strftime("%Y-%m-%d"), habit_event.isInPeriod))
+            added = self._insert_habit_event(habit_event)
             self.conn.commit()
+        return added
+
+    def add_habit_events(self, habit_events, chunk_size=EVENT_CHUNK_SIZE):
+        """
+        Add many habit events to the database.
+
+        Events are consumed lazily from the iterable and written with
+        executemany in chunks, one transaction per chunk, together with the
+        period rollups of the chunk. Events in an already completed period
+        are skipped. The streak columns are not maintained; call
+        rebuild_streaks afterwards.
+
+        Args:
+          habit_events (iterable): HabitEvent objects to add.
+          chunk_size (int): The number of events written per transaction.
+
+        Returns:
+          int: The number of events added.
+        """
+        rows = (self._event_row(habit_event) for habit_event in habit_events)
+        added = 0
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return added
+            with self.conn:
+                added += self.repository.insert_events(chunk)
+
+    def _insert_habit_event(self, habit_event):
+        """
+        Insert a habit event and mark its period in the rollups without committing.
+
+        The insert is idempotent: an event in an already completed period is skipped.
+
+        Returns:
+          bool: True if the event was added.
+        """
+        return self.repository.insert_event(self._event_row(habit_event))
+
+    def _event_row(self, habit_event):
+        """
+        Get the insert parameters of a habit event: (date, day, isInPeriod, habit ID).
+        """
+        return (habit_event.eventDate.strftime("%Y-%m-%d"), habit_event.eventDay, habit_event.isInPeriod,
+                habit_event.habitID)
 
     def save_habit(self, habit):
         if habit.id is None:
@@ -52,66 +147,386 @@ class HabitTracker:
     def update_habit(self, habit):
         """
         Update an existing habit in the database.
+
+        A habit without a database ID is found by its name.
+
+        Raises:
+          AmbiguousHabitError: The tracker is for all users and habits of several users have the name.
         """
+        habit_id = habit.id
+        if habit_id is None:
+            stored = self.repository.get_habit(habit.name)
+            if stored is None:
+                return
+            habit_id = stored.id
         with self.conn:
-            self.cursor.execute('''UPDATE habits
-                                   SET task = ?
-                                   WHERE name = ?''',
-                                (habit.task, habit.name))
+            self.repository.update_task(habit_id, habit.task)
             self.conn.commit()
+        self.habit_cache.invalidate(habit.name)
 
     def remove_habit(self, habit_name):
         """
         Remove a habit and its associated events from the database.
+
+        Raises:
+          AmbiguousHabitError: The tracker is for all users and habits of several users have the name.
         """
+        habit = self.repository.get_habit(habit_name)
+        if habit is None:
+            return
         with self.conn:
-            self.cursor.execute('DELETE FROM habits WHERE name=?', (habit_name,))
-            self.cursor.execute('DELETE FROM habit_events WHERE habitId IN (SELECT id FROM habits WHERE name=?)', (habit_name,))
+            self.repository.delete_habit(habit.id)
             self.conn.commit()
+        self.habit_cache.invalidate(habit_name)
+
+    def get_habit(self, habit_name):
+        """
+        Get a habit by its name, reading through the habit cache.
+
+        Args:
+          habit_name (str): The name of the habit.
+
+        Returns:
+          Habit: The Habit object, or None if no habit has this name.
+
+        Raises:
+          AmbiguousHabitError: The tracker is for all users and habits of several users have the name.
+        """
+        habit = self.habit_cache.get_by_name(habit_name, self.user)
+        if habit is not None:
+            return habit
+        habit = self.repository.get_habit(habit_name)
+        if habit is None:
+            return None
+        self.habit_cache.put(habit, unique_name=self.user is None)
+        return habit
+
+    def get_habit_ids(self):
+        """
+        Map habit names to their database IDs.
+
+        Returns:
+          dict: Habit IDs keyed by habit name; names used by several users are left out.
+        """
+        return self.repository.get_habit_ids()
 
     def mark_habit_completed(self, habit_name):
         """
         Mark a habit as completed and add a habit event.
+
+        The event insert and the streak columns of the habit are written in
+        the same transaction. The habit is taken from the habit cache when
+        it was loaded before.
+        """
+        return self.mark_habits_completed([habit_name])[0]
+
+    def mark_habits_completed(self, habit_names):
+        """
+        Mark several habits as completed in a single transaction.
+
+        Args:
+          habit_names (list): The names of the habits to mark as completed.
+
+        Returns:
+          list: The Habit object for each name, or None where no habit has the name.
+        """
+        habits = [self.get_habit(habit_name) for habit_name in habit_names]
+        completion_date = datetime.now()
+        self.record_completions([(habit, HabitEvent(habitID=habit.id, eventDate=completion_date))
+                                 for habit in habits if habit is not None])
+        return habits
+
+    def record_completions(self, completions):
+        """
+        Write completions of loaded habits in a single transaction, maintaining their streak columns.
+
+        Only the completion that adds the event of a period advances the
+        streak, so concurrent completions of a shared Habit object count once.
+
+        Args:
+          completions (list): (Habit, HabitEvent) tuples in the order the completions happened.
+        """
+        try:
+            with self.conn:
+                for habit, habit_event in completions:
+                    if self._insert_habit_event(habit_event):
+                        self._advance_streak(habit, day_period_index(habit, habit_event.eventDay))
+        except Exception:
+            for habit, _ in completions:
+                self.habit_cache.invalidate(habit.name)
+            raise
+
+    def _advance_streak(self, habit, period):
         """
+        Update the streak columns of a habit for a completion in the given period.
+
+        The new values are computed in SQL from the stored row, so
+        completions written by other connections since the habit was loaded
+        count, and the loaded Habit object is refreshed from the result.
+        Completions in an already counted period leave the streak unchanged.
+        Backdated completions cannot be applied incrementally and are left
+        for rebuild_streaks.
+        """
+        habit.streak, habit.longest_streak, habit.last_period = self.repository.advance_streak(habit.id, period)
+
+    def rebuild_streaks(self, min_id=None, max_id=None):
+        """
+        Recompute the streak columns of all habits from their event history.
+
+        The history is read with load_event_store, archived years included.
+
+        Use this after bulk imports or after adding events with add_habit_event,
+        which does not maintain the streak columns.
+
+        Args:
+          min_id (int): Only habits with at least this ID.
+          max_id (int): Only habits with at most this ID.
+
+        Returns:
+          int: The number of habits updated.
+        """
+        updates = self.streak_updates(min_id, max_id)
         with self.conn:
-            self.cursor.execute('SELECT id, name, task, periodicity, creation_date, completion_date, streak, created_by, demoData FROM habits WHERE name=?', (habit_name,))
-            habit_data = self.cursor.fetchone()
-            if not habit_data:
-                return None
-
-            habit = Habit(
-                id=habit_data[0],
-                name=habit_data[1],
-                task=habit_data[2],
-                periodicity=habit_data[3],
-                creation_date=datetime.strptime(habit_data[4], "%Y-%m-%d"),
-                completion_date=datetime.strptime(habit_data[5], "%Y-%m-%d") if habit_data[5] else None,
-                streak=habit_data[6],
-                created_by=habit_data[7],
-                demoData=habit_data[8]
-            )
-            self.add_habit_event(HabitEvent(habitID=habit.id, eventDate=datetime.now()))
-            return habit
+            self.repository.update_streaks(updates)
+        self.habit_cache.clear()
+        return len(updates)
+
+    def streak_updates(self, min_id=None, max_id=None):
+        """
+        Compute the streak columns of habits from their event history without writing them.
+
+        Returns:
+          list: (streak, longest streak, last period, habit ID) tuples for HabitRepository.update_streaks.
+        """
+        updates = []
+        habits, event_store = self.load_event_store(min_id, max_id)
+        for habit in habits:
+            longest_streak, streak, last_period = day_streak_stats(habit, event_store.days_for(habit.id))
+            updates.append((streak, longest_streak, last_period, habit.id))
+        return updates
+
+    def compact_events(self):
+        """
+        Remove event, rollup and archive rows that no longer belong to a habit.
+
+        Such rows are left by habits removed before remove_habit deleted
+        their events. Duplicate completions cannot occur any more since
+        the unique (habitId, period) key; older duplicates are removed by
+        schema.remove_duplicate_events.
+
+        Returns:
+          int: The number of event rows removed.
+        """
+        with self.conn:
+            return self.repository.delete_orphans()
+
+    def archive_events(self, before=None):
+        """
+        Fold the events of closed years into one bitmap row per habit and year.
+
+        Archived events are removed from habit_events; iter_habit_events and
+        load_event_store expand them again on demand, and load_period_bitmap
+        combines them with the live rows using bit operations. Events added
+        later for an archived year stay live until the next run; the period
+        rollups are kept, so completions of archived periods are still
+        skipped as duplicates.
+
+        Args:
+          before (datetime): Archive the years before the year of this date; the current year by default.
+
+        Returns:
+          int: The number of events archived.
+        """
+        year = (before or datetime.now()).year
+        cutoff_day = date(year, 1, 1).toordinal()
+        with self.conn:
+            self.repository.begin_immediate()
+            bitmaps = {(habit_id, archive_year): blob_to_bitmap(days)
+                       for habit_id, archive_year, days in self.repository.get_archive_before(year)}
+            changed = set()
+            for habit_id, day in self.repository.iter_event_days_before(cutoff_day):
+                event_year = date.fromordinal(day).year
+                key = (habit_id, event_year)
+                bitmaps[key] = bitmaps.get(key, 0) | 1 << (day - date(event_year, 1, 1).toordinal())
+                changed.add(key)
+            self.repository.replace_archive_rows([(habit_id, event_year, date(event_year, 1, 1).toordinal(),
+                                                   bitmap_to_blob(bitmaps[(habit_id, event_year)]))
+                                                  for habit_id, event_year in changed])
+            return self.repository.delete_events_before(cutoff_day)
+
+    def load_period_bitmap(self, habit):
+        """
+        Load a habit's completed periods as one bitmap, archived and live history combined.
 
-    def get_habit_events(self, habit_id):
+        Archived years are shifted into place whole; only the live rows are
+        read one by one.
+
+        Returns:
+          tuple: The bitmap, whose bit i is set when period base + i has a completion, and the base period.
+        """
+        archive_rows = self.repository.get_habit_archive(habit.id)
+        live_days = self.repository.get_habit_days(habit.id)
+        origin = min([habit.creation_day] + [first_day for first_day, _ in archive_rows] + live_days)
+
+        day_bits = 0
+        for first_day, days in archive_rows:
+            day_bits |= blob_to_bitmap(days) << (first_day - origin)
+        for day in live_days:
+            day_bits |= 1 << (day - origin)
+        if PERIOD_DAYS[habit.periodicity] == 1:
+            return day_bits, origin - habit.creation_day
+
+        base_period = day_period_index(habit, origin)
+        period_bits = 0
+        for day in bitmap_days(day_bits, origin):
+            period_bits |= 1 << (day_period_index(habit, day) - base_period)
+        return period_bits, base_period
+
+    def iter_days_backwards(self, habit_id, until_day):
+        """
+        Iterate over the completion days of a habit from a day backwards, live and archived.
+
+        Rows are read lazily, so callers that stop early read only the most recent days.
+
+        Args:
+          habit_id (int): The ID of the habit.
+          until_day (int): The day ordinal to start at, inclusive.
+
+        Returns:
+          iterator: Day ordinals in descending order.
+        """
+        live_days = self.repository.iter_days_backwards(habit_id, until_day)
+
+        def archived_days():
+            for first_day, days in self.repository.get_archive_backwards(habit_id, until_day):
+                for day in bitmap_days(blob_to_bitmap(days), first_day, reverse=True):
+                    if day <= until_day:
+                        yield day
+
+        return heapq.merge(live_days, archived_days(), reverse=True)
+
+    def rebuild_rollups(self):
+        """
+        Recompute the per-period completion rollups from the event history.
+
+        Use this after events were changed outside HabitTracker; all insert
+        paths maintain the rollups themselves.
+        """
+        with self.conn:
+            self.repository.rebuild_rollups()
+
+    def load_event_store(self, min_id=None, max_id=None):
+        """
+        Load all habits and their events, live rows in a single query.
+
+        Rows are read in one ordered pass (habit id, then event day) and the
+        integer day column goes straight into the store, so no per-event
+        Python objects are created. Archived years are read with one more
+        query and expanded into the store.
+
+        Args:
+          min_id (int): Only habits with at least this ID.
+          max_id (int): Only habits with at most this ID.
+
+        Returns:
+          tuple: A list of Habit objects ordered by ID and an EventStore with their events.
+        """
+        rows = self.repository.iter_habit_day_rows(min_id, max_id)
+        day_index = len(rows.description) - 1
+        habits = []
+        event_store = EventStore()
+        archive = self._load_archive_bitmaps(min_id, max_id)
+        archived_habit_days = None
+        for row in rows:
+            if not habits or habits[-1].id != row[0]:
+                if archived_habit_days is not None:
+                    self._add_archived_habit(event_store, habits[-1].id, archive, archived_habit_days)
+                habits.append(habit_from_row(row))
+                archived_habit_days = [] if row[0] in archive else None
+            if archived_habit_days is None:
+                event_store.add(row[0], row[day_index])
+            elif row[day_index] is not None:
+                archived_habit_days.append(row[day_index])
+        if archived_habit_days is not None:
+            self._add_archived_habit(event_store, habits[-1].id, archive, archived_habit_days)
+        return habits, event_store
+
+    def _load_archive_bitmaps(self, min_id, max_id):
+        """
+        Load the archive rows of the habits selected by load_event_store.
+
+        Returns:
+          dict: (first day, days bitmap) tuples ordered by year, keyed by habit ID.
+        """
+        archive = {}
+        for habit_id, first_day, days in self.repository.iter_archive_rows(min_id, max_id):
+            archive.setdefault(habit_id, []).append((first_day, blob_to_bitmap(days)))
+        return archive
+
+    def _add_archived_habit(self, event_store, habit_id, archive, live_days):
+        """
+        Add a habit's archived days merged with its live days to the event store.
+        """
+        event_store.add(habit_id)
+        archived_days = (day for first_day, bits in archive[habit_id] for day in bitmap_days(bits, first_day))
+        for day in heapq.merge(archived_days, live_days):
+            event_store.add(habit_id, day)
+
+    def get_habit_events(self, habit_id, since=None, until=None):
         """
         Fetches all habit events for a given habit ID from the database.
 
         Args:
           habit_id (int): The ID of the habit for which to retrieve events.
+          since (datetime): Only events on or after this date.
+          until (datetime): Only events on or before this date.
 
         Returns:
-          list: A list of HabitEvent objects or None if no events found.
-        """
-        self.cursor.execute('''SELECT * FROM habit_events WHERE habitId = ?''', (habit_id,))
-        habit_events_data = self.cursor.fetchall()
-        habit_events = []
-        for row in habit_events_data:
-            habit_event = HabitEvent(
-                habitID=row[1],
-                eventDate=datetime.strptime(row[2], "%Y-%m-%d"),
-                isInPeriod=row[3],
-                demoData=row[4]
-            )
-            habit_events.append(habit_event)
-        return habit_events
+          list: A list of HabitEvent objects sorted by date.
+        """
+        return list(self.iter_habit_events(habit_id, since=since, until=until))
+
+    def iter_habit_events(self, habit_id=None, batch_size=FETCH_BATCH_SIZE, since=None, until=None, archived=True,
+                          as_tuples=False):
+        """
+        Iterate over habit events without loading them all into memory.
+
+        Rows are read with fetchmany on a dedicated cursor, so other queries
+        may run while the generator is consumed. Date bounds on the events
+        of one habit are range scans on the (habitId, day) index. Archived
+        years are expanded back into events and merged in date order.
+
+        Args:
+          habit_id (int): The ID of the habit, or None for the events of all habits.
+          batch_size (int): The number of rows fetched per round trip.
+          since (datetime): Only events on or after this date.
+          until (datetime): Only events on or before this date.
+          archived (bool): Include the events folded into the archive by archive_events.
+          as_tuples (bool): Yield lightweight EventRow tuples (habitID, eventDay, isInPeriod, demoData)
+            instead of HabitEvent objects.
+
+        Returns:
+          iterator: HabitEvent objects or EventRow tuples ordered by habit ID and date.
+        """
+        live_events = self.repository.iter_events(habit_id, batch_size,
+                                                  since.toordinal() if since is not None else None,
+                                                  until.toordinal() if until is not None else None, as_tuples)
+        archive_rows = self.repository.get_archive_rows(habit_id, since, until) if archived else []
+        if not archive_rows:
+            return live_events
+        return heapq.merge(self._expand_archive_rows(archive_rows, since, until, as_tuples), live_events,
+                           key=lambda habit_event: (habit_event.habitID, habit_event.eventDay))
+
+    def _expand_archive_rows(self, archive_rows, since=None, until=None, as_tuples=False):
+        """
+        Expand archive rows into HabitEvent objects, or EventRow tuples, within the date bounds.
+        """
+        first_day = since.toordinal() if since is not None else None
+        last_day = until.toordinal() if until is not None else None
+        for habit_id, year_first_day, days in archive_rows:
+            for day in bitmap_days(blob_to_bitmap(days), year_first_day):
+                if (first_day is None or day >= first_day) and (last_day is None or day <= last_day):
+                    if as_tuples:
+                        yield EventRow(habit_id, day, False, False)
+                    else:
+                        yield HabitEvent(habitID=habit_id, eventDay=day)
@@ -1,19 +1,136 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 
 # Define constants for periodicity values
 DAILY = "daily"
 WEEKLY = "weekly"
 
+# Length of one period in days for each periodicity
+PERIOD_DAYS = {DAILY: 1, WEEKLY: 7}
+
+
+def _period_days(habit):
+    """
+    Get the length of the habit's period in days.
+    """
+    try:
+        return PERIOD_DAYS[habit.periodicity]
+    except KeyError:
+        raise ValueError(f"Invalid periodicity: {habit.periodicity}")
+
+
+def period_index(habit, date):
+    """
+    Map a date to the number of the habit's period it falls into.
+
+    Periods are counted from the habit's creation date (period 0), using
+    arithmetic on day ordinals, so the lookup is O(1).
+
+    Args:
+        habit (Habit): The habit defining the creation date and periodicity.
+        date (datetime): The date to map.
+
+    Returns:
+        int: The period number, negative for dates before the creation date.
+    """
+    return day_period_index(habit, date.toordinal())
+
+
+def day_period_index(habit, day):
+    """
+    Map a day ordinal to the number of the habit's period it falls into.
+    """
+    return (day - habit.creation_day) // _period_days(habit)
+
+
+def streak_stats(habit, sorted_events):
+    """
+    Calculate streak figures from events sorted by date.
+
+    A streak is a run of consecutive periods with at least one event;
+    several events in the same period count once.
+
+    Args:
+        habit (Habit): The habit the events belong to.
+        sorted_events (iterable): HabitEvent objects sorted by event date.
+
+    Returns:
+        tuple: (longest streak, streak ending in the last period, last period or None).
+    """
+    return day_streak_stats(habit, (event.eventDay for event in sorted_events))
+
+
+def day_streak_stats(habit, sorted_days):
+    """
+    Calculate streak figures from sorted day ordinals, as streak_stats does for events.
+
+    Args:
+        habit (Habit): The habit the days belong to.
+        sorted_days (iterable): Day ordinals (datetime.toordinal) in ascending order.
+
+    Returns:
+        tuple: (longest streak, streak ending in the last period, last period or None).
+    """
+    creation_day = habit.creation_day
+    period_days = _period_days(habit)
+    current_streak = 0
+    max_streak = 0
+    prev_period = None
+
+    for day in sorted_days:
+        curr_period = (day - creation_day) // period_days
+        if curr_period == prev_period:
+            continue
+
+        if prev_period is not None and curr_period == prev_period + 1:
+            current_streak += 1
+        else:
+            current_streak = 1
+
+        prev_period = curr_period
+        max_streak = max(max_streak, current_streak)
+
+    return max_streak, current_streak, prev_period
+
+
 class HabitEvent:
     """
     HabitEvent class to represent an event associated with a habit.
+
+    The event date may be given as a datetime or as a day ordinal (eventDay);
+    the other form is derived lazily.
     """
-    def __init__(self, habitID, eventDate, isInPeriod=False, demoData=False):
+    __slots__ = ("habitID", "_eventDate", "_eventDay", "isInPeriod", "demoData")
+
+    def __init__(self, habitID, eventDate=None, isInPeriod=False, demoData=False, eventDay=None):
+        if eventDate is None and eventDay is None:
+            raise ValueError("A habit event needs an eventDate or an eventDay")
         self.habitID = habitID
-        self.eventDate = eventDate
+        self._eventDate = eventDate
+        self._eventDay = eventDay if eventDay is not None else eventDate.toordinal()
         self.isInPeriod = isInPeriod
         self.demoData = demoData
 
+    @property
+    def eventDate(self):
+        """
+        The event date as a datetime, converted from the day ordinal on first access.
+        """
+        if self._eventDate is None:
+            self._eventDate = datetime.fromordinal(self._eventDay)
+        return self._eventDate
+
+    @eventDate.setter
+    def eventDate(self, value):
+        self._eventDate = value
+        self._eventDay = value.toordinal()
+
+    @property
+    def eventDay(self):
+        """
+        The event date as a day ordinal.
+        """
+        return self._eventDay
+
     def is_in_period(self, habit, current_date):
         """
         Check if the event is within the specified period for the habit.
@@ -29,11 +146,4 @@ class HabitEvent:
         """
         Helper method to check if the event is within the weekly period.
         """
-        time_delta = (current_date - habit.creation_date).days
-        weeks_passed = time_delta // 7
-        expected_completion_dates = [habit.creation_date + timedelta(weeks=week) for week in range(weeks_passed + 1)]
-
-        for expected_date in expected_completion_dates:
-            if expected_date <= self.eventDate <= expected_date + timedelta(days=6):
-                return True
-        return False
+        return 0 <= day_period_index(habit, self.eventDay) <= period_index(habit, current_date)
@@ -0,0 +1,213 @@
+"""
+Load generator for the HTTP/JSON API.
+
+Concurrent keep-alive clients send the requests of each scenario; p50/p99
+latency and requests per second are written as JSON lines, one per
+scenario, like benchmark.py:
+
+    python loadtest.py --url http://127.0.0.1:8080 --scenario complete --scenario streaks
+
+Without --url a server is started in-process on a temporary synthetic database.
+"""
+import http.client
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit
+import click
+from benchmark import SIZES, build_database
+from connection import ConnectionPool
+from server import HabitAPIServer
+
+# Request of the i-th call of each scenario, given the habit names: (method, path)
+SCENARIOS = {
+    "complete": lambda habit_names, i: ("POST", f"/habits/{quote(habit_names[i % len(habit_names)])}/completions"),
+    "habit": lambda habit_names, i: ("GET", f"/habits/{quote(habit_names[i % len(habit_names)])}"),
+    "streaks": lambda habit_names, i: ("GET", "/reports/streaks"),
+    "longest-streak": lambda habit_names, i: ("GET", "/reports/longest-streak"),
+}
+
+# Scenarios whose requests name a habit
+HABIT_SCENARIOS = {"complete", "habit"}
+
+DEFAULT_REQUESTS = 1000
+
+DEFAULT_CONCURRENCY = 8
+
+
+def percentile(sorted_values, fraction):
+    """
+    Get the nearest-rank percentile of sorted values.
+    """
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def fetch_habit_names(host, port, limit=1000):
+    """
+    Get the names of the first habits served by the API.
+    """
+    conn = http.client.HTTPConnection(host, port)
+    try:
+        conn.request("GET", f"/habits?limit={limit}")
+        return [habit["name"] for habit in json.loads(conn.getresponse().read())["habits"]]
+    finally:
+        conn.close()
+
+
+def create_habits(host, port, count):
+    """
+    Add fresh daily habits through the API, one per request of a scenario.
+
+    A habit completed twice on the same day only writes its event once, so
+    with fresh habits the complete scenario spends each request on a habit
+    of its own. The habits stay in the server's database.
+
+    Returns:
+        list: The names of the new habits.
+    """
+    prefix = f"loadtest-{uuid.uuid4().hex[:8]}"
+    habit_names = [f"{prefix}-{i}" for i in range(count)]
+    conn = http.client.HTTPConnection(host, port)
+    try:
+        for habit_name in habit_names:
+            conn.request("POST", "/habits", body=json.dumps({"name": habit_name, "task": "Load test",
+                                                             "periodicity": "daily"}))
+            response = conn.getresponse()
+            response.read()
+            if response.status != 201:
+                raise click.ClickException(f"Could not add habit {habit_name}: HTTP {response.status}")
+    finally:
+        conn.close()
+    return habit_names
+
+
+def run_load(host, port, scenario, habit_names, requests=DEFAULT_REQUESTS, concurrency=DEFAULT_CONCURRENCY,
+             fresh_habits=False):
+    """
+    Send the requests of one scenario from concurrent clients and measure them.
+
+    Args:
+        host (str): The server address.
+        port (int): The server port.
+        scenario (str): A name out of SCENARIOS.
+        habit_names (list): The habits the requests are spread over.
+        requests (int): The total number of requests.
+        concurrency (int): The number of clients, each with one keep-alive connection.
+        fresh_habits (bool): Complete one new habit per request instead of habit_names; see create_habits.
+
+    Returns:
+        dict: The scenario, request and error counts, p50/p99 latency and requests per second.
+    """
+    make_request = SCENARIOS[scenario]
+    if fresh_habits and scenario == "complete":
+        habit_names = create_habits(host, port, requests)
+    if scenario in HABIT_SCENARIOS and not habit_names:
+        raise click.ClickException(f"The {scenario} scenario needs habits, but the server has none")
+    next_index = iter(range(requests))
+    lock = threading.Lock()
+
+    def client():
+        conn = http.client.HTTPConnection(host, port)
+        latencies = []
+        errors = 0
+        try:
+            while True:
+                with lock:
+                    i = next(next_index, None)
+                if i is None:
+                    return latencies, errors
+                method, path = make_request(habit_names, i)
+                start = time.perf_counter()
+                conn.request(method, path, body=b"" if method == "POST" else None)
+                response = conn.getresponse()
+                response.read()
+                latencies.append(time.perf_counter() - start)
+                if response.status >= 400:
+                    errors += 1
+        finally:
+            conn.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = [future.result() for future in [executor.submit(client) for _ in range(concurrency)]]
+    seconds = time.perf_counter() - start
+    latencies = sorted(latency for client_latencies, _ in results for latency in client_latencies)
+    return {
+        "scenario": scenario,
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "errors": sum(errors for _, errors in results),
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "requests_per_s": len(latencies) / seconds,
+        "python": platform.python_version(),
+    }
+
+
+def start_local_server(directory, size, pool_size):
+    """
+    Start an API server in a background thread on a synthetic database.
+
+    Returns:
+        tuple: The running HabitAPIServer and its ConnectionPool.
+    """
+    habits, users, years = SIZES[size]
+    db_name = os.path.join(directory, f"{size}.db")
+    db, _, _ = build_database(db_name, habits, users, years)
+    db.close_connection()
+    pool = ConnectionPool(db_name, size=pool_size)
+    api_server = HabitAPIServer(pool, port=0)
+    threading.Thread(target=api_server.serve_forever, daemon=True).start()
+    return api_server, pool
+
+
+@click.command()
+@click.option("--url", default=None, help="Base URL of a running server; a local one is started by default.")
+@click.option("--scenario", "scenarios", multiple=True, type=click.Choice(list(SCENARIOS)),
+              default=["complete", "streaks"], show_default=True, help="Scenarios to run.")
+@click.option("--requests", default=DEFAULT_REQUESTS, show_default=True, help="Requests per scenario.")
+@click.option("--concurrency", default=DEFAULT_CONCURRENCY, show_default=True, help="Concurrent clients.")
+@click.option("--size", type=click.Choice(list(SIZES)), default="small", show_default=True,
+              help="Dataset size of the local server.")
+@click.option("--fresh-habits/--no-fresh-habits", default=None,
+              help="Add one habit per request for the complete scenario, so every completion writes an event; "
+                   "on for the local server. The habits stay in the server's database.")
+@click.option("--label", default="", help="Label stored with each result, e.g. a version.")
+@click.option("--output", type=click.File("w"), default="-", help="JSON lines output file.")
+def main(url, scenarios, requests, concurrency, size, fresh_habits, label, output):
+    """
+    Load-test the habit tracker HTTP/JSON API.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        api_server = pool = None
+        if url is None:
+            api_server, pool = start_local_server(tmp, size, concurrency)
+            host, port = "127.0.0.1", api_server.server_port
+        else:
+            parts = urlsplit(url)
+            host, port = parts.hostname, parts.port or 80
+        try:
+            habit_names = fetch_habit_names(host, port)
+            for scenario in scenarios:
+                result = run_load(host, port, scenario, habit_names, requests, concurrency,
+                                  fresh_habits=url is None if fresh_habits is None else fresh_habits)
+                result["label"] = label
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+                print(f"{result['scenario']:<16} p50 {result['p50_ms']:8.3f} ms  p99 {result['p99_ms']:8.3f} ms  "
+                      f"{result['requests_per_s']:10.1f} req/s  {result['errors']} errors", file=sys.stderr)
+        finally:
+            if api_server is not None:
+                api_server.shutdown()
+                api_server.server_close()
+                pool.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,76 @@
 import click
-import questionary
-import sqlite3
-from habit import Habit
-from habitevent import HabitEvent
+import sys
 from habit_tracker import HabitTracker
-from analytics import Analytics
-from error_handler import ErrorHandler
+from repository import AmbiguousHabitError
+from connection import (ConnectionPool, DB_NAME, DEFAULT_BUSY_TIMEOUT, DEFAULT_POOL_SIZE, DEFAULT_SYNCHRONOUS,
+                        PROFILE_ENV, SYNCHRONOUS_LEVELS)
 from datetime import datetime, timedelta
 
+# Modules only some commands need are imported inside them, so scripted
+# commands like list, streaks and complete start fast
+
+
+def open_pool(settings, upgrade=True, size=DEFAULT_POOL_SIZE):
+    """
+    Open a connection pool on the habits database and upgrade its schema if it is out of date.
+
+    Args:
+        upgrade (bool): Whether to upgrade the schema; commands that report on the upgrade do it themselves.
+        size (int): The maximum number of open connections.
+    """
+    pool = ConnectionPool(settings["db_name"], size=size, busy_timeout=settings["busy_timeout"],
+                          synchronous=settings["synchronous"], tracer=settings["tracer"])
+    if not upgrade:
+        return pool
+    from schema import MigrationError, migrate
+    try:
+        with pool.tracker() as habit_tracker:
+            if not habit_tracker.is_schema_current():
+                click.echo("Upgrading the habit tracker database schema...", err=True)
+                migrate(habit_tracker.conn)
+    except MigrationError as e:
+        pool.close()
+        raise click.ClickException(str(e))
+    return pool
 
 @click.group()
-def cli():
-    print("\nWelcome to your Habit Tracker application.")
-    pass
+@click.option("--db", "db_name", default=DB_NAME, show_default=True, help="The database file.")
+@click.option("--busy-timeout", default=DEFAULT_BUSY_TIMEOUT, show_default=True,
+              help="Milliseconds to wait for a locked database.")
+@click.option("--synchronous", type=click.Choice(SYNCHRONOUS_LEVELS, case_sensitive=False),
+              default=DEFAULT_SYNCHRONOUS, show_default=True, help="SQLite synchronous level.")
+@click.option("--profile", is_flag=True, envvar=PROFILE_ENV,
+              help=f"Trace all SQL statements and print a report on exit (or set {PROFILE_ENV}=1).")
+@click.option("--user", default=None, help="Limit all commands to the habits of this user.")
+@click.pass_context
+def cli(ctx, db_name, busy_timeout, synchronous, profile, user):
+    tracer = None
+    if profile:
+        from profiling import QueryTracer
+        tracer = QueryTracer()
+    ctx.obj = {"db_name": db_name, "busy_timeout": busy_timeout, "synchronous": synchronous, "tracer": tracer,
+               "user": user}
+    if tracer is not None:
+        ctx.call_on_close(lambda: print(tracer.report(), file=sys.stderr))
 
 @cli.command()
-def main():
+@click.pass_obj
+def main(settings):
     """
     Main function to run the Habit Tracker application.
     """
-    conn = sqlite3.connect('habits.db')
+    # Imported here so the non-interactive commands start fast
+    import questionary
+    from analytics import Analytics
+    from error_handler import ErrorHandler
+    from habit import Habit
+
+    print("\nWelcome to your Habit Tracker application.")
+    pool = open_pool(settings)
+    conn = pool.acquire()
     cursor = conn.cursor()
 
-    habit_tracker = HabitTracker(conn, cursor)
+    habit_tracker = HabitTracker(conn, cursor, user=settings["user"])
     if habit_tracker.is_connected():
         print("Connected to the habit tracker database successfully!")
     else:
@@ -148,11 +196,12 @@ def main():
                 print("Habit removal cancelled.")
 
         elif user_choice == "List all habits":
-            all_habits = analytics.get_all_habits()
-            if all_habits:
-                for habit in all_habits:
+            found = False
+            for page in analytics.iter_habit_pages():
+                found = True
+                for habit in page:
                     print(f"- {habit.name}")
-            else:
+            if not found:
                 print("You currently have no habits tracked.")
 
         elif user_choice == "List habits by periodicity":
@@ -160,12 +209,14 @@ def main():
             chosen_periodicity = questionary.select(
                 "Choose the periodicity to list:", periodicity_options
             ).ask()
-            habits_by_periodicity = analytics.get_habits_by_periodicity(chosen_periodicity)
-            if habits_by_periodicity:
-                print(f"Habits with periodicity '{chosen_periodicity}':")
-                for habit in habits_by_periodicity:
+            found = False
+            for page in analytics.iter_habit_pages(periodicity=chosen_periodicity):
+                if not found:
+                    print(f"Habits with periodicity '{chosen_periodicity}':")
+                    found = True
+                for habit in page:
                     print(f"- {habit.name}")
-            else:
+            if not found:
                  print(f"No habits found with periodicity '{chosen_periodicity}'.")
 
             
@@ -206,7 +257,319 @@ def main():
         elif user_choice == "Exit":
             break
 
-    conn.close()
+    pool.release(conn)
+    pool.close()
+
+@cli.command()
+@click.argument("habit_names", nargs=-1, required=True)
+@click.pass_obj
+def complete(settings, habit_names):
+    """
+    Mark one or more habits as completed in a single transaction.
+    """
+    pool = open_pool(settings)
+    conn = pool.acquire()
+    habit_tracker = HabitTracker(conn, conn.cursor(), user=settings["user"])
+    try:
+        habits = habit_tracker.mark_habits_completed(habit_names)
+    except AmbiguousHabitError as e:
+        raise click.ClickException(str(e))
+    finally:
+        pool.release(conn)
+        pool.close()
+    missing = [habit_name for habit_name, habit in zip(habit_names, habits) if habit is None]
+    for habit_name in habit_names:
+        if habit_name not in missing:
+            click.echo(f"Habit '{habit_name}' marked as completed!")
+    if missing:
+        from error_handler import ErrorHandler, HABIT_NOT_FOUND
+        for habit_name in missing:
+            click.echo(f"{ErrorHandler(HABIT_NOT_FOUND).get_error_message()}: {habit_name}", err=True)
+        sys.exit(1)
+
+@cli.command("streaks")
+@click.argument("habit_names", nargs=-1)
+@click.option("--json", "as_json", is_flag=True, help="Print the report as JSON.")
+@click.pass_obj
+def streaks(settings, habit_names, as_json):
+    """
+    Report the current and longest streak of all or the given habits.
+    """
+    from analytics import Analytics
+    pool = open_pool(settings)
+    conn = pool.acquire()
+    habit_tracker = HabitTracker(conn, conn.cursor(), user=settings["user"])
+    analytics = Analytics(habit_tracker)
+    if habit_names:
+        try:
+            habits = [habit for habit in map(habit_tracker.get_habit, habit_names) if habit is not None]
+        except AmbiguousHabitError as e:
+            raise click.ClickException(str(e))
+    else:
+        habits = (habit for page in analytics.iter_habit_pages() for habit in page)
+    report = [{"name": habit.name,
+               "periodicity": habit.periodicity,
+               "current_streak": analytics.get_current_streak(habit),
+               "longest_streak": analytics.get_longest_streak_habit(habit)}
+              for habit in habits]
+    pool.release(conn)
+    pool.close()
+    if as_json:
+        import json
+        click.echo(json.dumps(report))
+    else:
+        for entry in report:
+            click.echo(f"{entry['name']}: current {entry['current_streak']}, longest {entry['longest_streak']}")
+
+@cli.command("list")
+@click.option("--periodicity", type=click.Choice(["daily", "weekly"]), help="Only list habits with this periodicity.")
+@click.option("--json", "as_json", is_flag=True, help="Print one JSON object per habit.")
+@click.pass_obj
+def list_habits(settings, periodicity, as_json):
+    """
+    List habits, optionally filtered by periodicity.
+    """
+    import json
+    from analytics import Analytics
+    pool = open_pool(settings)
+    conn = pool.acquire()
+    analytics = Analytics(HabitTracker(conn, conn.cursor(), user=settings["user"]))
+    for page in analytics.iter_habit_pages(periodicity=periodicity):
+        for habit in page:
+            if as_json:
+                click.echo(json.dumps({"name": habit.name, "task": habit.task, "periodicity": habit.periodicity}))
+            else:
+                click.echo(f"- {habit.name}")
+    pool.release(conn)
+    pool.close()
+
+@cli.command()
+@click.pass_obj
+def repair_streaks(settings):
+    """
+    Recompute the streak columns and period rollups of all habits from their event history.
+    """
+    pool = open_pool(settings)
+    conn = pool.acquire()
+    habit_tracker = HabitTracker(conn, conn.cursor(), user=settings["user"])
+    repaired = habit_tracker.rebuild_streaks()
+    habit_tracker.rebuild_rollups()
+    print(f"Recomputed streaks for {repaired} habits.")
+    pool.release(conn)
+    pool.close()
+
+def read_completions(file, file_format):
+    """
+    Stream (habit name, date) pairs from a CSV or JSONL file of completions.
+
+    Missing fields are None, and so are both fields of a JSONL line that is not a JSON object.
+    """
+    import csv
+    import json
+    if file_format == "csv":
+        for record in csv.DictReader(file):
+            yield record.get("habit"), record.get("date")
+    else:
+        for line in file:
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                if isinstance(record, dict):
+                    yield record.get("habit"), record.get("date")
+                else:
+                    yield None, None
+
+@cli.command("import")
+@click.argument("file", type=click.File("r"))
+@click.option("--format", "file_format", type=click.Choice(["csv", "jsonl"]),
+              help="File format; detected from the file extension by default.")
+@click.pass_obj
+def import_events(settings, file, file_format):
+    """
+    Import habit completions from a CSV or JSONL file.
+
+    Every record needs a 'habit' name and a 'date' (YYYY-MM-DD); records
+    without them, or with an invalid date, are skipped and counted.
+    """
+    from habitevent import HabitEvent
+    file_format = file_format or ("jsonl" if file.name.endswith((".jsonl", ".json")) else "csv")
+    pool = open_pool(settings)
+    conn = pool.acquire()
+    habit_tracker = HabitTracker(conn, conn.cursor(), user=settings["user"])
+    habit_ids = habit_tracker.get_habit_ids()
+    skipped = invalid = 0
+
+    def habit_events():
+        nonlocal skipped, invalid
+        for habit_name, date in read_completions(file, file_format):
+            try:
+                event_date = datetime.strptime(date, "%Y-%m-%d")
+            except (TypeError, ValueError):
+                invalid += 1
+                continue
+            habit_id = habit_ids.get(habit_name)
+            if habit_id is None:
+                skipped += 1
+                continue
+            yield HabitEvent(habitID=habit_id, eventDate=event_date)
+
+    imported = habit_tracker.add_habit_events(habit_events())
+    habit_tracker.rebuild_streaks()
+    print(f"Imported {imported} completions, skipped {skipped} for unknown or ambiguous habits "
+          f"and {invalid} invalid records.")
+    pool.release(conn)
+    pool.close()
+
+# Fields written by the export command
+HABIT_EXPORT_FIELDS = ["id", "name", "task", "periodicity", "creation_date", "completion_date",
+                       "streak", "longest_streak", "created_by", "demoData"]
+EVENT_EXPORT_FIELDS = ["habit", "date"]
+
+def habit_records(analytics):
+    """
+    Stream habits as export records.
+    """
+    for habit in analytics.iter_habits():
+        yield {
+            "id": habit.id,
+            "name": habit.name,
+            "task": habit.task,
+            "periodicity": habit.periodicity,
+            "creation_date": habit.creation_date.strftime("%Y-%m-%d"),
+            "completion_date": habit.completion_date.strftime("%Y-%m-%d") if habit.completion_date else None,
+            "streak": habit.streak,
+            "longest_streak": habit.longest_streak,
+            "created_by": habit.created_by,
+            "demoData": bool(habit.demoData)
+        }
+
+def event_records(habit_tracker):
+    """
+    Stream habit events as export records in the format read by the import command.
+    """
+    from analytics import Analytics
+    habit_names = {habit.id: habit.name for habit in Analytics(habit_tracker).iter_habits(as_tuples=True)}
+    for habit_event in habit_tracker.iter_habit_events():
+        yield {"habit": habit_names.get(habit_event.habitID), "date": habit_event.eventDate.strftime("%Y-%m-%d")}
+
+@cli.command()
+@click.argument("file", type=click.File("w"))
+@click.option("--data", type=click.Choice(["habits", "events"]), default="events", show_default=True,
+              help="What to export.")
+@click.option("--format", "file_format", type=click.Choice(["csv", "jsonl"]),
+              help="File format; detected from the file extension by default.")
+@click.pass_obj
+def export(settings, file, data, file_format):
+    """
+    Export habits or habit events to a CSV or JSONL file.
+
+    Records are streamed from the database and written one at a time, so
+    memory use stays flat regardless of the size of the database.
+    """
+    import csv
+    import json
+    from analytics import Analytics
+    file_format = file_format or ("jsonl" if file.name.endswith((".jsonl", ".json")) else "csv")
+    pool = open_pool(settings)
+    conn = pool.acquire()
+    habit_tracker = HabitTracker(conn, conn.cursor(), user=settings["user"])
+    if data == "habits":
+        fields, records = HABIT_EXPORT_FIELDS, habit_records(Analytics(habit_tracker))
+    else:
+        fields, records = EVENT_EXPORT_FIELDS, event_records(habit_tracker)
+
+    exported = 0
+    if file_format == "csv":
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        for record in records:
+            writer.writerow(record)
+            exported += 1
+    else:
+        for record in records:
+            file.write(json.dumps(record) + "\n")
+            exported += 1
+    pool.release(conn)
+    pool.close()
+    click.echo(f"Exported {exported} {data}.", err=True)
+
+def database_size(conn):
+    """
+    Get the size of the database in bytes.
+    """
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return page_count * page_size
+
+@cli.command()
+@click.pass_obj
+def compact(settings):
+    """
+    Remove duplicate completions and events of deleted habits, then reclaim their space.
+
+    Databases from before the unique completion key cannot be upgraded
+    while a habit period has several completions; all but the first
+    completion of a habit per period are removed here and the database is
+    upgraded. The whole database is compacted, regardless of --user.
+    """
+    from schema import MigrationError, migrate, remove_duplicate_events
+    pool = open_pool(settings, upgrade=False)
+    conn = pool.acquire()
+    duplicates = 0
+    try:
+        migrate(conn)
+    except MigrationError:
+        with conn:
+            duplicates = remove_duplicate_events(conn)
+        migrate(conn)
+    orphans = HabitTracker(conn, conn.cursor()).compact_events()
+    size_before = database_size(conn)
+    conn.execute("VACUUM")
+    size_after = database_size(conn)
+    print(f"Removed {duplicates} duplicate and {orphans} orphaned events, "
+          f"reclaimed {(size_before - size_after) // 1024} KiB.")
+    pool.release(conn)
+    pool.close()
+
+@cli.command()
+@click.option("--before", type=click.DateTime(formats=["%Y-%m-%d"]), default=None,
+              help="Archive the years before the year of this date; the current year by default.")
+@click.pass_obj
+def archive(settings, before):
+    """
+    Fold the events of closed years into compact per-year bitmaps.
+    """
+    pool = open_pool(settings)
+    conn = pool.acquire()
+    habit_tracker = HabitTracker(conn, conn.cursor(), user=settings["user"])
+    archived = habit_tracker.archive_events(before)
+    print(f"Archived {archived} events.")
+    pool.release(conn)
+    pool.close()
+
+@cli.command()
+@click.option("--host", default="127.0.0.1", show_default=True, help="The address to listen on.")
+@click.option("--port", default=8080, show_default=True, help="The port to listen on.")
+@click.option("--pool-size", default=DEFAULT_POOL_SIZE, show_default=True, help="Pooled database connections.")
+@click.option("--verbose", is_flag=True, help="Log every request.")
+@click.pass_obj
+def serve(settings, host, port, pool_size, verbose):
+    """
+    Serve habits, completions and reports as an HTTP/JSON API.
+    """
+    from server import HabitAPIServer
+    pool = open_pool(settings, size=pool_size)
+    api_server = HabitAPIServer(pool, host, port, user=settings["user"], verbose=verbose)
+    click.echo(f"Serving the habit tracker API on http://{host}:{api_server.server_port}", err=True)
+    try:
+        api_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api_server.server_close()
+        pool.close()
 
 cli.add_command(main)
 
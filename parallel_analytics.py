@@ -0,0 +1,122 @@
+import os
+import pathlib
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from habit_tracker import HabitTracker
+from habitevent import day_streak_stats
+from repository import STATEMENT_CACHE_SIZE
+
+# Define the default number of worker processes
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+# Habits below this count are processed serially; starting workers costs more than it saves
+DEFAULT_SERIAL_THRESHOLD = 5000
+
+
+def read_only_connection(db_name):
+    """
+    Open a read-only connection to a database file.
+    """
+    return sqlite3.connect(f"{pathlib.Path(db_name).resolve().as_uri()}?mode=ro", uri=True,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+
+
+def database_file(conn):
+    """
+    Get the file of a connection's main database.
+
+    Returns:
+        str: The path of the file, or None for in-memory and temporary databases.
+    """
+    for _, name, path in conn.execute("PRAGMA database_list"):
+        if name == "main":
+            return path or None
+    return None
+
+
+def id_ranges(min_id, max_id, parts):
+    """
+    Split the habit IDs from min_id to max_id into contiguous ranges of about equal width.
+
+    Returns:
+        list: (first ID, last ID) tuples covering the IDs in order.
+    """
+    width = max(1, -(-(max_id - min_id + 1) // parts))
+    return [(first, min(first + width - 1, max_id)) for first in range(min_id, max_id + 1, width)]
+
+
+def longest_streaks_in_range(db_name, min_id, max_id, user=None):
+    """
+    Compute the longest streak of the habits in one ID range on a worker's own read-only connection.
+
+    Returns:
+        list: (Habit, int) tuples ordered by habit ID.
+    """
+    conn = read_only_connection(db_name)
+    try:
+        habit_tracker = HabitTracker(conn, conn.cursor(), user=user)
+        habits, event_store = habit_tracker.load_event_store(min_id, max_id)
+        return [(habit, day_streak_stats(habit, event_store.days_for(habit.id))[0]) for habit in habits]
+    finally:
+        conn.close()
+
+
+class ParallelAnalytics:
+    """
+    ParallelAnalytics class to compute streaks from the event history on a pool of worker processes.
+
+    Habits are partitioned by ID range; each worker reads its range with
+    load_event_store on its own read-only connection and the partial
+    results are merged in ID order. Small datasets and in-memory databases
+    are processed serially in the calling process.
+    """
+    def __init__(self, habit_tracker, workers=DEFAULT_WORKERS, serial_threshold=DEFAULT_SERIAL_THRESHOLD):
+        """
+        Initialize ParallelAnalytics with a HabitTracker instance.
+
+        Args:
+            habit_tracker (HabitTracker): The tracker whose database and user scope are used.
+            workers (int): The number of worker processes.
+            serial_threshold (int): Datasets with fewer habits are processed serially.
+        """
+        self.habit_tracker = habit_tracker
+        self.workers = workers
+        self.serial_threshold = serial_threshold
+
+    def get_longest_streaks(self):
+        """
+        Get the longest streak of every habit from the event history.
+
+        Returns:
+            list: A list of (Habit, int) tuples ordered by habit id, as Analytics.get_longest_streaks.
+        """
+        min_id, max_id, count = self.habit_tracker.repository.get_habit_id_bounds()
+        if not count:
+            return []
+
+        db_name = database_file(self.habit_tracker.conn)
+        if self.workers <= 1 or count < self.serial_threshold or db_name is None:
+            habits, event_store = self.habit_tracker.load_event_store()
+            return [(habit, day_streak_stats(habit, event_store.days_for(habit.id))[0]) for habit in habits]
+
+        ranges = id_ranges(min_id, max_id, self.workers)
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(ranges))) as executor:
+            partials = executor.map(longest_streaks_in_range, [db_name] * len(ranges),
+                                    [first for first, _ in ranges], [last for _, last in ranges],
+                                    [self.habit_tracker.user] * len(ranges))
+            return [result for partial in partials for result in partial]
+
+    def get_longest_streak_all(self):
+        """
+        Get the habit with the longest streak in its event history and the length of the streak.
+
+        Ties go to the habit with the lowest ID, as in Analytics.get_longest_streak_all.
+
+        Returns:
+            tuple: The Habit object with the longest streak and the length of the streak, or (None, 0).
+        """
+        best_habit, best_streak = None, 0
+        for habit, streak in self.get_longest_streaks():
+            if streak > best_streak:
+                best_habit, best_streak = habit, streak
+        return best_habit, best_streak
@@ -0,0 +1,228 @@
+"""
+Query tracing and N+1 detection for the database layer.
+
+Connections opened with connect() (or by a ConnectionPool given a tracer)
+record every statement with its wall time, the number of rows returned and
+the HabitTracker/Analytics method that ran it. Tracing is enabled in the CLI
+with the --profile flag or the HABIT_TRACKER_PROFILE environment variable.
+"""
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+
+# Classes whose methods are reported as callers
+TRACED_CLASSES = ("HabitRepository", "HabitTracker", "Analytics")
+
+# Number of runs of the same statement inside one call that are reported as N+1
+DEFAULT_REPEAT_THRESHOLD = 5
+
+QueryRecord = namedtuple("QueryRecord", ["sql", "seconds", "rows", "caller", "entry_point", "call_id"])
+
+
+def normalize_sql(sql):
+    """
+    Reduce a statement to its shape so near-identical statements compare equal.
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sql)
+    return " ".join(sql.split())
+
+
+class QueryTracer:
+    """
+    QueryTracer class to collect statement timings and detect repeated queries.
+    """
+    def __init__(self, repeat_threshold=DEFAULT_REPEAT_THRESHOLD):
+        """
+        Initialize an empty tracer.
+
+        Args:
+            repeat_threshold (int): Runs of one statement inside one call that count as N+1.
+        """
+        self.repeat_threshold = repeat_threshold
+        self.records = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._call_ids = 0
+
+    def _find_callers(self):
+        """
+        Find the innermost and outermost traced method on the current stack.
+
+        Returns:
+            tuple: (caller name, entry point name, call ID); names are None outside traced classes.
+        """
+        caller = entry_frame = None
+        frame = sys._getframe(3)
+        while frame is not None:
+            instance = frame.f_locals.get("self")
+            if instance is not None and type(instance).__name__ in TRACED_CLASSES:
+                if caller is None:
+                    caller = f"{type(instance).__name__}.{frame.f_code.co_name}"
+                entry_frame = frame
+            frame = frame.f_back
+        if entry_frame is None:
+            return None, None, None
+
+        local = self._local
+        if getattr(local, "entry_frame", None) is not entry_frame:
+            with self._lock:
+                self._call_ids += 1
+                local.call_id = self._call_ids
+            local.entry_frame = entry_frame
+        entry_point = f"{type(entry_frame.f_locals['self']).__name__}.{entry_frame.f_code.co_name}"
+        return caller, entry_point, local.call_id
+
+    def start(self, sql):
+        """
+        Start recording a statement.
+
+        Returns:
+            list: The mutable record [sql, seconds, rows, caller, entry point, call ID].
+        """
+        caller, entry_point, call_id = self._find_callers()
+        record = [sql, 0.0, 0, caller, entry_point, call_id]
+        with self._lock:
+            self.records.append(record)
+        return record
+
+    def summary(self):
+        """
+        Aggregate the recorded statements per caller and statement shape.
+
+        Returns:
+            list: Dictionaries with caller, sql, count, total seconds and rows, slowest first.
+        """
+        totals = {}
+        with self._lock:
+            records = [QueryRecord(*record) for record in self.records]
+        for record in records:
+            key = (record.caller, normalize_sql(record.sql))
+            total = totals.setdefault(key, {"caller": record.caller, "sql": key[1], "count": 0, "seconds": 0.0, "rows": 0})
+            total["count"] += 1
+            total["seconds"] += record.seconds
+            total["rows"] += record.rows
+        return sorted(totals.values(), key=lambda total: total["seconds"], reverse=True)
+
+    def detect_repeated_queries(self):
+        """
+        Flag statements run repeatedly inside one high-level call, the typical N+1 pattern.
+
+        Returns:
+            list: Dictionaries with entry point, caller, sql and count of each finding.
+        """
+        counts = {}
+        with self._lock:
+            records = [QueryRecord(*record) for record in self.records]
+        for record in records:
+            if record.call_id is None:
+                continue
+            key = (record.call_id, record.entry_point, record.caller, normalize_sql(record.sql))
+            counts[key] = counts.get(key, 0) + 1
+        findings = [{"entry_point": entry_point, "caller": caller, "sql": sql, "count": count}
+                    for (call_id, entry_point, caller, sql), count in counts.items()
+                    if count >= self.repeat_threshold]
+        return sorted(findings, key=lambda finding: finding["count"], reverse=True)
+
+    def report(self):
+        """
+        Format the summary and the N+1 findings as text.
+        """
+        lines = ["Query profile:",
+                 f"{'calls':>7} {'total ms':>10} {'rows':>8}  caller / statement"]
+        for total in self.summary():
+            lines.append(f"{total['count']:>7} {total['seconds'] * 1000:>10.3f} {total['rows']:>8}  "
+                         f"{total['caller'] or '-'}: {total['sql'][:80]}")
+        findings = self.detect_repeated_queries()
+        if findings:
+            lines.append("Repeated queries (possible N+1):")
+            for finding in findings:
+                lines.append(f"  {finding['entry_point']} ran {finding['count']} times via "
+                             f"{finding['caller']}: {finding['sql'][:80]}")
+        return "\n".join(lines)
+
+
+class TracingCursor(sqlite3.Cursor):
+    """
+    TracingCursor class to record statements and fetched rows on the connection's tracer.
+    """
+    _record = None
+
+    def _trace(self, method, sql, *args):
+        self._record = self.connection.tracer.start(sql)
+        start = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            self._record[1] += time.perf_counter() - start
+
+    def execute(self, sql, parameters=()):
+        return self._trace(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._trace(super().executemany, sql, seq_of_parameters)
+
+    def _fetched(self, start, rows):
+        if self._record is not None:
+            self._record[1] += time.perf_counter() - start
+            self._record[2] += rows
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        row = super().__next__()
+        self._fetched(start, 1)
+        return row
+
+
+class TracingConnection(sqlite3.Connection):
+    """
+    TracingConnection class whose cursors record their statements on a QueryTracer.
+    """
+    tracer = None
+
+    def cursor(self, factory=TracingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connect(db_name, tracer, **kwargs):
+    """
+    Open a connection that records its statements on the given tracer.
+
+    Args:
+        db_name (str): The name of the database file.
+        tracer (QueryTracer): The tracer collecting the statements.
+        kwargs: Further sqlite3.connect arguments.
+
+    Returns:
+        TracingConnection: The connection.
+    """
+    conn = sqlite3.connect(db_name, factory=TracingConnection, **kwargs)
+    conn.tracer = tracer
+    return conn
@@ -0,0 +1,680 @@
+"""
+Data access for habits, habit events, rollups and the event archive.
+
+All statements run by HabitTracker and Analytics live in this module.
+Their text only depends on the shape of a call, never on its values, so
+the statement cache of each connection (see STATEMENT_CACHE_SIZE) hands
+back the prepared statement instead of parsing the SQL again. Rows are
+mapped by column name with row factories, either to Habit and HabitEvent
+objects or to lightweight HabitRow and EventRow tuples for callers that
+only read a few fields.
+"""
+from collections import namedtuple
+from habit import Habit
+from habitevent import HabitEvent
+from schema import EVENT_PERIOD_SQL, rebuild_rollups
+
+# Number of prepared statements kept per connection; sqlite3 keeps 128 by default
+STATEMENT_CACHE_SIZE = 256
+
+# Upper bound for name prefix ranges; sorts after any character that may follow the prefix
+MAX_CHARACTER = "\U0010ffff"
+
+# Habit columns, named as the keyword arguments of Habit
+HABIT_FIELDS = ("id", "name", "task", "periodicity", "creation_day", "completion_day", "streak", "created_by",
+                "demoData", "longest_streak", "last_period")
+HABIT_COLUMNS = ", ".join(HABIT_FIELDS)
+
+# Event columns, named as the keyword arguments of HabitEvent
+EVENT_FIELDS = ("habitID", "eventDay", "isInPeriod", "demoData")
+
+# Lightweight results: tuples whose fields are read like the attributes of Habit and HabitEvent
+HabitRow = namedtuple("HabitRow", HABIT_FIELDS)
+EventRow = namedtuple("EventRow", EVENT_FIELDS)
+
+HABIT_INSERT = '''INSERT INTO habits (id, name, task, periodicity, creation_date, completion_date, streak, created_by,
+                                      demoData, creation_day, completion_day)
+                  VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+
+# Inserts a completion (parameters: date, day, isInPeriod, habit ID) unless its period is already completed.
+# The unique (habitId, period) key only covers live events; archived periods are found in the rollups,
+# which keep a row for every completed period when events are archived
+EVENT_INSERT = f'''INSERT INTO habit_events (habitID, date, day, period, isInPeriod)
+                    SELECT h.id, e.date, e.day, {EVENT_PERIOD_SQL}, e.isInPeriod
+                    FROM habits h JOIN (SELECT ? AS date, ? AS day, ? AS isInPeriod) e
+                    WHERE h.id = ?
+                      AND NOT EXISTS (SELECT 1 FROM habit_period_rollups r
+                                      WHERE r.habitId = h.id AND r.period = {EVENT_PERIOD_SQL})
+                    ON CONFLICT (habitId, period) DO NOTHING'''
+
+# Loads an event with a known period unless it is completed, archived periods included; the rollups are rebuilt
+# afterwards
+EVENT_IMPORT = '''INSERT INTO habit_events (habitID, date, day, period, isInPeriod, demoData)
+                   SELECT ?1, ?2, ?3, ?4, ?5, ?6
+                   WHERE NOT EXISTS (SELECT 1 FROM habit_period_rollups WHERE habitId = ?1 AND period = ?4)
+                   ON CONFLICT (habitId, period) DO NOTHING'''
+
+# Marks the period of a completion day (parameters: day, habit ID) as completed in the rollups
+ROLLUP_INSERT = f'''INSERT INTO habit_period_rollups (habitId, period, completions)
+                     SELECT h.id, {EVENT_PERIOD_SQL}, 1
+                     FROM habits h JOIN (SELECT ? AS day) e
+                     WHERE h.id = ?
+                     ON CONFLICT (habitId, period) DO NOTHING'''
+
+# Deletes the history of the habit with an ID or a user and name (parameters: ID, created_by, name)
+HISTORY_DELETES = [f"DELETE FROM {table} WHERE habitId IN "
+                   "(SELECT id FROM habits WHERE id = ? OR (created_by = ? AND name = ?))"
+                   for table in ("habit_events", "habit_period_rollups", "habit_event_archive")]
+
+STREAK_UPDATE = '''UPDATE habits
+                   SET streak = ?, longest_streak = ?, last_period = ?
+                   WHERE id = ?'''
+
+# Advances the streak of a habit from its stored columns for a completion (parameters: period, habit ID);
+# completions in an already counted or earlier period leave the columns unchanged
+STREAK_ADVANCE = '''UPDATE habits
+                    SET streak = CASE WHEN last_period >= ?1 THEN streak
+                                      WHEN last_period = ?1 - 1 THEN streak + 1
+                                      ELSE 1 END,
+                        longest_streak = MAX(COALESCE(longest_streak, 0),
+                                             CASE WHEN last_period >= ?1 THEN streak
+                                                  WHEN last_period = ?1 - 1 THEN streak + 1
+                                                  ELSE 1 END),
+                        last_period = MAX(COALESCE(last_period, ?1), ?1)
+                    WHERE id = ?2
+                    RETURNING streak, longest_streak, last_period'''
+
+ARCHIVE_REPLACE = '''INSERT OR REPLACE INTO habit_event_archive (habitId, year, first_day, days)
+                     VALUES (?, ?, ?, ?)'''
+
+# Statements filled with the user scope of a repository; {scope} is a condition on habits.created_by
+# Two rows are fetched so that a name shared by habits of several users is reported as ambiguous
+HABIT_BY_NAME = f"SELECT {HABIT_COLUMNS} FROM habits WHERE name = ? AND {{scope}} LIMIT 2"
+# Names shared by habits of several users map to no single ID and are left out
+HABIT_IDS = "SELECT name, MIN(id) FROM habits WHERE {scope} GROUP BY name HAVING COUNT(*) = 1"
+HABIT_ID_BOUNDS = "SELECT MIN(id), MAX(id), COUNT(*) FROM habits WHERE {scope}"
+ALL_HABITS = f"SELECT {HABIT_COLUMNS} FROM habits WHERE {{scope}} ORDER BY id"
+DEMO_HABITS = f"SELECT {HABIT_COLUMNS} FROM habits WHERE demoData = 1 AND {{scope}}"
+LONGEST_STREAK_HABIT = f'''SELECT {HABIT_COLUMNS} FROM habits
+                           WHERE longest_streak > 0 AND {{scope}}
+                           ORDER BY longest_streak DESC, id
+                           LIMIT 1'''
+TASK_UPDATE = '''UPDATE habits
+                 SET task = ?
+                 WHERE id = ? AND {scope}'''
+HABIT_DELETES = ["DELETE FROM habit_events WHERE habitId IN (SELECT id FROM habits WHERE id = ? AND {scope})",
+                 "DELETE FROM habit_period_rollups WHERE habitId IN (SELECT id FROM habits WHERE id = ? AND {scope})",
+                 "DELETE FROM habit_event_archive WHERE habitId IN (SELECT id FROM habits WHERE id = ? AND {scope})",
+                 "DELETE FROM habits WHERE id = ? AND {scope}"]
+ARCHIVE_BEFORE = '''SELECT habitId, year, days FROM habit_event_archive
+                    WHERE year < ? AND habitId IN (SELECT id FROM habits WHERE {scope})'''
+EVENT_DAYS_BEFORE = '''SELECT habitId, day FROM habit_events
+                       WHERE day < ? AND habitId IN (SELECT id FROM habits WHERE {scope})'''
+EVENTS_DELETE_BEFORE = '''DELETE FROM habit_events
+                          WHERE day < ? AND habitId IN (SELECT id FROM habits WHERE {scope})'''
+
+
+def habit_factory(cursor, row):
+    """
+    Row factory mapping HABIT_COLUMNS rows to Habit objects.
+    """
+    (id, name, task, periodicity, creation_day, completion_day, streak, created_by, demoData, longest_streak,
+     last_period) = row
+    return Habit(id=id, name=name, task=task, periodicity=periodicity, creation_day=creation_day,
+                 completion_day=completion_day, streak=streak, created_by=created_by, demoData=demoData,
+                 longest_streak=longest_streak, last_period=last_period)
+
+
+def habit_from_row(row):
+    """
+    Create a Habit object from a row starting with the HABIT_COLUMNS; further columns are ignored.
+    """
+    return habit_factory(None, row[:len(HABIT_FIELDS)])
+
+
+def habit_row_factory(cursor, row):
+    """
+    Row factory mapping HABIT_COLUMNS rows to HabitRow tuples.
+    """
+    return HabitRow._make(row)
+
+
+def event_factory(cursor, row):
+    """
+    Row factory mapping rows of the EVENT_FIELDS to HabitEvent objects.
+    """
+    habitID, eventDay, isInPeriod, demoData = row
+    return HabitEvent(habitID=habitID, eventDay=eventDay, isInPeriod=isInPeriod, demoData=demoData)
+
+
+def event_row_factory(cursor, row):
+    """
+    Row factory mapping rows of the EVENT_FIELDS to EventRow tuples.
+    """
+    return EventRow._make(row)
+
+
+class AmbiguousHabitError(ValueError):
+    """
+    Raised when a habit name of a tracker for all users matches habits of several users.
+    """
+    def __init__(self, habit_name):
+        super().__init__(f"Habit name '{habit_name}' is used by several users; select a user")
+        self.habit_name = habit_name
+
+
+class HabitRepository:
+    """
+    HabitRepository class to run the statements of the habit tracker on one connection.
+
+    Writes go through the cursor passed in, so callers control the
+    transaction; reads that are consumed lazily get a cursor of their own.
+    """
+    def __init__(self, conn, cursor=None, user=None):
+        """
+        Initialize the repository on a connection.
+
+        Args:
+            conn (sqlite3.Connection): The database connection.
+            cursor (sqlite3.Cursor): The cursor for writes and eager reads; a new one is created if omitted.
+            user (str): Limit all statements to the habits created by this user; None for all users.
+        """
+        self.conn = conn
+        self.cursor = cursor if cursor is not None else conn.cursor()
+        self.user = user
+        self._statements = {}
+
+    def user_scope(self, column="created_by"):
+        """
+        Get the SQL condition limiting a statement to the repository's user.
+
+        Args:
+            column (str): The created_by column, qualified if the statement joins tables.
+
+        Returns:
+            tuple: The condition ("1" for all users) and its parameters.
+        """
+        if self.user is None:
+            return "1", ()
+        return f"{column} = ?", (self.user,)
+
+    def _scoped(self, sql):
+        """
+        Fill the user scope into a statement and its parameters; the text is built once per repository.
+
+        Returns:
+            tuple: The statement and the parameters of the scope.
+        """
+        statement = self._statements.get(sql)
+        scope, scope_params = self.user_scope()
+        if statement is None:
+            statement = self._statements[sql] = sql.format(scope=scope)
+        return statement, scope_params
+
+    def _reader(self, row_factory=None):
+        """
+        Open a cursor for a read that may be consumed while other statements run.
+        """
+        cursor = self.conn.cursor()
+        cursor.row_factory = row_factory
+        return cursor
+
+    def has_habits_table(self):
+        """
+        Check if the habits table exists.
+        """
+        self.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'habits'")
+        return self.cursor.fetchone() is not None
+
+    def begin_immediate(self):
+        """
+        Start a transaction holding the write lock from the first statement on.
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def insert_habit(self, habit):
+        """
+        Insert a habit.
+
+        Returns:
+            int: The row ID of the new habit.
+        """
+        self.cursor.execute(HABIT_INSERT, self._habit_params(habit))
+        return self.cursor.lastrowid
+
+    def insert_habits(self, habits, replace=False):
+        """
+        Insert many habits with executemany.
+
+        Args:
+            habits (iterable): Habit objects.
+            replace (bool): Replace existing habits with the same ID or the same user and name.
+        """
+        sql = HABIT_INSERT.replace("INSERT INTO", "INSERT OR REPLACE INTO", 1) if replace else HABIT_INSERT
+        self.cursor.executemany(sql, (self._habit_params(habit) for habit in habits))
+
+    def _habit_params(self, habit):
+        """
+        Get the parameters of HABIT_INSERT for a habit.
+        """
+        return (habit.id, habit.name, habit.task, habit.periodicity, habit.creation_date.strftime("%Y-%m-%d"),
+                habit.completion_date.strftime("%Y-%m-%d") if habit.completion_date else None,
+                habit.streak, habit.created_by, habit.demoData, habit.creation_day, habit.completion_day)
+
+    def update_task(self, habit_id, task):
+        """
+        Write the task of a habit.
+        """
+        sql, scope_params = self._scoped(TASK_UPDATE)
+        self.cursor.execute(sql, (task, habit_id, *scope_params))
+
+    def delete_habit(self, habit_id):
+        """
+        Delete a habit with its events, rollups and archive rows.
+        """
+        for template in HABIT_DELETES:
+            sql, scope_params = self._scoped(template)
+            self.cursor.execute(sql, (habit_id, *scope_params))
+
+    def advance_streak(self, habit_id, period):
+        """
+        Advance the streak columns of a habit for a completion in a period, reading them from the stored row.
+
+        Returns:
+            tuple: The stored streak, longest streak and last period.
+        """
+        return self.cursor.execute(STREAK_ADVANCE, (period, habit_id)).fetchone()
+
+    def update_streaks(self, updates):
+        """
+        Write the streak columns of many habits.
+
+        Args:
+            updates (iterable): (streak, longest streak, last period, habit ID) tuples.
+        """
+        self.cursor.executemany(STREAK_UPDATE, updates)
+
+    def get_habit(self, habit_name):
+        """
+        Get a habit by its name.
+
+        Returns:
+            Habit: The Habit object, or None if no habit has this name.
+
+        Raises:
+            AmbiguousHabitError: The repository is not limited to a user and habits of several users have the name.
+        """
+        sql, scope_params = self._scoped(HABIT_BY_NAME)
+        habits = self._reader(habit_factory).execute(sql, (habit_name, *scope_params)).fetchall()
+        if len(habits) > 1:
+            raise AmbiguousHabitError(habit_name)
+        return habits[0] if habits else None
+
+    def get_habit_ids(self):
+        """
+        Map habit names to their database IDs, leaving out names used by several users.
+        """
+        sql, scope_params = self._scoped(HABIT_IDS)
+        self.cursor.execute(sql, scope_params)
+        return dict(self.cursor.fetchall())
+
+    def get_habit_id_bounds(self):
+        """
+        Get the lowest and highest habit ID and the number of habits.
+        """
+        sql, scope_params = self._scoped(HABIT_ID_BOUNDS)
+        self.cursor.execute(sql, scope_params)
+        return self.cursor.fetchone()
+
+    def iter_habits(self, batch_size, as_tuples=False):
+        """
+        Iterate over all habits ordered by ID, fetching batch_size rows per round trip.
+
+        Yields:
+            Habit: The habits, or HabitRow tuples if as_tuples.
+        """
+        sql, scope_params = self._scoped(ALL_HABITS)
+        cursor = self._reader(habit_row_factory if as_tuples else habit_factory)
+        cursor.execute(sql, scope_params)
+        while True:
+            habits = cursor.fetchmany(batch_size)
+            if not habits:
+                return
+            yield from habits
+
+    def query_habits(self, periodicity=None, created_by=None, demo=None, active=None, as_of_day=None,
+                     name_prefix=None, after_id=None, limit=None, as_tuples=False):
+        """
+        Get one page of the habits matching the given filters, ordered by ID.
+
+        Filters left at None are not applied.
+
+        Args:
+            periodicity (str): Only habits with this periodicity.
+            created_by (str): Only habits created by this user.
+            demo (bool): Only demo habits (True) or only user habits (False).
+            active (bool): Only habits not completed before as_of_day (True) or only completed ones (False).
+            as_of_day (int): The day ordinal the active filter is evaluated at.
+            name_prefix (str): Only habits whose name starts with this prefix.
+            after_id (int): Only habits with a greater ID.
+            limit (int): The maximum number of habits; all if None.
+            as_tuples (bool): Return HabitRow tuples instead of Habit objects.
+        """
+        scope, scope_params = self.user_scope()
+        conditions = [scope]
+        params = list(scope_params)
+        if periodicity is not None:
+            conditions.append("periodicity = ?")
+            params.append(periodicity)
+        if created_by is not None:
+            conditions.append("created_by = ?")
+            params.append(created_by)
+        if demo is not None:
+            conditions.append("demoData = ?")
+            params.append(1 if demo else 0)
+        if active is not None:
+            if active:
+                conditions.append("(completion_day IS NULL OR completion_day >= ?)")
+            else:
+                conditions.append("completion_day < ?")
+            params.append(as_of_day)
+        if name_prefix:
+            conditions.append("name >= ? AND name < ?")
+            params.extend([name_prefix, name_prefix + MAX_CHARACTER])
+        if after_id is not None:
+            conditions.append("id > ?")
+            params.append(after_id)
+        params.append(-1 if limit is None else limit)
+        cursor = self._reader(habit_row_factory if as_tuples else habit_factory)
+        cursor.execute(f"SELECT {HABIT_COLUMNS} FROM habits WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?",
+                       params)
+        return cursor.fetchall()
+
+    def get_longest_streak_habit(self):
+        """
+        Get the habit with the highest longest_streak column, the lowest ID on ties, or None.
+        """
+        sql, scope_params = self._scoped(LONGEST_STREAK_HABIT)
+        return self._reader(habit_factory).execute(sql, scope_params).fetchone()
+
+    def get_demo_habits(self):
+        """
+        Get the demo habits.
+        """
+        sql, scope_params = self._scoped(DEMO_HABITS)
+        return self._reader(habit_factory).execute(sql, scope_params).fetchall()
+
+    def insert_event(self, row):
+        """
+        Insert a completion and mark its period in the rollups, unless the period is already completed.
+
+        Args:
+            row (tuple): (date, day, isInPeriod, habit ID).
+
+        Returns:
+            bool: True if the event was added.
+        """
+        self.cursor.execute(EVENT_INSERT, row)
+        if self.cursor.rowcount != 1:
+            return False
+        self.cursor.execute(ROLLUP_INSERT, (row[1], row[3]))
+        return True
+
+    def insert_events(self, rows):
+        """
+        Insert many completions and their rollups, skipping already completed periods.
+
+        Args:
+            rows (list): (date, day, isInPeriod, habit ID) tuples.
+
+        Returns:
+            int: The number of events added.
+        """
+        self.cursor.executemany(EVENT_INSERT, rows)
+        added = self.cursor.rowcount
+        self.cursor.executemany(ROLLUP_INSERT, {(day, habit_id) for _, day, _, habit_id in rows})
+        return added
+
+    def import_events(self, rows):
+        """
+        Insert events with executemany, consuming the rows lazily and skipping already completed periods.
+
+        The period rollups are not maintained; call rebuild_rollups afterwards.
+
+        Args:
+            rows (iterable): (habit ID, date, day, period, isInPeriod, demoData) tuples.
+
+        Returns:
+            int: The number of events added.
+        """
+        self.cursor.executemany(EVENT_IMPORT, rows)
+        return self.cursor.rowcount
+
+    def delete_history(self, habits):
+        """
+        Delete the events, rollups and archive rows of the stored habits with the ID, or the user and name, of the given ones.
+        """
+        keys = [(habit.id, habit.created_by, habit.name) for habit in habits]
+        for sql in HISTORY_DELETES:
+            self.cursor.executemany(sql, keys)
+
+    def delete_orphans(self):
+        """
+        Delete event, rollup and archive rows whose habit no longer exists.
+
+        Returns:
+            int: The number of event rows deleted.
+        """
+        self.cursor.execute("DELETE FROM habit_events WHERE habitId NOT IN (SELECT id FROM habits)")
+        removed = self.cursor.rowcount
+        self.cursor.execute("DELETE FROM habit_period_rollups WHERE habitId NOT IN (SELECT id FROM habits)")
+        self.cursor.execute("DELETE FROM habit_event_archive WHERE habitId NOT IN (SELECT id FROM habits)")
+        return removed
+
+    def rebuild_rollups(self, min_id=None, max_id=None):
+        """
+        Recompute the period rollups of the repository's habits from their events.
+
+        Args:
+            min_id (int): Only habits with at least this ID.
+            max_id (int): Only habits with at most this ID.
+        """
+        scope, scope_params = self._habit_range(min_id, max_id)
+        rebuild_rollups(self.conn, scope, tuple(scope_params))
+
+    def get_archive_before(self, year):
+        """
+        Get the archive rows of the years before the given one.
+
+        Returns:
+            list: (habit ID, year, days blob) tuples.
+        """
+        sql, scope_params = self._scoped(ARCHIVE_BEFORE)
+        return self._reader().execute(sql, (year, *scope_params)).fetchall()
+
+    def iter_event_days_before(self, day):
+        """
+        Iterate over the (habit ID, day) of the live events before a day ordinal.
+        """
+        sql, scope_params = self._scoped(EVENT_DAYS_BEFORE)
+        return self._reader().execute(sql, (day, *scope_params))
+
+    def replace_archive_rows(self, rows):
+        """
+        Write archive rows, replacing existing rows of the same habit and year.
+
+        Args:
+            rows (list): (habit ID, year, first day, days blob) tuples.
+        """
+        self.cursor.executemany(ARCHIVE_REPLACE, rows)
+
+    def delete_events_before(self, day):
+        """
+        Delete the live events before a day ordinal.
+
+        Returns:
+            int: The number of events deleted.
+        """
+        sql, scope_params = self._scoped(EVENTS_DELETE_BEFORE)
+        self.cursor.execute(sql, (day, *scope_params))
+        return self.cursor.rowcount
+
+    def get_habit_archive(self, habit_id):
+        """
+        Get a habit's archive rows as (first day, days blob) tuples.
+        """
+        self.cursor.execute("SELECT first_day, days FROM habit_event_archive WHERE habitId = ?", (habit_id,))
+        return self.cursor.fetchall()
+
+    def get_habit_days(self, habit_id):
+        """
+        Get the days of a habit's live events.
+        """
+        self.cursor.execute("SELECT day FROM habit_events WHERE habitId = ?", (habit_id,))
+        return [day for day, in self.cursor.fetchall()]
+
+    def iter_days_backwards(self, habit_id, until_day):
+        """
+        Iterate lazily over the days of a habit's live events up to a day, latest first.
+        """
+        cursor = self._reader()
+        cursor.execute('''SELECT day FROM habit_events
+                          WHERE habitId = ? AND day <= ?
+                          ORDER BY day DESC''', (habit_id, until_day))
+        return (day for day, in cursor)
+
+    def get_archive_backwards(self, habit_id, until_day):
+        """
+        Get a habit's archive rows starting on or before a day, latest year first.
+
+        Returns:
+            list: (first day, days blob) tuples.
+        """
+        cursor = self._reader()
+        cursor.execute('''SELECT first_day, days FROM habit_event_archive
+                          WHERE habitId = ? AND first_day <= ?
+                          ORDER BY year DESC''', (habit_id, until_day))
+        return cursor.fetchall()
+
+    def _habit_range(self, min_id, max_id):
+        """
+        Build the conditions on habits h selecting the scope and an optional ID range.
+        """
+        scope, scope_params = self.user_scope("h.created_by")
+        conditions = [scope]
+        params = list(scope_params)
+        if min_id is not None:
+            conditions.append("h.id >= ?")
+            params.append(min_id)
+        if max_id is not None:
+            conditions.append("h.id <= ?")
+            params.append(max_id)
+        return " AND ".join(conditions), params
+
+    def iter_habit_day_rows(self, min_id=None, max_id=None):
+        """
+        Iterate over the habits joined with the days of their live events, ordered by habit ID and day.
+
+        Yields:
+            tuple: The HABIT_COLUMNS of the habit followed by an event day, None for habits without events.
+        """
+        where, params = self._habit_range(min_id, max_id)
+        habit_columns = ", ".join(f"h.{column}" for column in HABIT_FIELDS)
+        return self._reader().execute(f'''SELECT {habit_columns}, e.day
+                                          FROM habits h LEFT JOIN habit_events e ON e.habitId = h.id
+                                          WHERE {where}
+                                          ORDER BY h.id, e.day''', params)
+
+    def iter_archive_rows(self, min_id=None, max_id=None):
+        """
+        Iterate over the archive rows of the habits in an ID range, ordered by habit ID and year.
+
+        Yields:
+            tuple: (habit ID, first day, days blob).
+        """
+        where, params = self._habit_range(min_id, max_id)
+        return self._reader().execute(f'''SELECT a.habitId, a.first_day, a.days
+                                          FROM habit_event_archive a JOIN habits h ON h.id = a.habitId
+                                          WHERE {where}
+                                          ORDER BY a.habitId, a.year''', params)
+
+    def get_archive_rows(self, habit_id=None, since=None, until=None):
+        """
+        Get the archive rows overlapping the given habit and date bounds.
+
+        Returns:
+            list: (habit ID, first day, days blob) tuples ordered by habit ID and year.
+        """
+        conditions = []
+        params = []
+        if self.user is not None:
+            conditions.append("h.created_by = ?")
+            params.append(self.user)
+        if habit_id is not None:
+            conditions.append("a.habitId = ?")
+            params.append(habit_id)
+        if since is not None:
+            conditions.append("a.year >= ?")
+            params.append(since.year)
+        if until is not None:
+            conditions.append("a.year <= ?")
+            params.append(until.year)
+        join = "JOIN habits h ON h.id = a.habitId" if self.user is not None else ""
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = self._reader()
+        cursor.execute(f'''SELECT a.habitId, a.first_day, a.days
+                           FROM habit_event_archive a {join}
+                           {where}
+                           ORDER BY a.habitId, a.year''', params)
+        return cursor.fetchall()
+
+    def iter_events(self, habit_id, batch_size, since_day=None, until_day=None, as_tuples=False):
+        """
+        Iterate over live events ordered by habit ID and day, fetching batch_size rows per round trip.
+
+        Args:
+            habit_id (int): The ID of the habit, or None for the events of all habits.
+            batch_size (int): The number of rows fetched per round trip.
+            since_day (int): Only events on or after this day ordinal.
+            until_day (int): Only events on or before this day ordinal.
+            as_tuples (bool): Yield EventRow tuples instead of HabitEvent objects.
+        """
+        conditions = []
+        params = []
+        if self.user is not None:
+            conditions.append("h.created_by = ?")
+            params.append(self.user)
+        if habit_id is not None:
+            conditions.append("e.habitId = ?")
+            params.append(habit_id)
+        if since_day is not None:
+            conditions.append("e.day >= ?")
+            params.append(since_day)
+        if until_day is not None:
+            conditions.append("e.day <= ?")
+            params.append(until_day)
+        join = "JOIN habits h ON h.id = e.habitId" if self.user is not None else ""
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = "e.day" if habit_id is not None else "e.habitId, e.day"
+        cursor = self._reader(event_row_factory if as_tuples else event_factory)
+        cursor.execute(f'''SELECT e.habitId, e.day, e.isInPeriod, e.demoData
+                           FROM habit_events e {join}
+                           {where}
+                           ORDER BY {order}''', params)
+        while True:
+            habit_events = cursor.fetchmany(batch_size)
+            if not habit_events:
+                return
+            yield from habit_events
+
+    def get_rollups(self, habit_id, first_period, last_period):
+        """
+        Get the completions of a habit's periods in a range.
+
+        Returns:
+            dict: Completions keyed by period; periods without completions are missing.
+        """
+        cursor = self._reader()
+        cursor.execute('''SELECT period, completions FROM habit_period_rollups
+                          WHERE habitId = ? AND period BETWEEN ? AND ?''', (habit_id, first_period, last_period))
+        return dict(cursor.fetchall())
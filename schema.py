@@ -0,0 +1,306 @@
+"""
+Versioned schema migrations for the habits database.
+
+The schema version is stored in the database header with PRAGMA user_version,
+so checking whether a database is current does not scan any table. Each
+migration step upgrades the schema by one version and runs in its own
+transaction together with the version bump.
+"""
+from collections import Counter
+from bitmap import bitmap_days, blob_to_bitmap
+from habit import DEFAULT_USER
+from habitevent import PERIOD_DAYS
+
+# Difference between an SQLite julianday() and a Python day ordinal
+JULIAN_DAY_OFFSET = 1721424.5
+
+
+def _create_base_tables(conn):
+    """
+    Create the habits and habit_events tables if they do not already exist.
+    """
+    conn.execute('''CREATE TABLE IF NOT EXISTS habits (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE,
+        task TEXT,
+        periodicity TEXT,
+        creation_date TEXT,
+        completion_date TEXT,
+        streak INTEGER DEFAULT 0,
+        created_by TEXT,
+        demoData BOOLEAN NOT NULL DEFAULT 0
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS habit_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        habitId INTEGER NOT NULL,
+        date DATE NOT NULL,
+        isInPeriod BOOLEAN NOT NULL DEFAULT 0,
+        demoData BOOLEAN NOT NULL DEFAULT 0
+    )''')
+
+
+def _add_streak_columns(conn):
+    """
+    Add the maintained streak columns to the habits table.
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(habits)")}
+    if "longest_streak" not in columns:
+        conn.execute("ALTER TABLE habits ADD COLUMN longest_streak INTEGER DEFAULT 0")
+    if "last_period" not in columns:
+        conn.execute("ALTER TABLE habits ADD COLUMN last_period INTEGER")
+
+
+def _add_indexes(conn):
+    """
+    Add indexes for event lookups by habit and date and for habit filters.
+    """
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_habit_events_habit_date ON habit_events (habitId, date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_habits_periodicity ON habits (periodicity)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_habits_demo ON habits (demoData)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_habits_created_by ON habits (created_by)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_habits_longest_streak ON habits (longest_streak)")
+
+
+def _add_day_columns(conn):
+    """
+    Store dates as integer day ordinals next to the TEXT dates.
+
+    The TEXT columns are kept in sync for external readers, while the
+    tracker reads and compares the integer columns only.
+    """
+    event_columns = {row[1] for row in conn.execute("PRAGMA table_info(habit_events)")}
+    if "day" not in event_columns:
+        conn.execute("ALTER TABLE habit_events ADD COLUMN day INTEGER")
+    conn.execute(f"UPDATE habit_events SET day = CAST(julianday(date) - {JULIAN_DAY_OFFSET} AS INTEGER)")
+
+    habit_columns = {row[1] for row in conn.execute("PRAGMA table_info(habits)")}
+    if "creation_day" not in habit_columns:
+        conn.execute("ALTER TABLE habits ADD COLUMN creation_day INTEGER")
+    if "completion_day" not in habit_columns:
+        conn.execute("ALTER TABLE habits ADD COLUMN completion_day INTEGER")
+    conn.execute(f"""UPDATE habits
+                     SET creation_day = CAST(julianday(creation_date) - {JULIAN_DAY_OFFSET} AS INTEGER),
+                         completion_day = CAST(julianday(completion_date) - {JULIAN_DAY_OFFSET} AS INTEGER)""")
+
+    conn.execute("DROP INDEX IF EXISTS idx_habit_events_habit_date")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_habit_events_habit_day ON habit_events (habitId, day)")
+
+
+def _unique_names_per_user(conn):
+    """
+    Make habit names unique per user instead of globally.
+
+    SQLite cannot drop a UNIQUE constraint, so the habits table is rebuilt
+    with UNIQUE (created_by, name). Habits without a creator are assigned to
+    the default user so the constraint applies to them as well.
+    """
+    columns = ("id, name, task, periodicity, creation_date, completion_date, streak, created_by, demoData, "
+               "longest_streak, last_period, creation_day, completion_day")
+    conn.execute(f'''CREATE TABLE habits_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        task TEXT,
+        periodicity TEXT,
+        creation_date TEXT,
+        completion_date TEXT,
+        streak INTEGER DEFAULT 0,
+        created_by TEXT NOT NULL DEFAULT '{DEFAULT_USER}',
+        demoData BOOLEAN NOT NULL DEFAULT 0,
+        longest_streak INTEGER DEFAULT 0,
+        last_period INTEGER,
+        creation_day INTEGER,
+        completion_day INTEGER,
+        UNIQUE (created_by, name)
+    )''')
+    conn.execute(f"""INSERT INTO habits_new ({columns})
+                     SELECT id, name, task, periodicity, creation_date, completion_date, streak,
+                            COALESCE(created_by, ?), demoData, longest_streak, last_period, creation_day, completion_day
+                     FROM habits""", (DEFAULT_USER,))
+    conn.execute("DROP TABLE habits")
+    conn.execute("ALTER TABLE habits_new RENAME TO habits")
+    conn.execute("CREATE INDEX idx_habits_periodicity ON habits (periodicity)")
+    conn.execute("CREATE INDEX idx_habits_demo ON habits (demoData)")
+    conn.execute("CREATE INDEX idx_habits_created_by ON habits (created_by)")
+    conn.execute("CREATE INDEX idx_habits_longest_streak ON habits (longest_streak)")
+
+
+# Period length of habit h in days in SQL
+PERIOD_DAYS_SQL = "(CASE h.periodicity WHEN 'weekly' THEN 7 ELSE 1 END)"
+
+# Period number of an event e of habit h in SQL, flooring like Python's // for days before creation
+EVENT_PERIOD_SQL = (f"(((e.day - h.creation_day) - ((((e.day - h.creation_day) % {PERIOD_DAYS_SQL}) + {PERIOD_DAYS_SQL})"
+                    f" % {PERIOD_DAYS_SQL})) / {PERIOD_DAYS_SQL})")
+
+
+def rebuild_rollups(conn, scope="1", scope_params=()):
+    """
+    Recompute the per-period completion rollups from the event history.
+
+    Archived years are expanded from their bitmaps, so their periods keep
+    their rollups. A period with both live and archived completions keeps
+    the larger count instead of counting it twice.
+
+    Args:
+        conn (sqlite3.Connection): The database connection.
+        scope (str): SQL condition on habits h selecting the habits to rebuild.
+        scope_params (tuple): The parameters of the condition.
+    """
+    conn.execute(f"DELETE FROM habit_period_rollups WHERE habitId IN (SELECT h.id FROM habits h WHERE {scope})",
+                 scope_params)
+    conn.execute(f"""INSERT INTO habit_period_rollups (habitId, period, completions)
+                     SELECT h.id, {EVENT_PERIOD_SQL}, COUNT(*)
+                     FROM habits h JOIN habit_events e ON e.habitId = h.id
+                     WHERE {scope}
+                     GROUP BY h.id, 2""", scope_params)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'habit_event_archive'").fetchone():
+        archived = Counter()
+        for habit_id, creation_day, periodicity, first_day, days in conn.execute(
+                f"""SELECT h.id, h.creation_day, h.periodicity, a.first_day, a.days
+                    FROM habits h JOIN habit_event_archive a ON a.habitId = h.id
+                    WHERE {scope}""", scope_params):
+            period_days = PERIOD_DAYS.get(periodicity, 1)
+            archived.update((habit_id, (day - creation_day) // period_days)
+                            for day in bitmap_days(blob_to_bitmap(days), first_day))
+        conn.executemany("""INSERT INTO habit_period_rollups (habitId, period, completions) VALUES (?, ?, ?)
+                            ON CONFLICT (habitId, period)
+                            DO UPDATE SET completions = MAX(completions, excluded.completions)""",
+                         ((habit_id, period, completions) for (habit_id, period), completions in archived.items()))
+
+
+def _add_period_rollups(conn):
+    """
+    Add the per-period completion rollups and fill them from the event history.
+    """
+    conn.execute('''CREATE TABLE IF NOT EXISTS habit_period_rollups (
+        habitId INTEGER NOT NULL,
+        period INTEGER NOT NULL,
+        completions INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (habitId, period)
+    ) WITHOUT ROWID''')
+    rebuild_rollups(conn)
+
+
+class MigrationError(Exception):
+    """
+    MigrationError class for data a migration step cannot upgrade without losing rows.
+    """
+
+
+def remove_duplicate_events(conn):
+    """
+    Delete all but the earliest recorded event of each habit period.
+
+    Duplicate events in a period are left by retried or repeated completions
+    in databases from before the unique (habitId, period) key. Events of
+    deleted habits have no period and are left for HabitTracker.compact_events.
+
+    Args:
+        conn (sqlite3.Connection): The database connection.
+
+    Returns:
+        int: The number of events deleted.
+    """
+    return conn.execute(f"""DELETE FROM habit_events
+                            WHERE habitId IN (SELECT id FROM habits)
+                              AND id NOT IN (SELECT MIN(e.id) FROM habit_events e JOIN habits h ON h.id = e.habitId
+                                             GROUP BY e.habitId, {EVENT_PERIOD_SQL})""").rowcount
+
+
+def _unique_event_periods(conn):
+    """
+    Record the habit period of each event and allow at most one event per habit and period.
+
+    Databases with duplicate events in a period are not upgraded; the
+    compact command removes the duplicates with remove_duplicate_events
+    and then upgrades them.
+    """
+    event_columns = {row[1] for row in conn.execute("PRAGMA table_info(habit_events)")}
+    if "period" not in event_columns:
+        conn.execute("ALTER TABLE habit_events ADD COLUMN period INTEGER")
+    conn.execute(f"""UPDATE habit_events
+                     SET period = (SELECT {EVENT_PERIOD_SQL.replace("e.day", "habit_events.day")}
+                                   FROM habits h WHERE h.id = habit_events.habitId)""")
+    duplicates = conn.execute("""SELECT COALESCE(SUM(events - 1), 0)
+                                 FROM (SELECT COUNT(*) AS events FROM habit_events
+                                       WHERE period IS NOT NULL GROUP BY habitId, period)""").fetchone()[0]
+    if duplicates:
+        raise MigrationError(f"{duplicates} habit events repeat a completed period; "
+                             "run 'python main.py compact' to remove them and upgrade the database")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_habit_events_habit_period ON habit_events (habitId, period)")
+    rebuild_rollups(conn)
+
+
+def _add_event_archive(conn):
+    """
+    Add the archive of closed years of habit history, one bitmap of completion days per habit and year.
+    """
+    conn.execute('''CREATE TABLE IF NOT EXISTS habit_event_archive (
+        habitId INTEGER NOT NULL,
+        year INTEGER NOT NULL,
+        first_day INTEGER NOT NULL,
+        days BLOB NOT NULL,
+        PRIMARY KEY (habitId, year)
+    ) WITHOUT ROWID''')
+
+
+def _index_habit_names(conn):
+    """
+    Index habit names for lookups by name across all users; the unique key only serves lookups with a user.
+    """
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_habits_name ON habits (name)")
+
+
+# Ordered migration steps; step N upgrades the schema to version N
+MIGRATIONS = [
+    _create_base_tables,
+    _add_streak_columns,
+    _add_indexes,
+    _add_day_columns,
+    _unique_names_per_user,
+    _add_period_rollups,
+    _unique_event_periods,
+    _add_event_archive,
+    _index_habit_names,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn):
+    """
+    Get the schema version recorded in the database header.
+
+    Args:
+        conn (sqlite3.Connection): The database connection.
+
+    Returns:
+        int: The schema version, 0 for databases never migrated.
+    """
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Apply all pending migration steps in order.
+
+    Databases created before versioning report version 0; every step is
+    written to be safe on such databases, so they are upgraded in place.
+    A step that raises MigrationError is rolled back, leaving the database
+    at the version before it.
+
+    Args:
+        conn (sqlite3.Connection): The database connection.
+
+    Returns:
+        int: The number of migration steps applied.
+
+    Raises:
+        MigrationError: A step cannot upgrade the data in place.
+    """
+    version = get_schema_version(conn)
+    for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute("BEGIN")
+        with conn:
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+    return max(SCHEMA_VERSION - version, 0)
@@ -0,0 +1,296 @@
+"""
+HTTP/JSON API over HabitTracker and Analytics.
+
+One long-lived process serves many clients: requests run on threads of a
+ThreadingHTTPServer and share one warm HabitCache. Reads borrow connections
+from a ConnectionPool; writes run one at a time on a dedicated writer
+connection, so its PRAGMA data_version tells writes of other processes, like
+the CLI, apart from the server's own, and only those drop the cache. Start
+it with `python main.py serve`.
+
+Endpoints:
+
+    GET  /habits?periodicity=&after_id=&limit=   one page of habits
+    POST /habits                                 add a habit {"name", "task", "periodicity"}
+    GET  /habits/<name>                          one habit with its streaks
+    POST /habits/<name>/completions              mark a habit as completed
+    GET  /habits/<name>/events?since=&until=     completion dates (YYYY-MM-DD)
+    GET  /habits/<name>/completion-rate?periods= completion rate and missed periods
+    GET  /reports/streaks                        current and longest streak of every habit
+    GET  /reports/longest-streak                 the habit with the longest streak
+    GET  /stats                                  habit cache counters
+"""
+import json
+import re
+import sqlite3
+import sys
+import threading
+import traceback
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from analytics import Analytics, DEFAULT_PAGE_SIZE, DEFAULT_WINDOW_PERIODS
+from connection import retry_on_busy
+from habit import Habit
+from habit_cache import HabitCache
+from habit_tracker import HabitTracker
+from habitevent import PERIOD_DAYS
+from repository import AmbiguousHabitError
+
+# Define defaults for the API server
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DATE_FORMAT = "%Y-%m-%d"
+
+
+class APIError(Exception):
+    """
+    APIError class for request errors answered with an HTTP status code and a message.
+    """
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def habit_to_dict(habit, analytics):
+    """
+    Convert a habit to its JSON representation.
+    """
+    return {
+        "id": habit.id,
+        "name": habit.name,
+        "task": habit.task,
+        "periodicity": habit.periodicity,
+        "creation_date": habit.creation_date.strftime(DATE_FORMAT),
+        "created_by": habit.created_by,
+        "current_streak": analytics.get_current_streak(habit),
+        "longest_streak": habit.longest_streak,
+    }
+
+
+def parse_date(value, name):
+    """
+    Parse a YYYY-MM-DD query parameter, None if it is missing.
+    """
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, DATE_FORMAT)
+    except ValueError:
+        raise APIError(400, f"Invalid {name}: {value}")
+
+
+def parse_int(value, name, default=None):
+    """
+    Parse an integer query parameter, default if it is missing.
+    """
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise APIError(400, f"Invalid {name}: {value}")
+
+
+class HabitAPIHandler(BaseHTTPRequestHandler):
+    """
+    HabitAPIHandler class to answer one HTTP request against the server's connection pool.
+    """
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without TCP_NODELAY keep-alive clients wait for delayed ACKs
+    disable_nagle_algorithm = True
+
+    # (method, path pattern, handler method name)
+    ROUTES = [
+        ("GET", re.compile(r"^/habits$"), "list_habits"),
+        ("POST", re.compile(r"^/habits$"), "add_habit"),
+        ("GET", re.compile(r"^/habits/([^/]+)$"), "get_habit"),
+        ("POST", re.compile(r"^/habits/([^/]+)/completions$"), "complete_habit"),
+        ("GET", re.compile(r"^/habits/([^/]+)/events$"), "get_events"),
+        ("GET", re.compile(r"^/habits/([^/]+)/completion-rate$"), "get_completion_rate"),
+        ("GET", re.compile(r"^/reports/streaks$"), "report_streaks"),
+        ("GET", re.compile(r"^/reports/longest-streak$"), "report_longest_streak"),
+        ("GET", re.compile(r"^/stats$"), "get_stats"),
+    ]
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        """
+        Route the request, run its handler on a pooled tracker and write the JSON response.
+        """
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            methods = [route_method for route_method, pattern, _ in self.ROUTES if pattern.match(url.path)]
+            if not methods:
+                raise APIError(404, f"No route for {url.path}")
+            if method not in methods:
+                raise APIError(405, f"Method {method} not allowed for {url.path}; use {', '.join(methods)}")
+            for route_method, pattern, handler_name in self.ROUTES:
+                match = pattern.match(url.path)
+                if match and route_method == method:
+                    args = [unquote(group) for group in match.groups()]
+                    body = self._read_body() if method == "POST" else None
+                    status, payload = retry_on_busy(self._call, method, handler_name, args, query, body)
+                    break
+        except APIError as e:
+            status, payload = e.status, {"error": e.message}
+        except (AmbiguousHabitError, sqlite3.IntegrityError) as e:
+            status, payload = 409, {"error": str(e)}
+        except Exception:
+            # The details stay in the server log; clients only learn that the request failed
+            traceback.print_exc(file=sys.stderr)
+            status, payload = 500, {"error": "Internal server error"}
+        self._send_json(status, payload)
+
+    def _call(self, method, handler_name, args, query, body):
+        """
+        Call a handler with a HabitTracker, on the writer connection for POST and a pooled one otherwise.
+
+        The habit cache is validated first, so writes made by other processes,
+        like the CLI, are never answered from stale cached habits.
+        """
+        server = self.server
+        handler = getattr(self, handler_name)
+        if method == "POST":
+            with server.write_lock:
+                server.validate_cache()
+                habit_tracker = HabitTracker(server.writer, server.writer.cursor(), server.habit_cache, server.user)
+                try:
+                    return handler(habit_tracker, *args, query=query, body=body)
+                finally:
+                    if server.writer.in_transaction:
+                        server.writer.rollback()
+        with server.pool.tracker(server.user, server.habit_cache) as habit_tracker:
+            server.validate_cache()
+            return handler(habit_tracker, *args, query=query, body=body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise APIError(400, "Request body is not valid JSON")
+        if not isinstance(body, dict):
+            raise APIError(400, "Request body must be a JSON object")
+        return body
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _require_habit(self, habit_tracker, habit_name):
+        habit = habit_tracker.get_habit(habit_name)
+        if habit is None:
+            raise APIError(404, f"Habit not found: {habit_name}")
+        return habit
+
+    def list_habits(self, habit_tracker, query, body):
+        analytics = Analytics(habit_tracker)
+        limit = parse_int(query.get("limit"), "limit", DEFAULT_PAGE_SIZE)
+        habits = analytics.query_habits(periodicity=query.get("periodicity"),
+                                        after_id=parse_int(query.get("after_id"), "after_id"), limit=limit)
+        return 200, {"habits": [habit_to_dict(habit, analytics) for habit in habits],
+                     "next_after_id": habits[-1].id if len(habits) == limit else None}
+
+    def add_habit(self, habit_tracker, query, body):
+        if not body.get("name") or body.get("periodicity") not in PERIOD_DAYS:
+            raise APIError(400, f"A habit needs a name and a periodicity out of {', '.join(PERIOD_DAYS)}")
+        habit_tracker.add_habit(Habit(id=None, name=body["name"], task=body.get("task", ""),
+                                      periodicity=body["periodicity"]))
+        return 201, habit_to_dict(habit_tracker.get_habit(body["name"]), Analytics(habit_tracker))
+
+    def get_habit(self, habit_tracker, habit_name, query, body):
+        return 200, habit_to_dict(self._require_habit(habit_tracker, habit_name), Analytics(habit_tracker))
+
+    def complete_habit(self, habit_tracker, habit_name, query, body):
+        habit = habit_tracker.mark_habit_completed(habit_name)
+        if habit is None:
+            raise APIError(404, f"Habit not found: {habit_name}")
+        return 200, habit_to_dict(habit, Analytics(habit_tracker))
+
+    def get_events(self, habit_tracker, habit_name, query, body):
+        habit = self._require_habit(habit_tracker, habit_name)
+        habit_events = habit_tracker.iter_habit_events(habit.id, since=parse_date(query.get("since"), "since"),
+                                                       until=parse_date(query.get("until"), "until"))
+        return 200, {"name": habit.name,
+                     "dates": [habit_event.eventDate.strftime(DATE_FORMAT) for habit_event in habit_events]}
+
+    def get_completion_rate(self, habit_tracker, habit_name, query, body):
+        habit = self._require_habit(habit_tracker, habit_name)
+        analytics = Analytics(habit_tracker)
+        periods = parse_int(query.get("periods"), "periods", DEFAULT_WINDOW_PERIODS)
+        return 200, {"name": habit.name,
+                     "periods": periods,
+                     "completion_rate": analytics.get_completion_rate(habit, periods),
+                     "missed_periods": [date.strftime(DATE_FORMAT)
+                                        for date in analytics.get_missed_periods(habit, periods)]}
+
+    def report_streaks(self, habit_tracker, query, body):
+        analytics = Analytics(habit_tracker)
+        return 200, [{"name": habit.name,
+                      "periodicity": habit.periodicity,
+                      "current_streak": analytics.get_current_streak(habit),
+                      "longest_streak": habit.longest_streak}
+                     for page in analytics.iter_habit_pages(as_tuples=True) for habit in page]
+
+    def report_longest_streak(self, habit_tracker, query, body):
+        habit, streak = Analytics(habit_tracker).get_longest_streak_all()
+        return 200, {"name": habit.name if habit else None, "longest_streak": streak}
+
+    def get_stats(self, habit_tracker, query, body):
+        return 200, {"habit_cache": self.server.habit_cache.stats()}
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class HabitAPIServer(ThreadingHTTPServer):
+    """
+    HabitAPIServer class to serve the JSON API from pooled connections and a shared habit cache.
+    """
+    daemon_threads = True
+
+    def __init__(self, pool, host=DEFAULT_HOST, port=DEFAULT_PORT, user=None, verbose=False):
+        """
+        Bind the server; call serve_forever to handle requests.
+
+        Args:
+            pool (ConnectionPool): The pool the request threads take their connections from.
+            host (str): The address to listen on.
+            port (int): The port to listen on; 0 picks a free port.
+            user (str): Scope all requests to this user's habits; None for all users.
+            verbose (bool): Log every request to stderr.
+        """
+        super().__init__((host, port), HabitAPIHandler)
+        self.pool = pool
+        self.user = user
+        self.verbose = verbose
+        self.habit_cache = HabitCache()
+        # Writes are serialized on one connection; SQLite only runs one writer at a time anyway
+        self.writer = pool.open_connection()
+        self.write_lock = threading.RLock()
+
+    def validate_cache(self):
+        """
+        Drop the habit cache if another process wrote to the database since the last request.
+        """
+        with self.write_lock:
+            self.habit_cache.validate(self.writer)
+
+    def server_close(self):
+        super().server_close()
+        self.writer.close()
@@ -1,7 +1,69 @@
+import random
 import sqlite3
 from datetime import datetime, timedelta
+import click
 from habit import Habit
-from habitevent import HabitEvent
+from habitevent import HabitEvent, day_period_index
+from habit_tracker import HabitTracker
+from repository import HabitRepository, STATEMENT_CACHE_SIZE
+from schema import migrate
+
+# Define date format as a constant
+DATE_FORMAT = "%Y-%m-%d"
+
+# Probability that a period of a synthetic habit is completed
+DEFAULT_DENSITY = 0.7
+
+
+def generate_habits(count, users=1, creation_date=None, seed=0):
+    """
+    Generate synthetic habits for benchmarks and test databases.
+
+    Args:
+        count (int): The number of habits; they get the IDs 1 to count.
+        users (int): The number of users the habits are spread over.
+        creation_date (datetime): The creation date of all habits.
+        seed (int): The seed of the random generator.
+
+    Returns:
+        list: A list of Habit objects.
+    """
+    rng = random.Random(seed)
+    creation_date = creation_date or datetime(2020, 1, 1)
+    return [Habit(id=number, name=f"Habit {number}", task=f"Task {number}",
+                  periodicity=rng.choice(["daily", "weekly"]), creation_date=creation_date,
+                  created_by=f"user{number % users}")
+            for number in range(1, count + 1)]
+
+
+def generate_habit_events(habits, days, density=DEFAULT_DENSITY, seed=0):
+    """
+    Generate synthetic completions for habits, one habit at a time.
+
+    Every daily habit is completed on a day, and every weekly habit in a week,
+    with probability density. Events are yielded lazily in date order per habit.
+
+    Args:
+        habits (list): The Habit objects to generate events for.
+        days (int): The number of days of history after each habit's creation date.
+        density (float): The probability that a period is completed.
+        seed (int): The seed of the random generator.
+
+    Yields:
+        HabitEvent: The generated events.
+    """
+    rng = random.Random(seed)
+    for habit in habits:
+        first_day = habit.creation_day
+        if habit.periodicity == "daily":
+            for day in range(first_day, first_day + days):
+                if rng.random() < density:
+                    yield HabitEvent(habitID=habit.id, eventDay=day)
+        else:
+            for week_start in range(first_day, first_day + days, 7):
+                if rng.random() < density:
+                    yield HabitEvent(habitID=habit.id, eventDay=week_start + rng.randrange(7))
+
 
 class Database:
     """
@@ -15,32 +77,14 @@ class Database:
         Args:
             db_name (str): The name of the database file.
         """
-        self.conn = sqlite3.connect(db_name)
+        self.conn = sqlite3.connect(db_name, cached_statements=STATEMENT_CACHE_SIZE)
         self.create_tables()
 
     def create_tables(self):
         """
-        Create the habits and habit_events tables if they do not already exist.
+        Create or upgrade the database schema by applying pending migrations.
         """
-        with self.conn:
-            self.conn.execute('''CREATE TABLE IF NOT EXISTS habits (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE,
-                task TEXT,
-                periodicity TEXT,
-                creation_date TEXT,
-                completion_date TEXT,
-                streak INTEGER DEFAULT 0,
-                created_by TEXT,
-                demoData BOOLEAN NOT NULL DEFAULT 0
-            )''')
-            self.conn.execute('''CREATE TABLE IF NOT EXISTS habit_events (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                habitId INTEGER NOT NULL,
-                date DATE NOT NULL,
-                isInPeriod BOOLEAN NOT NULL DEFAULT 0,
-                demoData BOOLEAN NOT NULL DEFAULT 0
-            )''')
+        migrate(self.conn)
 
     def demo_habits_with_events(self) -> list:
         """
@@ -77,7 +121,7 @@ class Database:
            if habit == demo_habits[0]:  # Painting
             habit.streak = 29 
            elif habit == demo_habits[1]:  # Reading
-            habit.streak = 15
+            habit.streak = 1
            elif habit == demo_habits[2]:  # Meditation
             habit.streak = 4
            elif habit == demo_habits[3]:  # Cooking
@@ -97,33 +141,138 @@ class Database:
         return demo_habits_with_events 
 
           
-    def preload_db(self):
+    def preload_db(self, quiet=False, replace=False):
         """
         Preloads the database with predefined demo habits and their corresponding events.
+
+        The demo habits have the IDs 1 to 5. With replace, habits already
+        stored under these IDs or the demo names are replaced, with their
+        history, so reloading restores the demo data instead of keeping
+        stale rows.
+
+        Args:
+            quiet (bool): Do not print the loaded habits.
+            replace (bool): Replace stored habits with the IDs or names of the demo habits.
         """
         demo_habits_with_events = self.demo_habits_with_events()
-        cursor = self.conn.cursor()
-        for habit, habit_events in demo_habits_with_events:
-            cursor.execute('''INSERT OR IGNORE INTO habits (id, name, task, periodicity, creation_date, completion_date, streak, created_by, demoData)
-                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                           (habit.id, habit.name, habit.task, habit.periodicity, habit.creation_date.strftime("%Y-%m-%d"),
-                            habit.completion_date.strftime("%Y-%m-%d"), habit.streak, habit.created_by, habit.demoData))
-            print(f" - Name: {habit.name}, Task: {habit.task}, Periodicity: {habit.periodicity}, Creation_date: {habit.creation_date.strftime("%Y-%m-%d")}, Completion_date: {habit.completion_date.strftime("%Y-%m-%d")}, Streak:{habit.streak}")
-            for habitEvent in habit_events:
-                cursor.execute('''INSERT OR IGNORE INTO habit_events (habitID, date, isInPeriod, demoData)
-                                  VALUES (?, ?, ?, ?)''',
-                               (habitEvent.habitID, habitEvent.eventDate.strftime("%Y-%m-%d"), habitEvent.isInPeriod, habitEvent.demoData))
-                print(f"Inserted event for habit: {habit.name} on {habitEvent.eventDate.strftime("%Y-%m-%d")}") 
-        self.conn.commit()
-        
-    
+        self.load_fixtures([habit for habit, _ in demo_habits_with_events],
+                           (habit_event for _, habit_events in demo_habits_with_events for habit_event in habit_events),
+                           replace=replace, quiet=quiet)
+
+    def load_fixtures(self, habits, habit_events=(), replace=False, quiet=True):
+        """
+        Load habits and their events with bulk inserts in a single transaction.
+
+        Events are consumed lazily by executemany, so a generator of
+        millions of events is loaded without holding them in memory. Events
+        of an already completed period are skipped. The streak columns and
+        the period rollups of the loaded ID range are rebuilt in the same
+        transaction once all rows are written.
+
+        Args:
+            habits (iterable): Habit objects with their IDs set.
+            habit_events (iterable): HabitEvent objects of the given habits.
+            replace (bool): Replace stored habits with the same ID, or the same user and name, and drop their history.
+            quiet (bool): Do not print the loaded habits and the number of events.
+
+        Returns:
+            tuple: The number of habits and of events loaded.
+
+        Raises:
+            sqlite3.IntegrityError: Without replace, if a habit ID or a user and name is already stored.
+        """
+        habits = list(habits)
+        repository = HabitRepository(self.conn)
+        habit_tracker = HabitTracker(self.conn, repository.cursor)
+        rows = self._event_rows(habit_events, {habit.id: habit for habit in habits})
+        with self.conn:
+            if replace:
+                repository.delete_history(habits)
+            repository.insert_habits(habits, replace=replace)
+            events = repository.import_events(rows)
+            if habits:
+                min_id, max_id = min(habit.id for habit in habits), max(habit.id for habit in habits)
+                repository.update_streaks(habit_tracker.streak_updates(min_id, max_id))
+                repository.rebuild_rollups(min_id, max_id)
+        if not quiet:
+            for habit in habits:
+                completion_date = habit.completion_date.strftime(DATE_FORMAT) if habit.completion_date else None
+                print(f" - Name: {habit.name}, Task: {habit.task}, Periodicity: {habit.periodicity}, "
+                      f"Creation_date: {habit.creation_date.strftime(DATE_FORMAT)}, Completion_date: {completion_date}, "
+                      f"Streak:{habit.streak}")
+            print(f"Inserted {events} events for {len(habits)} habits")
+        return len(habits), events
+
+    def _event_rows(self, habit_events, habits_by_id):
+        """
+        Convert habit events into EVENT_IMPORT rows, formatting each date once.
+
+        Raises:
+            ValueError: If an event refers to a habit that is not loaded.
+        """
+        date_texts = {}
+        for habit_event in habit_events:
+            day = habit_event.eventDay
+            habit = habits_by_id.get(habit_event.habitID)
+            if habit is None:
+                raise ValueError(f"Event of a habit that is not loaded: {habit_event.habitID}")
+            date_text = date_texts.get(day)
+            if date_text is None:
+                date_text = date_texts[day] = habit_event.eventDate.strftime(DATE_FORMAT)
+            yield (habit.id, date_text, day, day_period_index(habit, day), habit_event.isInPeriod, habit_event.demoData)
+
+    def load_synthetic(self, habits, users=1, days=365, density=DEFAULT_DENSITY, seed=0, replace=False, quiet=True):
+        """
+        Load synthetic habits with the given days of history up to today.
+
+        Args:
+            habits (int): The number of habits; they get the IDs 1 to habits.
+            users (int): The number of users the habits are spread over.
+            days (int): The number of days of history.
+            density (float): The probability that a period is completed.
+            seed (int): The seed of the random generator.
+            replace (bool): Replace stored habits with the same ID, or the same user and name, and drop their history.
+            quiet (bool): Do not print the loaded habits and the number of events.
+
+        Returns:
+            tuple: The number of habits and of events loaded.
+        """
+        generated_habits = generate_habits(habits, users, creation_date=datetime.now() - timedelta(days=days), seed=seed)
+        return self.load_fixtures(generated_habits, generate_habit_events(generated_habits, days, density, seed),
+                                  replace=replace, quiet=quiet)
 
     def close_connection(self):
      
         self.conn.close()
 
 
+@click.command()
+@click.option("--db", "db_name", default="habits.db", show_default=True, help="The database file.")
+@click.option("--habits", type=int, default=None,
+              help="Load this many synthetic habits instead of the demo data.")
+@click.option("--users", default=1, show_default=True, help="Users the synthetic habits are spread over.")
+@click.option("--days", default=365, show_default=True, help="Days of synthetic history up to today.")
+@click.option("--density", default=DEFAULT_DENSITY, show_default=True, help="Completion density of the history.")
+@click.option("--seed", default=0, show_default=True, help="Seed of the synthetic data.")
+@click.option("--replace", is_flag=True,
+              help="Overwrite stored habits with the IDs or names of the loaded ones, history included.")
+@click.option("--quiet", is_flag=True, help="Do not print the loaded habits.")
+def main(db_name, habits, users, days, density, seed, replace, quiet):
+    """
+    Create the habits database and load the demo data or a synthetic dataset.
+    """
+    db = Database(db_name=db_name)
+    try:
+        if habits is None:
+            db.preload_db(quiet=quiet, replace=replace)
+        else:
+            db.load_synthetic(habits, users, days, density, seed, replace=replace, quiet=quiet)
+    except sqlite3.IntegrityError:
+        raise click.ClickException(f"{db_name} already has habits with the IDs or names of the loaded ones; "
+                                   "pass --replace to overwrite them")
+    finally:
+        db.close_connection()
+
+
 if __name__ == "__main__":
-    db = Database()
-    db.preload_db()
-    db.close_connection()
+    main()
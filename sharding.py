@@ -0,0 +1,105 @@
+import os
+import re
+import threading
+import zlib
+from contextlib import contextmanager
+from connection import ConnectionPool, retry_on_busy
+from schema import migrate
+
+
+def user_groups(count):
+    """
+    Build a shard function spreading users over a fixed number of groups.
+
+    Args:
+        count (int): The number of shard files.
+
+    Returns:
+        callable: A function mapping a user to its group name.
+    """
+    def shard_for(user):
+        return f"group{zlib.crc32(user.encode('utf-8')) % count}"
+    return shard_for
+
+
+class ShardRouter:
+    """
+    ShardRouter class to place each user, or user group, in a separate SQLite file.
+
+    Shard files are opened, and migrated, on demand the first time one of
+    their users is accessed, so a heavy user only slows down its own shard.
+    Trackers handed out are scoped to their user.
+    """
+    def __init__(self, directory, shard_for=None, **pool_options):
+        """
+        Initialize the router; no shard is opened yet.
+
+        Args:
+            directory (str): The directory holding the shard files.
+            shard_for (callable): Maps a user to a shard name; one shard per user by default.
+            pool_options: ConnectionPool options used for every shard.
+        """
+        self.directory = directory
+        self.shard_for = shard_for or (lambda user: user)
+        self.pool_options = pool_options
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def shard_path(self, user):
+        """
+        Get the database file of a user's shard.
+        """
+        shard = self.shard_for(user)
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", shard)
+        return os.path.join(self.directory, f"{safe_name}-{zlib.crc32(shard.encode('utf-8')):08x}.db")
+
+    def pool(self, user):
+        """
+        Get the connection pool of a user's shard, opening the shard on first use.
+
+        Returns:
+            ConnectionPool: The pool of the shard.
+        """
+        path = self.shard_path(user)
+        with self._lock:
+            pool = self._pools.get(path)
+            if pool is None:
+                os.makedirs(self.directory, exist_ok=True)
+                pool = ConnectionPool(path, **self.pool_options)
+                with pool.connection() as conn:
+                    migrate(conn)
+                self._pools[path] = pool
+            return pool
+
+    @contextmanager
+    def tracker(self, user):
+        """
+        Context manager yielding a HabitTracker scoped to the user on the user's shard.
+        """
+        with self.pool(user).tracker(user) as habit_tracker:
+            yield habit_tracker
+
+    def run(self, user, func, *args, **kwargs):
+        """
+        Call func(habit_tracker, *args, **kwargs) with a tracker scoped to the user, retrying on SQLITE_BUSY.
+        """
+        def call():
+            with self.tracker(user) as habit_tracker:
+                return func(habit_tracker, *args, **kwargs)
+        return retry_on_busy(call)
+
+    def open_shards(self):
+        """
+        Get the paths of the shards opened so far.
+        """
+        with self._lock:
+            return list(self._pools)
+
+    def close(self):
+        """
+        Close the connections of all opened shards.
+        """
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools = {}
@@ -1,11 +1,19 @@
+import asyncio
 import pytest
 import sqlite3
-from habit import Habit
-from habitevent import HabitEvent
+import threading
+from habit import DEFAULT_USER, Habit
+from habitevent import HabitEvent, period_index
 from habit_tracker import HabitTracker
 from analytics import Analytics
 from datetime import datetime, timedelta
-from setup_db import Database
+from setup_db import Database, generate_habits, generate_habit_events
+from schema import SCHEMA_VERSION, MigrationError, get_schema_version, migrate, remove_duplicate_events
+from connection import ConnectionPool
+from async_tracker import AsyncHabitTracker, AsyncAnalytics
+from event_store import EventStore
+from habit_cache import HabitCache
+from repository import AmbiguousHabitError
 
 @pytest.fixture(scope="module", autouse=True)
 def setup_db():
@@ -23,6 +31,19 @@ def setup_db():
     yield conn, cursor
     conn.close()
 
+@pytest.fixture
+def empty_db():
+    """
+    Fixture providing a fresh, empty database for tests that write data.
+
+    Returns:
+        tuple: A tuple containing the database connection and cursor.
+    """
+    db = Database(db_name=':memory:')
+    conn = db.conn
+    yield conn, conn.cursor()
+    conn.close()
+
 def test_get_all_habits(setup_db):
     """
     Test the get_all_habits method of the Analytics class.
@@ -77,5 +98,851 @@ def test_get_longest_streak_habit(setup_db):
     max_streak = analytics.get_longest_streak_habit(habit)
     assert max_streak == 29
 
+def test_get_longest_streaks_single_query(setup_db):
+    """
+    Test that get_longest_streaks matches get_longest_streak_habit using one query plus one for the archive.
+    """
+    conn, cursor = setup_db
+    tracker = HabitTracker(conn, cursor)
+    analytics = Analytics(tracker)
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        streaks = analytics.get_longest_streaks()
+    finally:
+        conn.set_trace_callback(None)
+    assert len(statements) == 2
+    assert len(streaks) == 5
+    for habit, streak in streaks:
+        assert streak == analytics.get_longest_streak_habit(habit)
+
+def test_period_index():
+    """
+    Test that period_index maps dates to daily and weekly period numbers.
+    """
+    creation_date = datetime(2024, 11, 1)
+    daily = Habit(id=None, name="Daily", task="Task", periodicity="daily", creation_date=creation_date)
+    weekly = Habit(id=None, name="Weekly", task="Task", periodicity="weekly", creation_date=creation_date)
+    assert period_index(daily, datetime(2024, 11, 1)) == 0
+    assert period_index(daily, datetime(2024, 11, 30)) == 29
+    assert period_index(weekly, datetime(2024, 11, 7)) == 0
+    assert period_index(weekly, datetime(2024, 11, 8)) == 1
+    assert period_index(weekly, datetime(2024, 10, 31)) == -1
+    assert period_index(weekly, datetime(2034, 11, 1)) == (datetime(2034, 11, 1) - creation_date).days // 7
+
+def test_longest_streak_counts_consecutive_periods(setup_db):
+    """
+    Test that gaps between periods break a streak and weekly periods are compared by number.
+    """
+    conn, cursor = setup_db
+    tracker = HabitTracker(conn, cursor)
+    analytics = Analytics(tracker)
+    assert analytics.get_longest_streak_habit(analytics.get_habit_by_name("Reading")) == 1
+    assert analytics.get_longest_streak_habit(analytics.get_habit_by_name("Meditation")) == 4
+    assert analytics.get_longest_streak_habit(analytics.get_habit_by_name("Journaling")) == 4
+
+def test_mark_habit_completed_maintains_streak(empty_db):
+    """
+    Test that mark_habit_completed updates the streak columns incrementally.
+    """
+    conn, cursor = empty_db
+    tracker = HabitTracker(conn, cursor)
+    analytics = Analytics(tracker)
+    today = datetime.now()
+    habit = Habit(id=None, name="Running", task="Run", periodicity="daily", creation_date=today - timedelta(days=2))
+    tracker.add_habit(habit)
+    for days_ago in (2, 1):
+        tracker.add_habit_event(HabitEvent(habitID=habit.dbID, eventDate=today - timedelta(days=days_ago)))
+    assert tracker.rebuild_streaks() == 1
+
+    tracker.mark_habit_completed("Running")
+    tracker.mark_habit_completed("Running")
+    habit = analytics.get_habit_by_name("Running")
+    assert (habit.streak, habit.longest_streak, habit.last_period) == (3, 3, 2)
+    assert analytics.get_current_streak(habit) == 3
+    assert analytics.get_longest_streak_habit(habit) == 3
+    assert len(tracker.get_habit_events(habit.id)) == 3
+    longest_streak_habit, max_streak = analytics.get_longest_streak_all()
+    assert (longest_streak_habit.name, max_streak) == ("Running", 3)
+
+def test_streak_counts_completions_of_other_connections(empty_db):
+    """
+    Test that completing a cached habit advances the streak from the stored row, not the cached one.
+    """
+    conn, cursor = empty_db
+    first = HabitTracker(conn, cursor)
+    start = datetime(2024, 11, 1)
+    first.add_habit(Habit(id=None, name="Running", task="Run", periodicity="daily", creation_date=start))
+    habit = first.get_habit("Running")
+    first.record_completions([(habit, HabitEvent(habitID=habit.id, eventDate=start))])
+    second = HabitTracker(conn, conn.cursor())
+    second.record_completions([(second.get_habit("Running"),
+                                HabitEvent(habitID=habit.id, eventDate=start + timedelta(days=1)))])
+    first.record_completions([(habit, HabitEvent(habitID=habit.id, eventDate=start + timedelta(days=2)))])
+    assert (habit.streak, habit.longest_streak, habit.last_period) == (3, 3, 2)
+    first.rebuild_streaks()
+    assert conn.execute("SELECT streak, longest_streak, last_period FROM habits").fetchone() == (3, 3, 2)
+
+def test_migrate_upgrades_legacy_database():
+    """
+    Test that a database created before versioning is upgraded in place once duplicate completions are removed.
+    """
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE habits (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE, task TEXT, "
+                 "periodicity TEXT, creation_date TEXT, completion_date TEXT, streak INTEGER DEFAULT 0, "
+                 "created_by TEXT, demoData BOOLEAN NOT NULL DEFAULT 0)")
+    conn.execute("CREATE TABLE habit_events (id INTEGER PRIMARY KEY AUTOINCREMENT, habitId INTEGER NOT NULL, "
+                 "date DATE NOT NULL, isInPeriod BOOLEAN NOT NULL DEFAULT 0, demoData BOOLEAN NOT NULL DEFAULT 0)")
+    conn.execute("INSERT INTO habits (name, task, periodicity, creation_date) VALUES ('Old', 'Task', 'daily', '2024-01-01')")
+    conn.executemany("INSERT INTO habit_events (habitId, date) VALUES (?, ?)",
+                     [(1, '2024-01-05'), (1, '2024-01-05'), (2, '2024-01-05')])
+    conn.commit()
+    tracker = HabitTracker(conn, conn.cursor())
+    assert not tracker.is_schema_current()
+
+    with pytest.raises(MigrationError, match="1 habit events repeat a completed period"):
+        migrate(conn)
+    version = get_schema_version(conn)
+    assert conn.execute("SELECT COUNT(*) FROM habit_events").fetchone()[0] == 3
+    with conn:
+        assert remove_duplicate_events(conn) == 1
+    assert migrate(conn) == SCHEMA_VERSION - version
+    assert migrate(conn) == 0
+    assert tracker.is_schema_current()
+    assert get_schema_version(conn) == SCHEMA_VERSION
+    habit = Analytics(tracker).get_habit_by_name("Old")
+    assert habit.longest_streak == 0
+    assert habit.created_by == "default_user"
+    assert habit.creation_date == datetime(2024, 1, 1)
+    assert [event.eventDate for event in tracker.get_habit_events(1)] == [datetime(2024, 1, 5)]
+    assert tracker.compact_events() == 1
+    assert tracker.compact_events() == 0
+    assert conn.execute("SELECT COUNT(*) FROM habit_events").fetchone()[0] == 1
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT * FROM habit_events WHERE habitId = ? AND day >= ?", (1, 0)).fetchall()
+    assert "idx_habit_events_habit_day" in str(plan)
+    conn.close()
+
+def test_remove_habit_removes_events(empty_db):
+    """
+    Test that remove_habit deletes the habit together with its events.
+    """
+    conn, cursor = empty_db
+    tracker = HabitTracker(conn, cursor)
+    habit = Habit(id=None, name="Swimming", task="Swim", periodicity="weekly")
+    tracker.add_habit(habit)
+    tracker.mark_habit_completed("Swimming")
+    tracker.remove_habit("Swimming")
+    assert tracker.get_habit_events(habit.dbID) == []
+    assert Analytics(tracker).get_habit_by_name("Swimming") is None
+
+def test_add_habit_events_in_chunks(empty_db):
+    """
+    Test that add_habit_events writes a stream of events in chunked transactions.
+    """
+    conn, cursor = empty_db
+    tracker = HabitTracker(conn, cursor)
+    habit = Habit(id=None, name="Stretching", task="Stretch", periodicity="daily", creation_date=datetime(2023, 1, 1))
+    tracker.add_habit(habit)
+    events = (HabitEvent(habitID=habit.dbID, eventDate=datetime(2023, 1, 1) + timedelta(days=day)) for day in range(365))
+    assert tracker.add_habit_events(events, chunk_size=100) == 365
+    assert tracker.add_habit_events([]) == 0
+    assert len(tracker.get_habit_events(habit.dbID)) == 365
+    tracker.rebuild_streaks()
+    assert Analytics(tracker).get_habit_by_name("Stretching").longest_streak == 365
+
+def test_iter_habits_and_events_stream_in_batches(setup_db):
+    """
+    Test that iter_habits and iter_habit_events yield everything in small batches.
+    """
+    conn, cursor = setup_db
+    tracker = HabitTracker(conn, cursor)
+    analytics = Analytics(tracker)
+    habit_ids = [habit.id for habit in analytics.iter_habits(batch_size=2)]
+    assert habit_ids == [1, 2, 3, 4, 5]
+    events = list(tracker.iter_habit_events(batch_size=7))
+    assert len(events) == 29 + 15 + 4 + 29 + 4
+    assert [event.habitID for event in events] == sorted(event.habitID for event in events)
+    assert len(list(tracker.iter_habit_events(3, batch_size=1))) == 4
+
+def test_connection_pool_concurrent_writers(tmp_path):
+    """
+    Test that pooled workers record completions while reports run without lock errors.
+    """
+    db_name = str(tmp_path / "habits.db")
+    db = Database(db_name=db_name)
+    db.close_connection()
+    pool = ConnectionPool(db_name, size=4, busy_timeout=10000)
+    names = [f"Habit {number}" for number in range(100)]
+    for name in names:
+        pool.run(HabitTracker.add_habit, Habit(id=None, name=name, task="Task", periodicity="daily"))
+    errors = []
+
+    def record(worker_names):
+        try:
+            for name in worker_names:
+                pool.run(HabitTracker.mark_habit_completed, name)
+        except Exception as e:
+            errors.append(e)
+
+    def report():
+        try:
+            for _ in range(10):
+                pool.run(lambda habit_tracker: Analytics(habit_tracker).get_longest_streaks())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=record, args=(names[worker::4],)) for worker in range(4)]
+    threads += [threading.Thread(target=report) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with pool.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("SELECT COUNT(*) FROM habit_events").fetchone()[0] == 100
+    assert len(pool._connections) <= 4
+    pool.close()
+
+def test_async_tracker_concurrent_completions(tmp_path):
+    """
+    Test that many concurrent awaited completions are all recorded, and concurrent retries only once.
+    """
+    db_name = str(tmp_path / "habits.db")
+    Database(db_name=db_name).close_connection()
+
+    async def scenario():
+        async with AsyncHabitTracker(db_name, max_workers=4) as tracker:
+            analytics = AsyncAnalytics(tracker)
+            names = [f"Habit {number}" for number in range(200)]
+            await asyncio.gather(*(tracker.add_habit(Habit(id=None, name=name, task="Task", periodicity="daily"))
+                                   for name in names))
+            await asyncio.gather(*(tracker.mark_habit_completed(name) for name in names + names[:50]))
+            habit = await analytics.get_habit_by_name("Habit 0")
+            events = await tracker.get_habit_events(habit.id)
+            all_habits = await analytics.get_all_habits()
+            longest_streak_habit, max_streak = await analytics.get_longest_streak_all()
+            return len(events), len(all_habits), max_streak
+
+    assert asyncio.run(scenario()) == (1, 200, 1)
+    conn = sqlite3.connect(db_name)
+    assert conn.execute("SELECT COUNT(*) FROM habit_events").fetchone()[0] == 200
+    conn.close()
+
+def test_load_event_store(setup_db):
+    """
+    Test that load_event_store groups day ordinals per habit in columnar buffers.
+    """
+    conn, cursor = setup_db
+    tracker = HabitTracker(conn, cursor)
+    habits, event_store = tracker.load_event_store()
+    assert [habit.id for habit in habits] == [1, 2, 3, 4, 5]
+    assert len(event_store) == 29 + 15 + 4 + 29 + 4
+    assert event_store.event_count(2) == 15
+    assert list(event_store.days_for(3)) == [event.eventDate.toordinal() for event in tracker.get_habit_events(3)]
+    assert list(event_store.days_for(99)) == []
+    assert not hasattr(habits[0], "__dict__")
+    assert not hasattr(HabitEvent(habitID=1, eventDate=datetime.now()), "__dict__")
+
+def test_event_store_registers_habits_without_events():
+    """
+    Test that habits without events get an empty slice.
+    """
+    event_store = EventStore()
+    event_store.add(1, 10)
+    event_store.add(1, 11)
+    event_store.add(2)
+    event_store.add(3, 5)
+    assert list(event_store.habit_ids) == [1, 2, 3]
+    assert list(event_store.offsets) == [0, 2, 2, 3]
+    assert list(event_store.days_for(2)) == []
+    assert list(event_store.days_for(3)) == [5]
+
+def test_dates_are_read_as_day_ordinals(setup_db):
+    """
+    Test that dates are read as integers and converted to datetime only on access.
+    """
+    conn, cursor = setup_db
+    tracker = HabitTracker(conn, cursor)
+    habit = Analytics(tracker).get_habit_by_name("Meditation")
+    event = tracker.get_habit_events(habit.id)[0]
+    assert habit._creation_date is None and event._eventDate is None
+    assert habit.creation_day == datetime(2024, 11, 1).toordinal()
+    assert event.eventDay == datetime(2024, 11, 8).toordinal()
+    assert event.eventDate == datetime(2024, 11, 8)
+    with pytest.raises(ValueError, match="eventDate or an eventDay"):
+        HabitEvent(habitID=1)
+    assert habit.completion_date == datetime(2024, 11, 30)
+
+def test_habit_cache_removes_duplicate_lookups(empty_db):
+    """
+    Test that completing a habit just loaded by name does not query it again, and that writes invalidate.
+    """
+    conn, cursor = empty_db
+    tracker = HabitTracker(conn, cursor)
+    analytics = Analytics(tracker)
+    tracker.add_habit(Habit(id=None, name="Walking", task="Walk", periodicity="daily"))
+    habit = analytics.get_habit_by_name("Walking")
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        assert tracker.mark_habit_completed("Walking") is habit
+    finally:
+        conn.set_trace_callback(None)
+    assert not any(statement.startswith("SELECT") for statement in statements)
+    assert tracker.habit_cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+    assert habit.streak == 1
+
+    habit.task = "Walk fast"
+    tracker.update_habit(habit)
+    updated = analytics.get_habit_by_name("Walking")
+    assert updated is not habit and updated.task == "Walk fast"
+    tracker.remove_habit("Walking")
+    assert analytics.get_habit_by_name("Walking") is None
+
+def test_habit_cache_evicts_least_recently_used():
+    """
+    Test that the cache stays within its size bound using LRU eviction.
+    """
+    cache = HabitCache(max_size=2)
+    habits = [Habit(id=number, name=f"Habit {number}", task="Task", periodicity="daily") for number in range(3)]
+    cache.put(habits[0])
+    cache.put(habits[1])
+    assert cache.get_by_name("Habit 0", DEFAULT_USER) is habits[0]
+    cache.put(habits[2])
+    assert len(cache) == 2
+    assert cache.get_by_id(1) is None
+    assert cache.get_by_id(0) is habits[0]
+    assert cache.get_by_name("Habit 2", DEFAULT_USER) is habits[2]
+
+def test_query_habits_filters_and_pages(setup_db):
+    """
+    Test SQL-side habit filters and keyset pagination.
+    """
+    conn, cursor = setup_db
+    tracker = HabitTracker(conn, cursor)
+    analytics = Analytics(tracker)
+    pages = list(analytics.iter_habit_pages(page_size=2))
+    assert [[habit.id for habit in page] for page in pages] == [[1, 2], [3, 4], [5]]
+    assert [habit.name for habit in analytics.query_habits(periodicity="weekly")] == ["Meditation", "Journaling"]
+    assert [habit.id for habit in analytics.query_habits(periodicity="daily", after_id=2)] == [4]
+    assert len(analytics.query_habits(created_by="Max Mustermann", demo=True)) == 5
+    assert analytics.query_habits(demo=False) == []
+    assert len(analytics.query_habits(active=False)) == 5
+    assert [habit.name for habit in analytics.query_habits(name_prefix="Pa")] == ["Painting"]
+    assert analytics.query_habits(limit=1)[0].name == "Painting"
+
+def test_generate_habit_events_respects_density():
+    """
+    Test that the synthetic data generator spreads habits over users and honours the density.
+    """
+    habits = generate_habits(10, users=3, creation_date=datetime(2023, 1, 1))
+    assert {habit.created_by for habit in habits} == {"user0", "user1", "user2"}
+    daily = [habit for habit in habits if habit.periodicity == "daily"]
+    events = list(generate_habit_events(daily, days=365, density=1.0))
+    assert len(events) == 365 * len(daily)
+    assert list(generate_habit_events(habits, days=365, density=0.0)) == []
+
+def test_benchmark_results_are_machine_readable(tmp_path):
+    """
+    Test that the benchmark suite runs and reports one record per benchmark.
+    """
+    from benchmark import run_benchmarks
+    results = run_benchmarks(["tiny"], repeat=1, label="test", directory=str(tmp_path), workers=2)
+    assert {result["benchmark"] for result in results} >= {"get_all_habits", "get_longest_streak_all", "add_habit_events",
+                                                          "completions_direct", "completions_write_behind"}
+    assert all(result["events"] > 0 and result["median_s"] >= 0 for result in results)
+
+def test_query_tracer_flags_repeated_queries(tmp_path):
+    """
+    Test that the tracer records statements per caller and flags per-habit query loops.
+    """
+    from profiling import QueryTracer, connect
+    db_name = str(tmp_path / "habits.db")
+    db = Database(db_name=db_name)
+    db.preload_db()
+    db.close_connection()
+    tracer = QueryTracer(repeat_threshold=3)
+    conn = connect(db_name, tracer)
+    analytics = Analytics(HabitTracker(conn, conn.cursor()))
+    analytics.get_longest_streaks()
+    assert len(analytics.get_demo_tracking()) == 5
+    conn.close()
+
+    summary = {(total["caller"], total["count"]) for total in tracer.summary()}
+    assert ("HabitRepository.iter_habit_day_rows", 1) in summary
+    assert ("HabitRepository.iter_events", 5) in summary
+    findings = tracer.detect_repeated_queries()
+    assert {finding["caller"] for finding in findings} == {"HabitRepository.iter_events",
+                                                           "HabitRepository.get_archive_rows"}
+    assert all(finding["entry_point"] == "Analytics.get_demo_tracking" for finding in findings)
+    assert all(finding["count"] == 5 for finding in findings)
+    assert "Repeated queries" in tracer.report()
+
+def test_mark_habits_completed_in_one_transaction(empty_db):
+    """
+    Test that several habits are completed with a single commit and unknown names are reported.
+    """
+    conn, cursor = empty_db
+    tracker = HabitTracker(conn, cursor)
+    for name in ("Yoga", "Tea"):
+        tracker.add_habit(Habit(id=None, name=name, task="Task", periodicity="daily"))
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        habits = tracker.mark_habits_completed(["Yoga", "Unknown", "Tea"])
+    finally:
+        conn.set_trace_callback(None)
+    assert [habit.name if habit else None for habit in habits] == ["Yoga", None, "Tea"]
+    assert statements.count("COMMIT") == 1
+    assert conn.execute("SELECT COUNT(*) FROM habit_events").fetchone()[0] == 2
+
+def test_user_scoped_trackers(empty_db):
+    """
+    Test that user-scoped trackers only see their own habits and names are unique per user.
+    """
+    conn, cursor = empty_db
+    alice = HabitTracker(conn, cursor, user="alice")
+    bob = HabitTracker(conn, conn.cursor(), user="bob")
+    alice.add_habit(Habit(id=None, name="Reading", task="Novels", periodicity="daily"))
+    bob.add_habit(Habit(id=None, name="Reading", task="Papers", periodicity="weekly"))
+    with pytest.raises(sqlite3.IntegrityError):
+        alice.add_habit(Habit(id=None, name="Reading", task="Again", periodicity="daily"))
+
+    alice.mark_habit_completed("Reading")
+    assert Analytics(alice).get_habit_by_name("Reading").task == "Novels"
+    assert [habit.task for habit in Analytics(bob).get_all_habits()] == ["Papers"]
+    assert Analytics(bob).query_habits(periodicity="daily") == []
+    assert Analytics(bob).get_longest_streak_all() == (None, 0)
+    assert list(bob.iter_habit_events()) == []
+    assert len(list(alice.iter_habit_events())) == 1
+    bob.remove_habit("Reading")
+    assert [habit.created_by for habit in Analytics(HabitTracker(conn, cursor)).get_all_habits()] == ["alice"]
+
+def test_shared_names_across_users(empty_db):
+    """
+    Test that a name used by several users is ambiguous for trackers of all users and cached per user.
+    """
+    conn, cursor = empty_db
+    habit_cache = HabitCache()
+    alice = HabitTracker(conn, cursor, habit_cache, user="alice")
+    bob = HabitTracker(conn, conn.cursor(), habit_cache, user="bob")
+    everyone = HabitTracker(conn, conn.cursor(), habit_cache)
+    alice.add_habit(Habit(id=None, name="Run", task="5k", periodicity="daily"))
+    assert everyone.get_habit("Run").created_by == "alice"
+    bob.add_habit(Habit(id=None, name="Run", task="10k", periodicity="daily"))
+    assert alice.get_habit("Run").task == "5k"
+    assert bob.get_habit("Run").task == "10k"
+    with pytest.raises(AmbiguousHabitError):
+        everyone.get_habit("Run")
+    with pytest.raises(AmbiguousHabitError):
+        everyone.remove_habit("Run")
+    assert "Run" not in everyone.get_habit_ids()
+    assert conn.execute("SELECT COUNT(*) FROM habits WHERE name = 'Run'").fetchone()[0] == 2
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT id FROM habits WHERE name = ?", ("Run",)).fetchall()
+    assert "idx_habits_name" in plan[0][-1]
+
+def test_shard_router_places_users_in_separate_files(tmp_path):
+    """
+    Test that the shard router opens one database file per user group on demand.
+    """
+    from sharding import ShardRouter, user_groups
+    router = ShardRouter(str(tmp_path / "shards"))
+    assert router.open_shards() == []
+    router.run("alice", HabitTracker.add_habit, Habit(id=None, name="Running", task="Run", periodicity="daily"))
+    router.run("bob", HabitTracker.add_habit, Habit(id=None, name="Running", task="Run", periodicity="daily"))
+    router.run("alice", HabitTracker.mark_habit_completed, "Running")
+    assert len(router.open_shards()) == 2
+    with router.tracker("alice") as tracker:
+        assert Analytics(tracker).get_habit_by_name("Running").created_by == "alice"
+    router.close()
+
+    grouped = ShardRouter(str(tmp_path / "groups"), shard_for=user_groups(2))
+    for user in ("a", "b", "c", "d", "e"):
+        grouped.run(user, HabitTracker.add_habit, Habit(id=None, name="Habit", task="Task", periodicity="daily"))
+    assert len(grouped.open_shards()) <= 2
+    grouped.close()
+
+def test_period_rollups_answer_window_queries(empty_db):
+    """
+    Test that every insert path maintains the period rollups and that they match a rebuild from history.
+    """
+    conn, cursor = empty_db
+    tracker = HabitTracker(conn, cursor)
+    analytics = Analytics(tracker)
+    start = datetime(2024, 1, 1)
+    habit = Habit(id=None, name="Cycling", task="Cycle", periodicity="weekly", creation_date=start)
+    tracker.add_habit(habit)
+    assert tracker.add_habit_events(HabitEvent(habitID=habit.dbID, eventDate=start + timedelta(days=day))
+                                    for day in (0, 1, 2, 14, 15, 28)) == 3
+    assert not tracker.add_habit_event(HabitEvent(habitID=habit.dbID, eventDate=start + timedelta(days=29)))
+    assert tracker.add_habit_event(HabitEvent(habitID=habit.dbID, eventDate=start + timedelta(days=22)))
+    as_of = start + timedelta(days=30)
+    habit = analytics.get_habit_by_name("Cycling")
+
+    assert analytics.get_period_completions(habit, periods=6, as_of=as_of) == [
+        (start, 1), (start + timedelta(weeks=1), 0), (start + timedelta(weeks=2), 1),
+        (start + timedelta(weeks=3), 1), (start + timedelta(weeks=4), 1)]
+    assert analytics.get_completion_rate(habit, periods=5, as_of=as_of) == 0.8
+    assert analytics.get_missed_periods(habit, periods=5, as_of=as_of) == [start + timedelta(weeks=1)]
+    assert analytics.get_completion_rate(habit, as_of=start - timedelta(days=1)) == 0.0
+
+    rollups = conn.execute("SELECT * FROM habit_period_rollups ORDER BY period").fetchall()
+    tracker.rebuild_rollups()
+    assert conn.execute("SELECT * FROM habit_period_rollups ORDER BY period").fetchall() == rollups
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT period, completions FROM habit_period_rollups "
+                        "WHERE habitId = ? AND period BETWEEN ? AND ?", (1, 0, 4)).fetchall()
+    assert "PRIMARY KEY" in str(plan)
+    tracker.remove_habit("Cycling")
+    assert conn.execute("SELECT COUNT(*) FROM habit_period_rollups").fetchone()[0] == 0
+
+def test_parallel_streaks_match_serial(tmp_path):
+    """
+    Test that streaks computed on worker processes per ID range match the serial computation.
+    """
+    from benchmark import build_database
+    from parallel_analytics import ParallelAnalytics, id_ranges
+    assert id_ranges(1, 10, 3) == [(1, 4), (5, 8), (9, 10)]
+    assert id_ranges(5, 5, 4) == [(5, 5)]
+    db, _, _ = build_database(str(tmp_path / "parallel.db"), habits=30, users=3, years=1)
+    tracker = HabitTracker(db.conn, db.conn.cursor())
+    serial = [(habit.id, streak) for habit, streak in Analytics(tracker).get_longest_streaks()]
+
+    parallel_analytics = ParallelAnalytics(tracker, workers=3, serial_threshold=0)
+    assert [(habit.id, streak) for habit, streak in parallel_analytics.get_longest_streaks()] == serial
+    best_habit, best_streak = parallel_analytics.get_longest_streak_all()
+    assert best_streak == max(streak for _, streak in serial)
+    assert best_habit.id == min(habit_id for habit_id, streak in serial if streak == best_streak)
+    assert ParallelAnalytics(HabitTracker(db.conn, db.conn.cursor(), user="no_such_user"), workers=3,
+                             serial_threshold=0).get_longest_streaks() == []
+    db.close_connection()
+
+def test_date_bounded_events_and_streaks(empty_db):
+    """
+    Test that since/until bound event reads and streaks, and that the current streak can be asked as of a date.
+    """
+    conn, cursor = empty_db
+    tracker = HabitTracker(conn, cursor)
+    analytics = Analytics(tracker)
+    start = datetime(2024, 3, 1)
+    tracker.add_habit(Habit(id=None, name="Writing", task="Write", periodicity="daily", creation_date=start))
+    habit = analytics.get_habit_by_name("Writing")
+    tracker.add_habit_events(HabitEvent(habitID=habit.id, eventDate=start + timedelta(days=day))
+                             for day in (0, 1, 2, 3, 5, 6, 6, 7, 10))
+    tracker.rebuild_streaks()
+    habit = analytics.get_habit_by_name("Writing")
+
+    events = tracker.get_habit_events(habit.id, since=start + timedelta(days=2), until=start + timedelta(days=6))
+    assert [event.eventDate.day for event in events] == [3, 4, 6, 7]
+    assert analytics.get_longest_streak_habit(habit) == 4
+    assert analytics.get_longest_streak_habit(habit, since=start + timedelta(days=2)) == 3
+    assert analytics.get_longest_streak_habit(habit, since=start + timedelta(days=5), until=start + timedelta(days=6)) == 2
+    assert analytics.get_longest_streak_habit(habit, tracker.get_habit_events(habit.id), until=start + timedelta(days=1)) == 2
+
+    assert analytics.get_current_streak(habit, as_of=start + timedelta(days=7)) == 3
+    assert analytics.get_current_streak(habit, as_of=start + timedelta(days=8)) == 3
+    assert analytics.get_current_streak(habit, as_of=start + timedelta(days=9)) == 0
+    assert analytics.get_current_streak(habit, as_of=start + timedelta(days=4)) == 4
+    assert analytics.get_current_streak(habit, as_of=start - timedelta(days=1)) == 0
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT day FROM habit_events WHERE habitId = ? AND day <= ? "
+                        "ORDER BY day DESC", (habit.id, 0)).fetchall()
+    assert "idx_habit_events_habit_day" in str(plan) and "TEMP B-TREE" not in str(plan)
+
+def test_write_behind_buffer_group_commits(empty_db):
+    """
+    Test that the write-behind buffer flushes on its size and time thresholds and on close.
+    """
+    from write_behind import WriteBehindBuffer
+    conn, cursor = empty_db
+    tracker = HabitTracker(conn, cursor)
+    names = [f"Habit {number}" for number in range(7)]
+    for name in names:
+        tracker.add_habit(Habit(id=None, name=name, task="Task", periodicity="daily"))
+
+    def count_events():
+        return conn.execute("SELECT COUNT(*) FROM habit_events").fetchone()[0]
+
+    with pytest.raises(ValueError):
+        WriteBehindBuffer(tracker, synchronous="SOMETIMES")
+    with WriteBehindBuffer(tracker, max_events=3, max_delay=60, synchronous="full") as buffer:
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 2
+        assert buffer.mark_habit_completed("Unknown") is None
+        for name in names[:2]:
+            buffer.mark_habit_completed(name)
+        assert (len(buffer), count_events()) == (2, 0)
+        buffer.mark_habit_completed(names[2])
+        assert (len(buffer), count_events(), buffer.flushes) == (0, 3, 1)
+        buffer.mark_habit_completed(names[3])
+        buffer.mark_habit_completed(names[3])
+    assert (count_events(), buffer.flushes) == (4, 2)
+    assert Analytics(tracker).get_habit_by_name(names[3]).streak == 1
+
+    buffer = WriteBehindBuffer(tracker, max_events=100, max_delay=0)
+    buffer.mark_habit_completed(names[4])
+    assert (len(buffer), count_events()) == (0, 5)
+    assert buffer.flush() == 0
+
+    buffer = WriteBehindBuffer(tracker, max_events=100, max_delay=60)
+    buffer.mark_habit_completed(names[5])
+    assert buffer.flush_if_due() == 0
+    buffer.max_delay = 0
+    assert (buffer.flush_if_due(), count_events()) == (1, 6)
+
+def test_bitmap_runs():
+    """
+    Test the bit operations used on archived history.
+    """
+    from bitmap import (bitmap_days, bitmap_streak_stats, bitmap_to_blob, blob_to_bitmap, days_to_bitmap,
+                        longest_run, trailing_run)
+    bits = days_to_bitmap([100, 101, 102, 104, 105, 106, 107, 109], 100)
+    assert bits == 0b1011110111
+    assert blob_to_bitmap(bitmap_to_blob(bits)) == bits
+    assert list(bitmap_days(bits, 100)) == [100, 101, 102, 104, 105, 106, 107, 109]
+    assert list(bitmap_days(bits, 100, reverse=True))[:2] == [109, 107]
+    assert (longest_run(bits), trailing_run(bits), trailing_run(0b0111), longest_run(0)) == (4, 1, 3, 0)
+    assert bitmap_streak_stats(bits, -2) == (4, 1, 7)
+    assert bitmap_streak_stats(0, 0) == (0, 0, None)
+
+def test_archive_events_keeps_history_readable(empty_db):
+    """
+    Test that archived years are folded into bitmaps and still count for events, streaks and summaries.
+    """
+    conn, cursor = empty_db
+    tracker = HabitTracker(conn, cursor)
+    analytics = Analytics(tracker)
+    start = datetime(2022, 12, 20)
+    tracker.add_habit(Habit(id=None, name="Daily", task="Task", periodicity="daily", creation_date=start))
+    tracker.add_habit(Habit(id=None, name="Weekly", task="Task", periodicity="weekly", creation_date=start))
+    daily, weekly = analytics.get_habit_by_name("Daily"), analytics.get_habit_by_name("Weekly")
+    days = list(range(0, 20)) + list(range(30, 40)) + list(range(370, 390)) + list(range(740, 745))
+    tracker.add_habit_events(HabitEvent(habitID=habit.id, eventDate=start + timedelta(days=day))
+                             for habit in (daily, weekly) for day in days)
+    tracker.rebuild_streaks()
+
+    def history():
+        streaks = [(habit.name, streak) for habit, streak in analytics.get_longest_streaks()]
+        events = [(event.habitID, event.eventDay) for event in tracker.iter_habit_events()]
+        bounded = [event.eventDay for event in tracker.get_habit_events(daily.id, since=datetime(2023, 12, 30),
+                                                                        until=datetime(2024, 1, 2))]
+        current = [analytics.get_current_streak(habit, as_of=start + timedelta(days=day))
+                   for habit in (daily, weekly) for day in (19, 25, 389, 744)]
+        summaries = [analytics.get_history_summary(habit, as_of=start + timedelta(days=744)) for habit in (daily, weekly)]
+        return streaks, events, bounded, current, summaries
+
+    before = history()
+    as_of = start + timedelta(days=744)
+    rates = [analytics.get_completion_rate(habit, periods=800, as_of=as_of) for habit in (daily, weekly)]
+    cutoff_day = datetime(2024, 1, 1).toordinal()
+    events = conn.execute("SELECT COUNT(*) FROM habit_events").fetchone()[0]
+    live = conn.execute("SELECT COUNT(*) FROM habit_events WHERE day >= ?", (cutoff_day,)).fetchone()[0]
+    assert tracker.archive_events(datetime(2024, 6, 1)) == events - live
+    assert conn.execute("SELECT COUNT(*) FROM habit_events").fetchone()[0] == live
+    assert conn.execute("SELECT COUNT(*) FROM habit_event_archive").fetchone()[0] == 4
+    assert tracker.archive_events(datetime(2024, 6, 1)) == 0
+    assert history() == before
+    assert tracker.rebuild_streaks() == 2
+    assert [(habit.name, habit.longest_streak) for habit, _ in analytics.get_longest_streaks()] == before[0]
+    rollups = conn.execute("SELECT COUNT(*) FROM habit_period_rollups").fetchone()[0]
+    tracker.rebuild_rollups()
+    assert conn.execute("SELECT COUNT(*) FROM habit_period_rollups").fetchone()[0] == rollups
+    assert [analytics.get_completion_rate(habit, periods=800, as_of=as_of) for habit in (daily, weekly)] == rates
+    assert rates[0] == len(days) / 745
+    assert history() == before
+
+    streaks, _, bounded, current, (daily_summary, weekly_summary) = before
+    assert streaks == [("Daily", 20), ("Weekly", 4)]
+    assert len(bounded) == 4
+    assert current == [20, 0, 20, 5, 3, 3, 4, 2]
+    assert daily_summary == {"completed_periods": len(days), "longest_streak": 20, "current_streak": 5,
+                             "completion_rate": len(days) / 745}
+    assert (weekly_summary["completed_periods"], weekly_summary["longest_streak"]) == (11, 4)
+    assert weekly_summary["completion_rate"] == 11 / 107
+    tracker.remove_habit("Daily")
+    assert conn.execute("SELECT COUNT(*) FROM habit_event_archive").fetchone()[0] == 2
+
+def test_archived_periods_reject_duplicate_completions(empty_db):
+    """
+    Test that completions in archived periods are not inserted again, whichever insert path they take.
+    """
+    from repository import HabitRepository
+    from schema import rebuild_rollups
+    conn, cursor = empty_db
+    tracker = HabitTracker(conn, cursor)
+    start = datetime(2023, 3, 1)
+    tracker.add_habit(Habit(id=None, name="Daily", task="Task", periodicity="daily", creation_date=start))
+    habit = tracker.get_habit("Daily")
+    events = [HabitEvent(habitID=habit.id, eventDate=start + timedelta(days=day)) for day in range(10)]
+    assert tracker.add_habit_events(events) == 10
+    assert tracker.archive_events(datetime(2024, 6, 1)) == 10
+
+    assert tracker.add_habit_events(events) == 0
+    tracker.record_completions([(habit, events[0])])
+    with conn:
+        assert HabitRepository(conn).import_events(
+            [(habit.id, "2023-03-02", events[1].eventDay, 1, False, False)]) == 0
+    assert conn.execute("SELECT COUNT(*) FROM habit_events").fetchone()[0] == 0
+    assert len(tracker.get_habit_events(habit.id)) == 10
+    with conn:
+        rebuild_rollups(conn)
+    assert conn.execute("SELECT COUNT(*), MAX(completions) FROM habit_period_rollups").fetchone() == (10, 1)
+    assert tracker.add_habit_events([HabitEvent(habitID=habit.id, eventDate=start + timedelta(days=10))]) == 1
+
+def test_api_server_and_load_generator(tmp_path):
+    """
+    Test the HTTP/JSON API endpoints on pooled connections and a short load-test run.
+    """
+    import click
+    import http.client
+    import json
+    from loadtest import run_load
+    from server import HabitAPIServer
+    db_name = str(tmp_path / "habits.db")
+    Database(db_name=db_name).close_connection()
+    pool = ConnectionPool(db_name, size=4)
+    api_server = HabitAPIServer(pool, port=0)
+    threading.Thread(target=api_server.serve_forever, daemon=True).start()
+    client = http.client.HTTPConnection("127.0.0.1", api_server.server_port)
+
+    def call(method, path, body=None):
+        client.request(method, path, body=json.dumps(body) if body is not None else b"" if method == "POST" else None)
+        response = client.getresponse()
+        return response.status, json.loads(response.read())
+
+    try:
+        assert call("POST", "/habits", {"name": "Morning run", "task": "Run", "periodicity": "daily"})[0] == 201
+        assert call("POST", "/habits", {"name": "Morning run", "periodicity": "daily"})[0] == 409
+        assert call("POST", "/habits", {"name": "Bad"})[0] == 400
+        status, habit = call("POST", "/habits/Morning%20run/completions")
+        assert (status, habit["current_streak"], habit["longest_streak"]) == (200, 1, 1)
+        assert call("POST", "/habits/Unknown/completions")[0] == 404
+        assert call("GET", "/habits/Morning%20run/events")[1]["dates"] == [datetime.now().strftime("%Y-%m-%d")]
+        assert call("GET", "/habits/Morning%20run/events?since=2000-13-01")[0] == 400
+        assert call("GET", "/habits/Morning%20run/completion-rate?periods=1")[1]["completion_rate"] == 1.0
+        assert call("GET", "/habits?periodicity=daily")[1]["habits"][0]["name"] == "Morning run"
+        assert call("GET", "/reports/streaks")[1] == [{"name": "Morning run", "periodicity": "daily",
+                                                      "current_streak": 1, "longest_streak": 1}]
+        assert call("GET", "/reports/longest-streak")[1] == {"name": "Morning run", "longest_streak": 1}
+        assert call("GET", "/nothing")[0] == 404
+        assert call("GET", "/habits/Morning%20run/completions")[0] == 405
+        assert call("POST", "/habits", [1])[0] == 400
+        hits = call("GET", "/stats")[1]["habit_cache"]["hits"]
+        assert call("POST", "/habits/Morning%20run/completions")[0] == 200
+        call("GET", "/habits/Morning%20run")
+        assert call("GET", "/stats")[1]["habit_cache"]["hits"] > hits
+        outside = sqlite3.connect(db_name)
+        with outside:
+            outside.execute("UPDATE habits SET task = 'Sprint' WHERE name = 'Morning run'")
+        outside.close()
+        assert call("GET", "/habits/Morning%20run")[1]["task"] == "Sprint"
+
+        result = run_load("127.0.0.1", api_server.server_port, "complete", ["Morning run"], requests=40, concurrency=4,
+                          fresh_habits=True)
+        assert (result["requests"], result["errors"]) == (40, 0)
+        assert 0 < result["p50_ms"] <= result["p99_ms"] and result["requests_per_s"] > 0
+        with pytest.raises(click.ClickException):
+            run_load("127.0.0.1", api_server.server_port, "habit", [], requests=1)
+    finally:
+        client.close()
+        api_server.shutdown()
+        api_server.server_close()
+        pool.close()
+    conn = sqlite3.connect(db_name)
+    assert conn.execute("SELECT COUNT(*) FROM habit_events").fetchone()[0] == 41
+    conn.close()
+
+def test_repository_tuple_modes_match_objects(setup_db):
+    """
+    Test that the lightweight tuple results carry the same fields as the Habit and HabitEvent objects.
+    """
+    from repository import EventRow, HabitRow
+    conn, cursor = setup_db
+    tracker = HabitTracker(conn, cursor)
+    analytics = Analytics(tracker)
+    habits = list(analytics.iter_habits())
+    habit_rows = list(analytics.iter_habits(as_tuples=True))
+    assert all(isinstance(row, HabitRow) for row in habit_rows)
+    assert [(row.id, row.name, row.creation_day, row.longest_streak) for row in habit_rows] == \
+           [(habit.id, habit.name, habit.creation_day, habit.longest_streak) for habit in habits]
+    assert [row.id for row in analytics.query_habits(periodicity="weekly", as_tuples=True)] == \
+           [habit.id for habit in analytics.get_habits_by_periodicity("weekly")]
+    assert [analytics.get_current_streak(row) for row in habit_rows] == \
+           [analytics.get_current_streak(habit) for habit in habits]
+
+    habit = habits[0]
+    event_rows = list(tracker.iter_habit_events(habit.id, as_tuples=True))
+    assert all(isinstance(row, EventRow) for row in event_rows)
+    assert [(row.habitID, row.eventDay) for row in event_rows] == \
+           [(event.habitID, event.eventDay) for event in tracker.get_habit_events(habit.id)]
+    assert analytics.get_longest_streak_habit(habit, since=datetime(2000, 1, 1)) == \
+           analytics.get_longest_streak_habit(habit, tracker.get_habit_events(habit.id))
+
+def test_fixture_loader_bulk_loads_and_replaces(tmp_path, capsys):
+    """
+    Test that fixtures load from generators in one pass, replace stale data on request and back the setup_db CLI.
+    """
+    from click.testing import CliRunner
+    from setup_db import main as setup_main
+    db = Database(db_name=':memory:')
+    habits = generate_habits(4, users=2, creation_date=datetime.now() - timedelta(days=30))
+    expected_events = sum(30 if habit.periodicity == "daily" else 5 for habit in habits)
+    assert db.load_fixtures(habits, (event for event in generate_habit_events(habits, days=30, density=1.0))) == \
+           (4, expected_events)
+    assert capsys.readouterr().out == ""
+    tracker = HabitTracker(db.conn, db.conn.cursor())
+    daily = next(habit for habit in habits if habit.periodicity == "daily")
+    assert tracker.get_habit(daily.name).longest_streak == 30
+
+    with pytest.raises(ValueError):
+        db.load_fixtures([], [HabitEvent(habitID=99, eventDate=datetime.now())])
+
+    with pytest.raises(sqlite3.IntegrityError):
+        db.preload_db(quiet=True)
+    assert db.conn.execute("SELECT COUNT(*) FROM habits").fetchone() == (4,)
+    db.preload_db(quiet=True, replace=True)
+    db.conn.execute("UPDATE habits SET task = 'Stale' WHERE name = 'Painting'")
+    db.conn.execute("INSERT INTO habit_events (habitID, date, day, period) VALUES (1, '2024-12-24', 739244, 53)")
+    db.conn.commit()
+    db.preload_db(replace=True)
+    assert "Inserted 81 events for 5 habits" in capsys.readouterr().out
+    assert db.conn.execute("SELECT task FROM habits WHERE name = 'Painting'").fetchone() == ("Create",)
+    assert db.conn.execute("SELECT COUNT(*) FROM habit_events WHERE habitId = 1").fetchone() == (29,)
+    db.close_connection()
+
+    db_name = str(tmp_path / "seed.db")
+    result = CliRunner().invoke(setup_main, ["--db", db_name, "--habits", "50", "--users", "5", "--days", "20",
+                                             "--quiet"])
+    assert result.exit_code == 0 and result.output == ""
+    result = CliRunner().invoke(setup_main, ["--db", db_name, "--quiet"])
+    assert result.exit_code == 1 and "pass --replace" in result.output
+    result = CliRunner().invoke(setup_main, ["--db", db_name, "--habits", "50", "--users", "5", "--days", "20",
+                                             "--replace", "--quiet"])
+    assert result.exit_code == 0
+    conn = sqlite3.connect(db_name)
+    assert conn.execute("SELECT COUNT(*), COUNT(DISTINCT created_by) FROM habits").fetchone() == (50, 5)
+    assert conn.execute("SELECT COUNT(*) FROM habit_period_rollups").fetchone() == \
+           conn.execute("SELECT COUNT(*) FROM habit_events").fetchone()
+    conn.close()
+
+def test_import_skips_invalid_records(tmp_path):
+    """
+    Test that the import command counts malformed records instead of failing midway.
+    """
+    from click.testing import CliRunner
+    from main import cli
+    db_name = str(tmp_path / "habits.db")
+    db = Database(db_name=db_name)
+    db.preload_db(quiet=True)
+    db.close_connection()
+    completions = tmp_path / "completions.jsonl"
+    completions.write_text('{"habit": "Reading", "date": "2024-12-02"}\n'
+                           '{"habit": "Reading", "date": "2024-13-40"}\n'
+                           '{"habit": "Reading"}\n'
+                           'not json\n'
+                           '{"habit": "Unknown", "date": "2024-12-03"}\n')
+    result = CliRunner().invoke(cli, ["--db", db_name, "import", str(completions)])
+    assert result.exit_code == 0
+    assert "Imported 1 completions, skipped 1 for unknown or ambiguous habits and 3 invalid records." in result.output
+
 if __name__ == "__main__":
     pytest.main()
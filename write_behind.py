@@ -0,0 +1,116 @@
+import threading
+import time
+from datetime import datetime
+from connection import SYNCHRONOUS_LEVELS
+from habitevent import HabitEvent
+
+# Define the default flush thresholds of the write-behind buffer
+DEFAULT_MAX_EVENTS = 500
+DEFAULT_MAX_DELAY = 1.0  # seconds
+
+
+class WriteBehindBuffer:
+    """
+    WriteBehindBuffer class to queue completions in memory and write them in group commits.
+
+    Completions are flushed in one transaction when max_events are queued,
+    when the oldest queued completion is max_delay seconds old, on flush
+    and on close. The buffer has no timer thread, because the tracker's
+    connection belongs to the caller's thread: max_delay is only checked
+    on enqueue and by flush_if_due, so an idle buffer keeps its
+    completions until one of them is called. Callers that may go idle
+    should call flush_if_due periodically, e.g. from their event loop.
+    Queued completions are lost if the process dies before they are
+    flushed; choose the thresholds and the synchronous level for the
+    durability the caller needs.
+    """
+    def __init__(self, habit_tracker, max_events=DEFAULT_MAX_EVENTS, max_delay=DEFAULT_MAX_DELAY, synchronous=None):
+        """
+        Initialize an empty buffer in front of a HabitTracker.
+
+        Args:
+            habit_tracker (HabitTracker): The tracker the completions are written with.
+            max_events (int): Flush once this many completions are queued.
+            max_delay (float): Flush once the oldest queued completion is this many seconds old, checked on enqueue
+              and by flush_if_due.
+            synchronous (str): The PRAGMA synchronous level of the tracker's connection; left unchanged if None.
+        """
+        if synchronous is not None:
+            synchronous = synchronous.upper()
+            if synchronous not in SYNCHRONOUS_LEVELS:
+                raise ValueError(f"Invalid synchronous level: {synchronous}")
+            habit_tracker.conn.execute(f"PRAGMA synchronous = {synchronous}")
+        self.habit_tracker = habit_tracker
+        self.max_events = max_events
+        self.max_delay = max_delay
+        self.flushes = 0
+        self._pending = []
+        self._first_queued = None
+        self._lock = threading.Lock()
+
+    def mark_habit_completed(self, habit_name):
+        """
+        Queue a completion of a habit, dated now, and flush if a threshold is reached.
+
+        Returns:
+            Habit: The Habit object, or None if no habit has the name; nothing is queued then.
+        """
+        habit = self.habit_tracker.get_habit(habit_name)
+        if habit is None:
+            return None
+        with self._lock:
+            if not self._pending:
+                self._first_queued = time.monotonic()
+            self._pending.append((habit, HabitEvent(habitID=habit.id, eventDate=datetime.now())))
+            if len(self._pending) >= self.max_events or self._is_due():
+                self._flush()
+        return habit
+
+    def flush_if_due(self):
+        """
+        Write the queued completions if the oldest one is max_delay seconds old.
+
+        Returns:
+            int: The number of completions written.
+        """
+        with self._lock:
+            return self._flush() if self._pending and self._is_due() else 0
+
+    def _is_due(self):
+        return time.monotonic() - self._first_queued >= self.max_delay
+
+    def flush(self):
+        """
+        Write all queued completions in one transaction.
+
+        Returns:
+            int: The number of completions written.
+        """
+        with self._lock:
+            return self._flush()
+
+    def _flush(self):
+        pending, self._pending = self._pending, []
+        if pending:
+            try:
+                self.habit_tracker.record_completions(pending)
+            except Exception:
+                self._pending = pending + self._pending
+                raise
+            self.flushes += 1
+        return len(pending)
+
+    def close(self):
+        """
+        Flush the queued completions before shutdown.
+        """
+        self.flush()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()